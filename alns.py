@@ -0,0 +1,463 @@
+"""
+ALNS File
+
+Adaptive large neighbourhood search for large instances. Works on dense
+NumPy distance and time matrices built from data['arcs'] and evaluates
+insertions and removals for all positions of a route at once.
+"""
+
+import math
+import time
+
+import numpy as np
+
+from graph_index import dense_matrices
+from heuristics import construct_routes
+from routes import evaluate_routes
+
+
+class ALNS():
+    """
+    Adaptive large neighbourhood search on the data dictionary built by
+    model_setup. Every iteration removes customers with one of the destroy
+    operators (random, worst, related), re-inserts them with one of the
+    repair operators (greedy, regret-2) and accepts the result by simulated
+    annealing. New best solutions are improved with 2-opt, relocate and swap
+    local search. Operator weights adapt every segment iterations to how
+    often an operator led to a new best, improving or accepted solution.
+    """
+    DESTROY = ('random', 'worst', 'related')
+    REPAIR = ('greedy', 'regret')
+    SCORES = (33, 9, 13)     # new best, better than current, accepted
+
+    def __init__(self, data, time_limit=10, seed=0, max_remove_fraction=0.3,
+                 segment=100, reaction=0.1, start_temperature=0.05, neighbours=10):
+        self.data = data
+        self.time_limit = time_limit
+        self.rng = np.random.default_rng(seed)
+        self.segment = segment
+        self.reaction = reaction
+        self.start_temperature = start_temperature
+
+        self.order, self.D, self.T = dense_matrices(data)
+        vertices = data['vertices']
+        self.N = np.array([vertices[v]['N_i'] if v != 0 else 0 for v in self.order], dtype=float)
+        self.S = np.array([vertices[v]['S_i'] if v != 0 else 0 for v in self.order], dtype=float)
+        self.Q = data['other']['Q']
+        self.T_bar = data['other']['T_bar']
+        self.D_bar = data['other']['D_bar']
+
+        self.n = len(self.order) - 1
+        self.max_remove = max(1, int(max_remove_fraction * self.n))
+        # Nearest customers of every customer, used by the related removal and swap
+        symmetric = np.where(np.isfinite(self.D + self.D.T), self.D + self.D.T, np.inf)[1:, 1:]
+        self.nearest = np.argsort(symmetric, axis=1)[:, 1:neighbours + 1] + 1
+
+        # Cost of a route serving only customer c, inf if not feasible
+        c = np.arange(1, self.n + 1)
+        single_time = self.T[0, c] + self.S[c] + self.T[c, 0]
+        single_dist = self.D[0, c] + self.D[c, 0]
+        feasible = (self.N[c] <= self.Q) & (single_time <= self.T_bar) & (single_dist <= self.D_bar)
+        self.single = np.full(self.n + 1, np.inf)
+        self.single[c] = np.where(feasible, single_dist, np.inf)
+
+
+    # --- Route evaluation ---
+
+    def stats(self, route):
+        """
+        Returns (load, time, distance) of a route given as customer positions.
+        """
+        path = np.array([0] + route + [0])
+        return (self.N[route].sum(),
+                self.T[path[:-1], path[1:]].sum() + self.S[route].sum(),
+                self.D[path[:-1], path[1:]].sum())
+
+
+    def feasible(self, route):
+        load, time_, dist = self.stats(route)
+        return load <= self.Q and time_ <= self.T_bar and dist <= self.D_bar
+
+
+    def cost(self, routes):
+        return sum(self.stats(route)[2] for route in routes)
+
+
+    def insertion_costs(self, route, customers):
+        """
+        Returns (cost, position) arrays with the cheapest feasible insertion
+        of every customer into the route, evaluated for all positions at once.
+        """
+        load, time_, dist = self.stats(route)
+        prev = np.array([0] + route)
+        nxt = np.array(route + [0])
+        U = np.asarray(customers)
+        column = U[:, None]
+
+        dD = self.D[column, nxt] + self.D[prev, column] - self.D[prev, nxt]
+        dT = self.T[column, nxt] + self.T[prev, column] - self.T[prev, nxt] + self.S[column]
+        ok = ((load + self.N[U] <= self.Q)[:, None]
+              & (time_ + dT <= self.T_bar) & (dist + dD <= self.D_bar))
+        dD = np.where(ok, dD, np.inf)
+
+        position = np.argmin(dD, axis=1)
+        return dD[np.arange(len(U)), position], position
+
+
+    def removal_savings(self, route):
+        """
+        Returns the distance saved by removing each customer of the route
+        (-inf where the remaining route would use a missing arc).
+        """
+        return self.removal_savings_at(np.array(route), np.array([0] + route[:-1]),
+                                       np.array(route[1:] + [0]))
+
+
+    def removal_savings_at(self, customers, prev, nxt, M=None):
+        """
+        Returns the distance (or, with M=self.T, the travel time) saved by
+        removing the customers between their predecessors prev and successors
+        nxt (-inf where that would use a missing arc). Removing the only
+        customer of a route removes the whole route.
+        """
+        M = self.D if M is None else M
+        shortcut = np.where((prev == 0) & (nxt == 0), 0, M[prev, nxt])
+        savings = M[prev, customers] + M[customers, nxt] - shortcut
+        return np.where(np.isfinite(savings), savings, -np.inf)
+
+
+    # --- Destroy operators ---
+
+    def destroy(self, operator, routes, q):
+        """
+        Removes q customers with the operator. Returns (routes, removed).
+        """
+        assigned = [c for route in routes for c in route]
+        if operator == 'random':
+            removed = set(self.rng.choice(assigned, size=min(q, len(assigned)), replace=False).tolist())
+        elif operator == 'worst':
+            savings = np.concatenate([self.removal_savings(route) for route in routes])
+            # Randomised ranking, so the worst customers are likely but not certain
+            noise = self.rng.uniform(0.8, 1.2, size=len(savings))
+            ranked = np.argsort(-savings * noise)
+            removed = {assigned[p] for p in ranked[:q]}
+        else:
+            seed = assigned[self.rng.integers(len(assigned))]
+            related = [seed] + [c for c in self.nearest[seed - 1].tolist() if c != seed]
+            removed = set(related[:q])
+
+        routes = [[c for c in route if c not in removed] for route in routes]
+        removed = list(removed)
+
+        # Customers whose neighbours left without a direct arc are removed too
+        for route in routes:
+            p = 0
+            while p < len(route):
+                prev = route[p - 1] if p > 0 else 0
+                if not np.isfinite(self.D[prev, route[p]]):
+                    removed.append(route.pop(p))
+                else:
+                    p += 1
+            if route and not np.isfinite(self.D[route[-1], 0]):
+                removed.append(route.pop())
+
+        return [route for route in routes if route], removed
+
+
+    # --- Repair operators ---
+
+    def repair(self, operator, routes, removed):
+        """
+        Re-inserts the removed customers with greedy or regret-2 insertion,
+        opening new routes where that is cheaper or the only option. Returns
+        the routes, or None if some customer cannot be inserted.
+        """
+        unassigned = list(removed)
+        self.rng.shuffle(unassigned)
+        U = np.array(unassigned, dtype=int)
+        open_ = np.ones(len(U), dtype=bool)
+
+        # One row of insertion costs per route, the last row opens a new route
+        rows = [self.insertion_costs(route, U) for route in routes]
+        cost = np.vstack([c for c, _ in rows] + [self.single[U]])
+        position = np.vstack([p for _, p in rows] + [np.zeros(len(U), dtype=int)])
+
+        while open_.any():
+            best = cost.min(axis=0)
+            if not np.all(np.isfinite(best[open_])):
+                return None
+
+            if operator == 'regret' and cost.shape[0] > 1:
+                second = np.partition(cost, 1, axis=0)[1]
+                regret = np.where(np.isfinite(second), second - best, np.inf)
+                pick = int(np.argmax(np.where(open_, regret, -np.inf)))
+            else:
+                pick = int(np.argmin(np.where(open_, best, np.inf)))
+
+            c = int(U[pick])
+            r = int(np.argmin(cost[:, pick]))
+            open_[pick] = False
+            if r == len(routes):
+                routes.append([c])
+                cost = np.insert(cost, r, np.inf, axis=0)
+                position = np.insert(position, r, 0, axis=0)
+            else:
+                routes[r].insert(int(position[r, pick]), c)
+
+            # Only the changed route needs new insertion costs
+            cost[r], position[r] = self.insertion_costs(routes[r], U)
+
+        return routes
+
+
+    # --- Local search ---
+
+    def route_arrays(self, routes):
+        """
+        Returns the route, predecessor and successor (0 for the depot) of
+        every customer position, and the (load, time, distance) of every route.
+        """
+        route_of = np.full(self.n + 1, -1)
+        prev = np.zeros(self.n + 1, dtype=int)
+        nxt = np.zeros(self.n + 1, dtype=int)
+        for r, route in enumerate(routes):
+            path = np.array([0] + route + [0])
+            route_of[path[1:-1]] = r
+            prev[path[1:-1]] = path[:-2]
+            nxt[path[1:-1]] = path[2:]
+        totals = np.array([self.stats(route) for route in routes], dtype=float).reshape(-1, 3)
+        return route_of, prev, nxt, totals
+
+
+    def two_opt(self, route, deadline=math.inf):
+        """
+        Best-improvement 2-opt within a route (segment reversal). The change
+        of distance and time of every reversal is computed at once from
+        prefix sums of the arcs driven forwards and backwards, so asymmetric
+        matrices are handled.
+        """
+        i = np.arange(1, len(route) + 1)[:, None]
+        j = np.arange(1, len(route) + 1)[None, :]
+        while len(route) > 2 and time.perf_counter() < deadline:
+            path = np.array([0] + route + [0])
+            _, time_, dist = self.stats(route)
+
+            deltas = []
+            for M in (self.D, self.T):
+                forward = M[path[:-1], path[1:]]
+                backward = M[path[1:], path[:-1]]
+                missing = ~np.isfinite(backward)
+                F = np.concatenate([[0], np.cumsum(forward)])
+                B = np.concatenate([[0], np.cumsum(np.where(missing, 0, backward))])
+                B_missing = np.concatenate([[0], np.cumsum(missing)])
+                # Reversing path[i..j] replaces the arcs into i and out of j and
+                # drives the arcs in between backwards
+                delta = (M[path[i - 1], path[j]] + M[path[i], path[j + 1]]
+                         - forward[i - 1] - forward[j] + (B[j] - B[i]) - (F[j] - F[i]))
+                deltas.append(np.where(B_missing[j] > B_missing[i], np.inf, delta))
+            dD, dT = deltas
+
+            ok = (j > i) & (dist + dD <= self.D_bar) & (time_ + dT <= self.T_bar)
+            gain = np.where(ok, -dD, -np.inf)
+            a, b = np.unravel_index(np.argmax(gain), gain.shape)
+            if gain[a, b] <= 1e-9:
+                break
+            route[a:b + 1] = route[a:b + 1][::-1]
+        return route
+
+
+    def relocate(self, routes, deadline=math.inf):
+        """
+        Moves single customers to their cheapest feasible position in another
+        route while that lowers the distance, best move first. The insertion
+        costs of all customers into every route are kept and only those of
+        the two changed routes are recomputed after a move.
+        """
+        customers = list(range(1, self.n + 1))
+        costs = [self.insertion_costs(route, customers) for route in routes]
+        c = np.arange(1, self.n + 1)
+
+        while routes and time.perf_counter() < deadline:
+            route_of, prev, nxt, totals = self.route_arrays(routes)
+            a = route_of[c]
+            saving = self.removal_savings_at(c, prev[c], nxt[c])
+            # Removing a customer must keep its route feasible (times need not
+            # satisfy the triangle inequality)
+            saved_time = self.removal_savings_at(c, prev[c], nxt[c], self.T) + self.S[c]
+            removable = ((totals[a, 1] - saved_time <= self.T_bar)
+                         & (totals[a, 2] - saving <= self.D_bar) & np.isfinite(saving))
+
+            insertion = np.vstack([cost for cost, _ in costs])
+            insertion[a, c - 1] = np.inf      # Moves within the route are left to 2-opt
+            b = np.argmin(insertion, axis=0)
+            gain = np.where(removable, saving - insertion[b, c - 1], -np.inf)
+            pick = int(np.argmax(gain))
+            if gain[pick] <= 1e-9:
+                break
+
+            customer, source, target = pick + 1, int(a[pick]), int(b[pick])
+            routes[source].remove(customer)
+            routes[target].insert(int(costs[target][1][pick]), customer)
+            costs[target] = self.insertion_costs(routes[target], customers)
+            if routes[source]:
+                costs[source] = self.insertion_costs(routes[source], customers)
+            else:
+                del routes[source], costs[source]
+        return routes
+
+
+    def swap(self, routes, deadline=math.inf):
+        """
+        Exchanges pairs of nearby customers between routes while that lowers
+        the distance and keeps both routes feasible, best exchange first. The
+        changes of all pairs are computed at once from the predecessor and
+        successor of every customer and the route totals.
+        """
+        C = np.arange(1, self.n + 1)[:, None]
+        d = self.nearest
+        while time.perf_counter() < deadline:
+            route_of, prev, nxt, totals = self.route_arrays(routes)
+            a, b = route_of[C], route_of[d]
+
+            # c takes the place of d in route b and d that of c in route a
+            changes = []
+            for M in (self.D, self.T):
+                into_a = M[prev[C], d] + M[d, nxt[C]] - M[prev[C], C] - M[C, nxt[C]]
+                into_b = M[prev[d], C] + M[C, nxt[d]] - M[prev[d], d] - M[d, nxt[d]]
+                changes.append((into_a, into_b))
+            (dD_a, dD_b), (dT_a, dT_b) = changes
+            dN = self.N[d] - self.N[C]
+            dS = self.S[d] - self.S[C]
+
+            ok = ((a != b) & (totals[a, 0] + dN <= self.Q) & (totals[b, 0] - dN <= self.Q)
+                  & (totals[a, 1] + dT_a + dS <= self.T_bar) & (totals[b, 1] + dT_b - dS <= self.T_bar)
+                  & (totals[a, 2] + dD_a <= self.D_bar) & (totals[b, 2] + dD_b <= self.D_bar))
+            gain = np.where(ok, -(dD_a + dD_b), -np.inf)
+            p, q = np.unravel_index(np.argmax(gain), gain.shape)
+            if gain[p, q] <= 1e-9:
+                break
+
+            c, other = p + 1, int(d[p, q])
+            ra, rb = int(a[p, 0]), int(b[p, q])
+            routes[ra][routes[ra].index(c)] = other
+            routes[rb][routes[rb].index(other)] = c
+        return routes
+
+
+    def local_search(self, routes, deadline=math.inf):
+        """
+        Relocate, swap and 2-opt until none improves or the deadline (a
+        time.perf_counter() value) has passed.
+        """
+        routes = [list(route) for route in routes]
+        self.relocate(routes, deadline)
+        self.swap(routes, deadline)
+        for route in routes:
+            self.two_opt(route, deadline)
+        return routes
+
+
+    # --- Search ---
+
+    def initial_solution(self):
+        """
+        Starts from the savings/insertion heuristic, or greedy insertion into
+        empty routes if that fails.
+        """
+        position = {v: p for p, v in enumerate(self.order)}
+        routes = construct_routes(self.data)
+        if routes is not None:
+            return [[position[v] for v in route[1:-1]] for route in routes.values()]
+        return self.repair('greedy', [], list(range(1, self.n + 1)))
+
+
+    def solve(self):
+        """
+        Runs the search until the time limit. Returns (obj, k, VMT, VTT,
+        routes) like analyze_results, or None if no feasible solution was found.
+        """
+        start = time.perf_counter()
+        current = self.initial_solution()
+        if current is None:
+            return None
+        deadline = start + self.time_limit
+        current = self.local_search(current, deadline)
+        current_cost = best_cost = self.cost(current)
+        best = [list(route) for route in current]
+
+        weights = {'destroy': np.ones(len(self.DESTROY)), 'repair': np.ones(len(self.REPAIR))}
+        scores = {key: np.zeros(len(w)) for key, w in weights.items()}
+        uses = {key: np.zeros(len(w)) for key, w in weights.items()}
+        temperature0 = self.start_temperature * best_cost
+
+        iteration = 0
+        while time.perf_counter() < deadline:
+            iteration += 1
+            d = self.rng.choice(len(self.DESTROY), p=weights['destroy'] / weights['destroy'].sum())
+            r = self.rng.choice(len(self.REPAIR), p=weights['repair'] / weights['repair'].sum())
+            q = int(self.rng.integers(1, self.max_remove + 1))
+
+            partial, removed = self.destroy(self.DESTROY[d], [list(route) for route in current], q)
+            candidate = self.repair(self.REPAIR[r], partial, removed)
+
+            score = 0
+            if candidate is not None:
+                candidate_cost = self.cost(candidate)
+                if candidate_cost < best_cost - 1e-9:
+                    candidate = self.local_search(candidate, deadline)
+                    candidate_cost = self.cost(candidate)
+
+                # Simulated annealing with a temperature that falls to zero at the time limit
+                elapsed = (time.perf_counter() - start) / self.time_limit
+                temperature = max(temperature0 * (1 - elapsed), 1e-9)
+                if candidate_cost < best_cost - 1e-9:
+                    best, best_cost = [list(route) for route in candidate], candidate_cost
+                    score = self.SCORES[0]
+                elif candidate_cost < current_cost - 1e-9:
+                    score = self.SCORES[1]
+                elif self.rng.random() < math.exp((current_cost - candidate_cost) / temperature):
+                    score = self.SCORES[2]
+                if score:
+                    current, current_cost = candidate, candidate_cost
+
+            for key, op in (('destroy', d), ('repair', r)):
+                scores[key][op] += score
+                uses[key][op] += 1
+
+            if iteration % self.segment == 0:
+                for key in weights:
+                    used = uses[key] > 0
+                    weights[key][used] = ((1 - self.reaction) * weights[key][used]
+                                          + self.reaction * scores[key][used] / uses[key][used])
+                    weights[key] = np.maximum(weights[key], 1e-3)
+                    scores[key][:] = 0
+                    uses[key][:] = 0
+
+        self.iterations = iteration
+        routes = {
+            route_id: [0] + [self.order[p] for p in route] + [0]
+            for route_id, route in enumerate(best, start=1)
+        }
+        return evaluate_routes(self.data, routes)
+
+
+def solve_alns(data, time_limit=10, seed=0, **kwargs):
+    """
+    Runs the ALNS engine on a data dictionary and returns (obj, k, VMT, VTT,
+    routes), or None if no feasible solution was found.
+    """
+    return ALNS(data, time_limit, seed, **kwargs).solve()
+
+
+if __name__ == "__main__":
+    from instance_cache import load_instance
+
+    result = solve_alns(load_instance('datasheet.xlsx'), time_limit=30)
+    if result is not None:
+        obj, k, VMT, VTT, routes = result
+        print(f"####   The model finished with objective value: {obj}")
+        print(f"####   The amount of vehicles used: {k}")
+        print(f"####   VMT: {VMT}")
+        print(f"####   VTT: {VTT}")
+        for key, value in routes.items():
+            print(f"####   Route {key}: {value}")
@@ -0,0 +1,68 @@
+"""
+Build Time Benchmark
+
+Compares the time needed to build the model with the loop builder and with
+the matrix builder. Run from the repository root:
+
+    python -m benchmarks.build_time datasheet.xlsx --repeats 3
+"""
+
+import argparse
+import time
+
+from main import MILPModel
+
+
+def time_build(file_path, build_mode):
+    """
+    Builds the model once and returns (setup seconds, constraint seconds, model).
+    """
+    model = MILPModel(build_mode=build_mode)
+    model.model.Params.OutputFlag = 0
+
+    start = time.perf_counter()
+    model.model_setup(file_path)
+    setup_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model.setup_contraints()
+    model.model.update()
+    constraint_time = time.perf_counter() - start
+
+    return setup_time, constraint_time, model
+
+
+def run_benchmark(file_path, repeats=3):
+    """
+    Times both build modes and prints the best of `repeats` runs.
+    """
+    results = {}
+    for build_mode in ("loop", "matrix"):
+        best = None
+        for _ in range(repeats):
+            setup_time, constraint_time, model = time_build(file_path, build_mode)
+            if best is None or setup_time + constraint_time < sum(best[:2]):
+                best = (setup_time, constraint_time, model.model.NumVars,
+                        model.model.NumConstrs, model.model.NumNZs)
+            model.model.dispose()
+        results[build_mode] = best
+
+    print(f"{'mode':<8}{'setup (s)':>12}{'constrs (s)':>14}{'total (s)':>12}"
+          f"{'vars':>8}{'constrs':>10}{'nonzeros':>10}")
+    for build_mode, (setup_time, constraint_time, n_vars, n_constrs, n_nz) in results.items():
+        print(f"{build_mode:<8}{setup_time:>12.3f}{constraint_time:>14.3f}"
+              f"{setup_time + constraint_time:>12.3f}{n_vars:>8}{n_constrs:>10}{n_nz:>10}")
+
+    loop_total = sum(results['loop'][:2])
+    matrix_total = sum(results['matrix'][:2])
+    print(f"Speedup of the matrix builder: {loop_total / matrix_total:.2f}x")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("file_path", nargs="?", default="datasheet.xlsx")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    run_benchmark(args.file_path, args.repeats)
@@ -0,0 +1,77 @@
+"""
+Formulation Benchmark
+
+Compares the root gap and the solve time of the default formulation with the
+strengthened formulation. The root gap is measured between the LP relaxation
+and the optimal objective. Run from the repository root:
+
+    python -m benchmarks.formulations datasheet.xlsx --time-limit 600
+"""
+
+import argparse
+import time
+
+from gurobipy import GRB
+
+from main import MILPModel
+
+
+def run_formulation(file_path, strengthen, time_limit):
+    """
+    Builds and solves one formulation. Returns a dict with the LP bound, the
+    objective, the best bound, the solve time and the node count.
+    """
+    model = MILPModel(params={'OutputFlag': 0, 'TimeLimit': time_limit}, strengthen=strengthen)
+    model.model_setup(file_path)
+    model.setup_contraints()
+    model.model.update()
+
+    relaxation = model.model.relax()
+    relaxation.optimize()
+    lp_bound = relaxation.ObjVal if relaxation.Status == GRB.OPTIMAL else float('nan')
+    relaxation.dispose()
+
+    start = time.perf_counter()
+    model.model.optimize()
+    solve_time = time.perf_counter() - start
+
+    has_solution = model.model.SolCount > 0
+    result = {
+        'vars': model.model.NumVars,
+        'constrs': model.model.NumConstrs,
+        'lp_bound': lp_bound,
+        'obj': model.model.ObjVal if has_solution else float('nan'),
+        'bound': model.model.ObjBound,
+        'time': solve_time,
+        'nodes': model.model.NodeCount,
+    }
+    model.model.dispose()
+    return result
+
+
+def run_benchmark(file_path, time_limit=600):
+    """
+    Solves both formulations and prints the comparison.
+    """
+    results = {
+        'default': run_formulation(file_path, False, time_limit),
+        'strengthened': run_formulation(file_path, True, time_limit),
+    }
+    best_obj = min(r['obj'] for r in results.values())
+
+    print(f"{'formulation':<14}{'vars':>7}{'constrs':>9}{'LP bound':>11}{'root gap':>10}"
+          f"{'obj':>9}{'bound':>9}{'time (s)':>10}{'nodes':>9}")
+    for name, r in results.items():
+        root_gap = (best_obj - r['lp_bound']) / best_obj
+        print(f"{name:<14}{r['vars']:>7}{r['constrs']:>9}{r['lp_bound']:>11.2f}{root_gap:>10.2%}"
+              f"{r['obj']:>9.1f}{r['bound']:>9.1f}{r['time']:>10.2f}{r['nodes']:>9.0f}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("file_path", nargs="?", default="datasheet.xlsx")
+    parser.add_argument("--time-limit", type=float, default=600)
+    args = parser.parse_args()
+
+    run_benchmark(args.file_path, args.time_limit)
@@ -0,0 +1,177 @@
+"""
+Scaling Benchmark
+
+Generates instances of increasing size (see instance_generator.py) and times
+every phase per solver mode: loading the workbook, building the model,
+presolve, the first incumbent, the solve and analyze_results. The results
+are written to a JSON file that can be compared with the file of another
+commit. Run from the repository root:
+
+    python -m benchmarks.scaling --sizes 10 25 50 --output scaling.json
+    python -m benchmarks.scaling --sizes 10 25 50 --compare old.json --output new.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+
+from gurobipy import GRB, gurobi
+
+from branch_and_cut import BranchAndCutModel
+from undirected import UndirectedModel
+from instance_cache import load_instance
+from instance_generator import LAYOUTS, write_instance
+from main import MILPModel
+
+
+MODES = ('loop', 'matrix', 'strengthened', 'branch_and_cut', 'undirected')
+INSTANCE_DIR = os.path.join('benchmarks', 'instances')
+TIMED_PHASES = ('load_time', 'build_time', 'presolve_time', 'first_incumbent_time',
+                'solve_time', 'analyze_time')
+
+
+def make_model(mode, params):
+    if mode == 'branch_and_cut':
+        return BranchAndCutModel(params=params)
+    if mode == 'undirected':
+        return UndirectedModel(params=params)
+    if mode == 'strengthened':
+        return MILPModel(params=params, strengthen=True)
+    return MILPModel(build_mode=mode, params=params)
+
+
+def run_mode(file_path, mode, time_limit):
+    """
+    Loads, builds, solves and analyzes one instance in one mode. Returns a
+    dict with the phase times (seconds), the model size and the outcome.
+    """
+    result = {'mode': mode}
+    start = time.perf_counter()
+    data = load_instance(file_path)
+    result['load_time'] = time.perf_counter() - start
+
+    model = make_model(mode, {'OutputFlag': 0, 'TimeLimit': time_limit})
+    start = time.perf_counter()
+    model.data_setup(data)
+    model.setup_contraints()
+    model.model.update()
+    result['build_time'] = time.perf_counter() - start
+    result.update(vars=model.model.NumVars, constrs=model.model.NumConstrs, nonzeros=model.model.NumNZs)
+
+    # The first MIP callback marks the end of presolve, the first MIPSOL the first incumbent
+    events = {}
+
+    def record(cb_model, where):
+        if where in (GRB.Callback.MIP, GRB.Callback.MIPSOL, GRB.Callback.MIPNODE):
+            events.setdefault('presolve_time', cb_model.cbGet(GRB.Callback.RUNTIME))
+        if where == GRB.Callback.MIPSOL:
+            events.setdefault('first_incumbent_time', cb_model.cbGet(GRB.Callback.RUNTIME))
+
+    model.callbacks.append(record)
+    start = time.perf_counter()
+    model.optimize_model()
+    result['solve_time'] = time.perf_counter() - start
+    result['presolve_time'] = events.get('presolve_time')
+    result['first_incumbent_time'] = events.get('first_incumbent_time')
+
+    result['status'] = model.model.Status
+    if model.model.SolCount > 0:
+        result['obj'] = model.model.ObjVal
+        result['bound'] = model.model.ObjBound
+        result['gap'] = model.model.MIPGap
+        start = time.perf_counter()
+        model.analyze_results()
+        result['analyze_time'] = time.perf_counter() - start
+    else:
+        result.update(obj=None, bound=None, gap=None, analyze_time=None)
+
+    model.model.dispose()
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(sizes, layouts=LAYOUTS, seeds=(0,), modes=MODES, time_limit=60,
+                  instance_dir=INSTANCE_DIR):
+    """
+    Runs every mode on every generated (size, layout, seed) instance and
+    returns the results document.
+    """
+    os.makedirs(instance_dir, exist_ok=True)
+    runs = []
+    for n_customers in sizes:
+        for layout in layouts:
+            for seed in seeds:
+                name = f"n{n_customers}_{layout}_s{seed}"
+                file_path = os.path.join(instance_dir, f"{name}.xlsx")
+                if not os.path.exists(file_path):
+                    write_instance(file_path, n_customers, layout, seed)
+                for mode in modes:
+                    result = run_mode(file_path, mode, time_limit)
+                    result.update(instance=name, customers=n_customers, layout=layout, seed=seed)
+                    print(f"{name:<22}{mode:<16}build {result['build_time']:>8.3f}s  "
+                          f"solve {result['solve_time']:>8.3f}s  obj {result['obj']}  gap {result['gap']}")
+                    runs.append(result)
+
+    return {
+        'commit': git_commit(),
+        'gurobi': '.'.join(map(str, gurobi.version())),
+        'python': platform.python_version(),
+        'time_limit': time_limit,
+        'runs': runs,
+    }
+
+
+def compare(old, new, tolerance=0.25):
+    """
+    Returns the regressions between two results documents: phases that got
+    more than tolerance (relative) slower, and runs whose objective got worse
+    or that lost their solution.
+    """
+    old_runs = {(r['instance'], r['mode']): r for r in old['runs']}
+    regressions = []
+    for run in new['runs']:
+        before = old_runs.get((run['instance'], run['mode']))
+        if before is None:
+            continue
+        for phase in TIMED_PHASES:
+            if before.get(phase) and run.get(phase) and run[phase] > before[phase] * (1 + tolerance) + 0.01:
+                regressions.append(f"{run['instance']} {run['mode']}: {phase} "
+                                   f"{before[phase]:.3f}s -> {run[phase]:.3f}s")
+        if before['obj'] is not None and (run['obj'] is None or run['obj'] > before['obj'] + 1e-6):
+            regressions.append(f"{run['instance']} {run['mode']}: obj {before['obj']} -> {run['obj']}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 25, 50])
+    parser.add_argument("--layouts", nargs="+", choices=LAYOUTS, default=list(LAYOUTS))
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--time-limit", type=float, default=60)
+    parser.add_argument("--output", default="scaling_results.json")
+    parser.add_argument("--compare", help="results file of an earlier run to check for regressions")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.sizes, args.layouts, args.seeds, args.modes, args.time_limit)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if not regressions:
+            print("No regressions")
@@ -0,0 +1,263 @@
+"""
+Branch-and-Cut File
+
+Alternative engine that only uses the arc variables x and k. The capacity,
+route duration and distance limits are not modelled with flow variables but
+added as cuts from a Gurobi callback whenever an integer solution violates
+them, and optionally as user cuts from the fractional node relaxations.
+"""
+
+import math
+
+from gurobipy import GRB, quicksum
+
+from main import MILPModel
+from constraints import fleet_lower_bound
+from graph_index import get_graph_index
+from preprocessing import route_bounds
+from routes import decode_routes
+from telemetry import timed_phase
+
+
+class BranchAndCutModel(MILPModel):
+    """
+    Branch-and-cut version of MILPModel with the degree constraints (2)-(5)
+    on x and k. Violated routes are cut off lazily with
+
+    - rounded capacity, duration and distance cuts: the number of arcs
+      leaving the customers S of a subtour or a route is at least the
+      number of vehicles S needs by load, time or distance (see rounded_cut);
+    - infeasible path cuts: the arcs of the shortest prefix 0 -> ... -> v of
+      a route after which even the fastest (shortest) way back to the depot
+      exceeds T_bar (D_bar) cannot all be used.
+
+    With user_cuts the rounded cuts are also separated on the
+    connected components of fractional node relaxations.
+    """
+    def __init__(self, params=None, user_cuts=False, telemetry=None):
+        super().__init__(params=params, telemetry=telemetry)
+        self.user_cuts = user_cuts
+
+
+    def add_variables(self):
+        """
+        Creates x and k and sets the objective.
+        """
+        self.variables = {
+            'x': {
+                (i, j): self.model.addVar(vtype=GRB.BINARY, name=f"x_{i}_{j}")
+                for (i, j) in self.data['arcs']
+            },
+            'k': self.model.addVar(vtype=GRB.INTEGER, lb=0, name="k"),
+        }
+        self.model.update()
+
+        # Objective: Minimize total distance traveled
+        self.model.setObjective(
+            quicksum(
+                self.data['arcs'][(i, j)]['distance'] * self.variables['x'][i, j]
+                for (i, j) in self.data['arcs']
+            ),
+            GRB.MINIMIZE
+        )
+
+
+    @timed_phase
+    def setup_contraints(self):
+        """
+        Adds the degree constraints and 2-cycle cuts and registers the
+        separation callback.
+        """
+        if self.deferred:
+            return
+
+        graph = get_graph_index(self.data)
+        x = self.variables['x']
+        k = self.variables['k']
+        self.constraints = {'incoming_arc': {}, 'outgoing_arc': {}, 'two_cycle': {}}
+
+        # (2) Each customer has exactly one incoming arc
+        # (3) Each customer has exactly one outgoing arc
+        for i in self.data['vertices_prime']:
+            self.constraints['incoming_arc'][i] = self.model.addConstr(
+                quicksum(x[a] for a in graph.in_arcs(i)) == 1, name=f"incoming_arc_{i}"
+            )
+            self.constraints['outgoing_arc'][i] = self.model.addConstr(
+                quicksum(x[a] for a in graph.out_arcs(i)) == 1, name=f"outgoing_arc_{i}"
+            )
+
+        # (4) Vehicles leave depot k times
+        # (5) Vehicles return to depot k times
+        self.constraints['depot_departures'] = self.model.addConstr(
+            quicksum(x[a] for a in graph.out_arcs(0)) == k, name="depot_departures"
+        )
+        self.constraints['depot_returns'] = self.model.addConstr(
+            quicksum(x[a] for a in graph.in_arcs(0)) == k, name="depot_returns"
+        )
+
+        # Subtours over two customers
+        for i, j in self.data['arcs']:
+            if 0 < i < j and (j, i) in self.data['arcs']:
+                self.constraints['two_cycle'][i, j] = self.model.addConstr(
+                    x[i, j] + x[j, i] <= 1, name=f"two_cycle_{i}_{j}"
+                )
+
+        k.LB = fleet_lower_bound(self.data)
+
+        self.model.Params.LazyConstraints = 1
+        if self.user_cuts:
+            self.model.Params.PreCrush = 1
+        self.callbacks.append(self.separate)
+
+
+    def update_model(self, parameter):
+        """
+        The parameters only enter through the cuts, which are separated again
+        in every solve, and through the fleet lower bound.
+        """
+        self.variables['k'].LB = fleet_lower_bound(self.data)
+
+
+    @timed_phase
+    def optimize_model(self, heuristic_start=False, start_routes=None, lower_bound=None):
+        """
+        Optimize the model with the cut callback.
+        """
+        self.bounds = route_bounds(self.data)
+
+        # Cheapest arc into every customer. The service times are added once
+        # per customer in vehicles_needed, so the time is the travel time only.
+        # A customer without incoming arcs fails the screening in
+        # MILPModel.optimize_model before any cut is separated
+        graph = get_graph_index(self.data)
+        arcs = self.data['arcs']
+        self.cheapest_in = {
+            'time': {
+                j: min((arcs[a]['time'] for a in graph.in_arcs(j)), default=math.inf)
+                for j in self.data['vertices_prime']
+            },
+            'distance': {
+                j: min((arcs[a]['distance'] for a in graph.in_arcs(j)), default=math.inf)
+                for j in self.data['vertices_prime']
+            },
+        }
+        super().optimize_model(heuristic_start, start_routes, lower_bound)
+
+
+    def vehicles_needed(self, customers):
+        """
+        Returns r(S) for a set of customers S, the largest of
+        ceil(N(S) / Q), ceil(time(S) / T_bar) and ceil(distance(S) / D_bar)
+        and at least 1. time(S) and distance(S) count the service times and
+        the cheapest entering arc of every customer in S.
+        """
+        vertices = self.data['vertices']
+        other = self.data['other']
+
+        load = sum(vertices[i]['N_i'] for i in customers)
+        time = sum(vertices[i]['S_i'] + self.cheapest_in['time'][i] for i in customers)
+        distance = sum(self.cheapest_in['distance'][i] for i in customers)
+        return max(
+            1,
+            math.ceil(load / other['Q'] - 1e-9),
+            math.ceil(time / other['T_bar'] - 1e-9),
+            math.ceil(distance / other['D_bar'] - 1e-9),
+        )
+
+
+    def rounded_cut(self, customers):
+        """
+        Returns (expression, rhs) of the rounded cut for a set of customers S:
+        at least r(S) arcs leave S (see vehicles_needed).
+        """
+        graph = get_graph_index(self.data)
+        x = self.variables['x']
+        expression = quicksum(
+            x[i, j] for i in customers for (_, j) in graph.out_arcs(i) if j not in customers
+        )
+        return expression, self.vehicles_needed(customers)
+
+
+    def infeasible_prefix(self, route):
+        """
+        Returns the arcs of the shortest prefix of the route that cannot be
+        completed within T_bar or D_bar, or None if the route is feasible.
+        """
+        arcs = self.data['arcs']
+        vertices = self.data['vertices']
+        other = self.data['other']
+        time, distance = 0, 0
+        for p, (i, j) in enumerate(zip(route[:-1], route[1:])):
+            time += (vertices[i]['S_i'] if i != 0 else 0) + arcs[i, j]['time']
+            distance += arcs[i, j]['distance']
+            S_j = vertices[j]['S_i'] if j != 0 else 0
+            if (time + S_j + self.bounds['time_back'].get(j, math.inf) > other['T_bar']
+                    or distance + self.bounds['dist_back'].get(j, math.inf) > other['D_bar']):
+                return list(zip(route[:p + 1], route[1:p + 2]))
+        return None
+
+
+    def separate(self, model, where):
+        """
+        Callback that adds the violated cuts.
+        """
+        x = self.variables['x']
+
+        if where == GRB.Callback.MIPSOL:
+            values = model.cbGetSolution(list(x.values()))
+            arcs_used = [a for a, value in zip(x, values) if value > 0.5]
+            routes, cycles = decode_routes(arcs_used)
+
+            for cycle in cycles:
+                expression, rhs = self.rounded_cut(set(cycle))
+                model.cbLazy(expression >= rhs)
+
+            for route in routes:
+                expression, rhs = self.rounded_cut(set(route[1:-1]))
+                if rhs > 1:
+                    model.cbLazy(expression >= rhs)
+                    continue
+                prefix = self.infeasible_prefix(route)
+                if prefix is not None:
+                    model.cbLazy(quicksum(x[a] for a in prefix) <= len(prefix) - 1)
+
+        elif (where == GRB.Callback.MIPNODE and self.user_cuts
+              and model.cbGet(GRB.Callback.MIPNODE_STATUS) == GRB.OPTIMAL):
+            values = dict(zip(x, model.cbGetNodeRel(list(x.values()))))
+
+            # Connected components of the customers in the support graph
+            component = {i: i for i in self.data['vertices_prime']}
+
+            def find(i):
+                while component[i] != i:
+                    component[i] = component[component[i]]
+                    i = component[i]
+                return i
+
+            for (i, j), value in values.items():
+                if i != 0 and j != 0 and value > 1e-6:
+                    component[find(i)] = find(j)
+
+            groups = {}
+            for i in component:
+                groups.setdefault(find(i), set()).add(i)
+
+            for customers in groups.values():
+                outflow = sum(
+                    value for (i, j), value in values.items() if i in customers and j not in customers
+                )
+                expression, rhs = self.rounded_cut(customers)
+                if outflow < rhs - 1e-4:
+                    model.cbCut(expression >= rhs)
+
+
+if __name__ == "__main__":
+    file_path = 'datasheet.xlsx'
+
+    model = BranchAndCutModel(user_cuts=True)
+    model.model_setup(file_path)
+    model.setup_contraints()
+    model.optimize_model(heuristic_start=True)
+
+    if model.status == 1:
+        model.analyze_results()
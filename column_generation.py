@@ -0,0 +1,280 @@
+"""
+Column Generation File
+
+Route-based engine: a set-partitioning master over route columns whose LP
+is solved by column generation. New columns are priced with an elementary
+shortest-path-with-resources labeling algorithm on the Q, T_bar and D_bar
+resources, and the integer master over all generated columns gives the
+final route set (price-and-branch).
+"""
+
+import math
+
+from gurobipy import Model, GRB, Column, quicksum
+
+from graph_index import get_graph_index
+from heuristics import construct_routes
+from preprocessing import route_bounds
+from routes import evaluate_routes, route_distance, route_feasible
+
+
+class _Label():
+    """
+    A partial path from the depot to vertex: its reduced cost, the resources
+    used on arrival at vertex (before its service), the visited customers
+    as bitmask and the previous label.
+    """
+    __slots__ = ('vertex', 'cost', 'load', 'time', 'distance', 'visited', 'previous')
+
+    def __init__(self, vertex, cost, load, time, distance, visited, previous):
+        self.vertex = vertex
+        self.cost = cost
+        self.load = load
+        self.time = time
+        self.distance = distance
+        self.visited = visited
+        self.previous = previous
+
+
+    def dominates(self, other):
+        return (self.cost <= other.cost and self.load <= other.load
+                and self.time <= other.time and self.distance <= other.distance
+                and self.visited & other.visited == self.visited)
+
+
+    def path(self):
+        label, path = self, []
+        while label is not None:
+            path.append(label.vertex)
+            label = label.previous
+        return path[::-1]
+
+
+class ColumnGeneration():
+    """
+    Column generation solver for the data dictionary built by model_setup.
+
+    columns_per_iteration bounds the number of negative reduced cost routes
+    added per pricing round. Pricing first runs with at most heuristic_labels
+    labels per vertex and only falls back to the exact labeling when that
+    finds no column, so the final LP bound is exact.
+    """
+    def __init__(self, data, params=None, columns_per_iteration=50, heuristic_labels=10,
+                 max_iterations=1000):
+        self.data = data
+        self.params = params or {}
+        self.columns_per_iteration = columns_per_iteration
+        self.heuristic_labels = heuristic_labels
+        self.max_iterations = max_iterations
+        self.customers = list(data['vertices_prime'])
+        self.bit = {v: 1 << p for p, v in enumerate(self.customers)}
+        self.lp_bound = None
+        self.status = 0
+
+
+    def build_master(self):
+        """
+        Sets up the LP master with an expensive artificial column per
+        customer (so it is always feasible) and the initial columns: the
+        single-customer routes and the heuristic routes.
+        """
+        self.master = Model()
+        for name, value in self.params.items():
+            self.master.setParam(name, value)
+
+        self.partition = {
+            i: self.master.addConstr(quicksum([]) == 1, name=f"visit_{i}")
+            for i in self.customers
+        }
+        self.columns = {}
+        self.column_set = set()
+
+        big_m = 2 * sum(arc['distance'] for arc in self.data['arcs'].values()) + 1
+        self.artificials = [
+            self.master.addVar(obj=big_m, column=Column([1], [self.partition[i]]),
+                               name=f"artificial_{i}")
+            for i in self.customers
+        ]
+
+        initial = [[0, i, 0] for i in self.customers]
+        heuristic_routes = construct_routes(self.data)
+        if heuristic_routes is not None:
+            initial += list(heuristic_routes.values())
+        for route in initial:
+            if route_feasible(self.data, route):
+                self.add_column(route)
+
+
+    def add_column(self, route):
+        """
+        Adds a route [0, ..., 0] as column to the master, unless it is known.
+        """
+        key = tuple(route)
+        if key in self.column_set:
+            return False
+        self.column_set.add(key)
+        customers = route[1:-1]
+        var = self.master.addVar(
+            obj=route_distance(self.data, route),
+            column=Column([1] * len(customers), [self.partition[i] for i in customers]),
+            name=f"route_{len(self.columns)}",
+        )
+        self.columns[key] = var
+        return True
+
+
+    def price(self, duals, max_labels=None):
+        """
+        Labeling algorithm for the elementary shortest path with resources.
+        Arc (i, j) costs D_ij minus the dual of customer j. Returns routes
+        with negative reduced cost, most negative first. With max_labels only
+        that many (cheapest) labels are extended per vertex.
+        """
+        data = self.data
+        arcs = data['arcs']
+        vertices = data['vertices']
+        other = data['other']
+        graph = get_graph_index(data)
+        S = {v: (vertices[v]['S_i'] if v != 0 else 0) for v in vertices}
+        inf = math.inf
+
+        labels = {v: [] for v in vertices}
+        queue = [_Label(0, 0, 0, 0, 0, 0, None)]
+        found = []
+
+        while queue:
+            # Extend the labels in order of reduced cost within the round
+            queue.sort(key=lambda label: label.cost)
+            if max_labels is not None:
+                queue = queue[:max_labels * len(self.customers)]
+            next_queue = []
+
+            for label in queue:
+                v = label.vertex
+                for (_, w) in graph.out_arcs(v):
+                    arc = arcs[v, w]
+                    if w == 0:
+                        if v == 0:
+                            continue
+                        cost = label.cost + arc['distance']
+                        if (cost < -1e-6 and label.time + S[v] + arc['time'] <= other['T_bar']
+                                and label.distance + arc['distance'] <= other['D_bar']):
+                            found.append((cost, label.path() + [0]))
+                        continue
+                    if label.visited & self.bit[w]:
+                        continue
+
+                    load = label.load + vertices[w]['N_i']
+                    time = label.time + S[v] + arc['time']
+                    distance = label.distance + arc['distance']
+                    if (load > other['Q']
+                            or time + S[w] + self.bounds['time_back'].get(w, inf) > other['T_bar']
+                            or distance + self.bounds['dist_back'].get(w, inf) > other['D_bar']):
+                        continue
+
+                    new = _Label(w, label.cost + arc['distance'] - duals[w], load, time, distance,
+                                 label.visited | self.bit[w], label)
+                    if any(old.dominates(new) for old in labels[w]):
+                        continue
+                    labels[w] = [old for old in labels[w] if not new.dominates(old)]
+                    if max_labels is not None and len(labels[w]) >= max_labels:
+                        continue
+                    labels[w].append(new)
+                    next_queue.append(new)
+
+            # Labels dominated after they were queued are dropped
+            queue = [label for label in next_queue if label in labels[label.vertex]]
+
+        found.sort(key=lambda item: item[0])
+        return [route for _, route in found]
+
+
+    def solve_lp(self):
+        """
+        Column generation on the LP master. Returns the LP bound, or None if
+        max_iterations ran out while pricing still found columns (the
+        restricted master value is then no bound).
+        """
+        for _ in range(self.max_iterations):
+            self.master.optimize()
+            duals = {i: constr.Pi for i, constr in self.partition.items()}
+
+            routes = self.price(duals, self.heuristic_labels)
+            if not routes:
+                routes = self.price(duals)
+            added = 0
+            for route in routes:
+                if added >= self.columns_per_iteration:
+                    break
+                added += self.add_column(route)
+            if not added:
+                return self.master.ObjVal
+
+        print(f"Column generation stopped after {self.max_iterations} iterations")
+        return None
+
+
+    def solve(self):
+        """
+        Solves the LP master by column generation and then the integer master
+        over all generated columns. Returns (obj, k, VMT, VTT, routes) like
+        analyze_results, or None if no feasible route set was found. status is
+        1 if routes were found, 2 if the instance is infeasible and 0 if the
+        solve stopped without an answer.
+        """
+        self.bounds = route_bounds(self.data)
+        self.build_master()
+        self.lp_bound = self.solve_lp()
+        if self.lp_bound is not None and any(var.X > 1e-6 for var in self.artificials):
+            # Some customer cannot be covered by any feasible route
+            print("Model is infeasible")
+            self.lp_bound = None
+            self.status = 2
+            return None
+        if self.lp_bound is not None:
+            print(f"####   Column generation LP bound: {self.lp_bound} ({len(self.columns)} columns)")
+
+        for var in self.master.getVars():
+            var.VType = GRB.BINARY
+        self.master.optimize()
+
+        if self.master.SolCount == 0:
+            self.status = 0
+            return None
+
+        chosen = [list(route) for route, var in self.columns.items() if var.X > 0.5]
+        covered = sorted(i for route in chosen for i in route[1:-1])
+        if covered != sorted(self.customers):
+            # The generated columns hold no integer cover of the customers
+            # (price-and-branch is a heuristic), which does not make the
+            # instance infeasible
+            print("No integer route set over the generated columns")
+            self.status = 0
+            return None
+
+        self.status = 1
+        routes = {route_id: route for route_id, route in enumerate(chosen, start=1)}
+        return evaluate_routes(self.data, routes)
+
+
+def solve_column_generation(data, params=None, **kwargs):
+    """
+    Runs the column generation engine on a data dictionary and returns
+    (obj, k, VMT, VTT, routes), or None if the instance is infeasible.
+    """
+    return ColumnGeneration(data, params, **kwargs).solve()
+
+
+if __name__ == "__main__":
+    from instance_cache import load_instance
+
+    solver = ColumnGeneration(load_instance('datasheet.xlsx'), params={'OutputFlag': 0})
+    result = solver.solve()
+    if result is not None:
+        obj, k, VMT, VTT, routes = result
+        print(f"####   The model finished with objective value: {obj}")
+        print(f"####   The amount of vehicles used: {k}")
+        print(f"####   VMT: {VMT}")
+        print(f"####   VTT: {VTT}")
+        for key, value in routes.items():
+            print(f"####   Route {key}: {value}")
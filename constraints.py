@@ -4,22 +4,207 @@ Constraints file
 States the constraints.
 """
 
+import math
+
+import numpy as np
+import scipy.sparse as sp
+
+from graph_index import get_graph_index
+from preprocessing import route_bounds
+
+
+# Constraint families (2)-(17)
+CONSTRAINT_FAMILIES = (
+    'incoming_arc', 'outgoing_arc', 'depot_departures', 'depot_returns',
+    'capacity_arc', 'package_flow', 'time_flow', 'time_upper', 'time_lower',
+    'time_back', 'time_start', 'distance_flow', 'dist_upper', 'dist_lower',
+    'dist_back', 'dist_start',
+)
+
+# Families whose coefficients on x depend on a (sweepable) parameter
+PARAMETER_FAMILIES = {
+    'Q': ('capacity_arc',),
+    'T_bar': ('time_upper', 'time_back'),
+    'D_bar': ('dist_upper', 'dist_back'),
+    'S_i': ('time_flow', 'time_lower'),
+}
+
+# Per-arc families of the form z <= M * x or z >= M * x
+BIG_M_FAMILIES = (
+    'capacity_arc', 'time_upper', 'time_back', 'time_lower',
+    'dist_upper', 'dist_back', 'dist_lower',
+)
+
+
 def add_constraints(model, data, variables):
+    """
+    Adds constraints (2)-(17) one at a time and returns them grouped per
+    family, keyed by vertex (flow families) or arc (per-arc families).
+    """
+    graph = get_graph_index(data)
+    x = variables["x"]
+    k = variables['k']
+
+    constrs = {family: {} for family in CONSTRAINT_FAMILIES}
+
+    # --- Constraints ---
+
+    # (2), (3), (7), (8) and (13) for every customer
+    for i in data["vertices_prime"]:
+        add_customer_constraints(model, data, variables, constrs, i)
+
+    # (4) Vehicles leave depot k times
+    constrs['depot_departures'][0] = model.addConstr(
+        sum(x[a] for a in graph.out_arcs(0)) == k,
+        name="depot_departures"
+    )
+
+    # (5) Vehicles return to depot k times
+    constrs['depot_returns'][0] = model.addConstr(
+        sum(x[a] for a in graph.in_arcs(0)) == k,
+        name="depot_returns"
+    )
+
+    # (6), (9)-(12) and (14)-(17) for every arc
+    add_arc_constraints(model, data, variables, constrs, list(data["arcs"]))
+
+    return constrs
+
+
+def add_arc_constraints(model, data, variables, constrs, arcs):
+    """
+    Adds the per-arc constraints (6), (9)-(12) and (14)-(17) for the given
+    arcs to constrs, both for add_constraints and for the arcs of a customer
+    added to a built model.
+    """
+    vertices = data["vertices"]
+    Q = data["other"]["Q"]
+    Tmax = data["other"]["T_bar"]
+    D_max = data["other"]["D_bar"]
+    x = variables["x"]
+    y = variables["y"]
+    z = variables["z"]
+    z_prime = variables["z_prime"]
+
+    for i, j in arcs:
+        T_ij = data["arcs"][i, j]['time']
+        D_ij = data["arcs"][i, j]['distance']
+
+        # (6) Package capacity constraint
+        constrs['capacity_arc'][i, j] = model.addConstr(
+            y[i, j] <= Q * x[i, j], name=f"capacity_arc_{i}_{j}")
+
+        if j != 0:
+            # (9) Total travel time upper bound
+            constrs['time_upper'][i, j] = model.addConstr(
+                z[i, j] <= Tmax * x[i, j], name=f"time_upper_{i}_{j}")
+            # (14) Max distance upper bound
+            constrs['dist_upper'][i, j] = model.addConstr(
+                z_prime[i, j] <= D_max * x[i, j], name=f"dist_upper_{i}_{j}")
+        else:
+            # (11) End-of-route time constraint
+            constrs['time_back'][i, j] = model.addConstr(
+                z[i, j] <= Tmax * x[i, j], name=f"time_back_{i}_0")
+            # (16) Final distance back to depot
+            constrs['dist_back'][i, j] = model.addConstr(
+                z_prime[i, j] <= D_max * x[i, j], name=f"dist_back_{i}_0")
+
+        if i != 0:
+            # (10) Lower bound on travel time if arc is used
+            constrs['time_lower'][i, j] = model.addConstr(
+                z[i, j] >= (T_ij + vertices[i]['S_i']) * x[i, j], name=f"time_lower_{i}_{j}")
+            # (15) Lower bound on distance if arc is used
+            constrs['dist_lower'][i, j] = model.addConstr(
+                z_prime[i, j] >= D_ij * x[i, j], name=f"dist_lower_{i}_{j}")
+        else:
+            # (12) Initial travel time from depot
+            constrs['time_start'][i, j] = model.addConstr(
+                z[i, j] == T_ij * x[i, j], name=f"time_start_0_{j}")
+            # (17) Initial distance from depot
+            constrs['dist_start'][i, j] = model.addConstr(
+                z_prime[i, j] == D_ij * x[i, j], name=f"dist_start_0_{j}")
+
+
+def add_customer_constraints(model, data, variables, constrs, i):
+    """
+    Adds the flow constraints (2), (3), (7), (8) and (13) of customer i to
+    constrs, both for add_constraints and for a customer added to a built
+    model.
+    """
+    arcs = data["arcs"]
+    N_i = data["vertices"][i]['N_i']
+    S_i = data["vertices"][i]['S_i']
+    graph = get_graph_index(data)
+    x = variables["x"]
+    y = variables["y"]
+    z = variables["z"]
+    z_prime = variables["z_prime"]
+    out_arcs = graph.out_arcs(i)
+    in_arcs = graph.in_arcs(i)
+
+    # (2) Each customer has exactly one incoming arc
+    constrs['incoming_arc'][i] = model.addConstr(
+        sum(x[a] for a in in_arcs) == 1, name=f"incoming_arc_{i}")
+
+    # (3) Each customer has exactly one outgoing arc
+    constrs['outgoing_arc'][i] = model.addConstr(
+        sum(x[a] for a in out_arcs) == 1, name=f"outgoing_arc_{i}")
+
+    # (7) Flow conservation for packages
+    constrs['package_flow'][i] = model.addConstr(
+        sum(y[a] for a in out_arcs) - sum(y[a] for a in in_arcs) == N_i,
+        name=f"package_flow_{i}")
+
+    # (8) Travel time flow conservation
+    constrs['time_flow'][i] = model.addConstr(
+        sum(z[a] for a in out_arcs) - sum(z[a] for a in in_arcs) ==
+        sum((arcs[a]['time'] + S_i) * x[a] for a in out_arcs),
+        name=f"time_flow_{i}")
+
+    # (13) Distance flow conservation
+    constrs['distance_flow'][i] = model.addConstr(
+        sum(z_prime[a] for a in out_arcs) - sum(z_prime[a] for a in in_arcs) ==
+        sum(arcs[a]['distance'] * x[a] for a in out_arcs),
+        name=f"distance_flow_{i}")
+
+
+def add_matrix_constraints(model, data, variables):
+    """
+    Matrix-API version of add_constraints.
+
+    Expects the variable families as MVars over the arc index (in the order
+    of data['arcs']) and adds every constraint family (2)-(17) with a single
+    sparse matrix expression. Returns the constraints grouped per family
+    like add_constraints.
+    """
     vertices = data["vertices"]
     arcs = data["arcs"]
     D_max = data["other"]["D_bar"]
     Q = data["other"]["Q"]
     Tmax = data["other"]["T_bar"]
 
-    V = list(vertices.keys())
     V_prime = list(data["vertices_prime"].keys())
     E = list(arcs.keys())
+    graph = get_graph_index(data)
+
+    # Arc index arrays
+    tail = np.array([i for (i, j) in E])
+    head = np.array([j for (i, j) in E])
+    T_ij = np.array([arcs[a]['time'] for a in E], dtype=float)
+    D_ij = np.array([arcs[a]['distance'] for a in E], dtype=float)
+    N_i = np.array([vertices[v]['N_i'] for v in V_prime], dtype=float)
+    S_tail = np.array([vertices[i]['S_i'] if i != 0 else 0 for i in tail], dtype=float)
 
-    # Lookup dictionaries
-    N_i = {v_id: vertices[v_id]['N_i'] for v_id in V}
-    S_i = {v_id: vertices[v_id]['S_i'] for v_id in V}
-    T_ij = {(i, j): arcs[(i, j)]['time'] for (i, j) in E}
-    D_ij = {(i, j): arcs[(i, j)]['distance'] for (i, j) in E}
+    # Sparse incidence matrices over the customers: A_out[r, e] = 1 if arc e
+    # leaves customer r, A_in[r, e] = 1 if arc e enters customer r
+    A_out, A_in = graph.incidence(V_prime)
+    A_flow = A_out - A_in
+
+    # Arc subsets used by the per-arc families
+    from_depot = np.flatnonzero(tail == 0)
+    to_depot = np.flatnonzero(head == 0)
+    to_customer = np.flatnonzero(head != 0)
+    from_customer = np.flatnonzero(tail != 0)
 
     x = variables["x"]
     y = variables["y"]
@@ -27,105 +212,291 @@ def add_constraints(model, data, variables):
     z_prime = variables["z_prime"]
     k = variables['k']
 
+    mconstrs = {}
+
     # --- Constraints ---
 
-   # (2) Each customer has exactly one incoming arc
-    for j in V_prime:
-        model.addConstr(sum(x[i, j] for i in V if (i, j) in E) == 1,
-                        name=f"incoming_arc_{j}")
+    # (2) Each customer has exactly one incoming arc
+    mconstrs['incoming_arc'] = model.addConstr(A_in @ x == 1, name="incoming_arc")
 
     # (3) Each customer has exactly one outgoing arc
-    for i in V_prime:
-        model.addConstr(sum(x[i, j] for j in V if (i, j) in E) == 1,
-                        name=f"outgoing_arc_{i}")
+    mconstrs['outgoing_arc'] = model.addConstr(A_out @ x == 1, name="outgoing_arc")
 
     # (4) Vehicles leave depot k times
-    model.addConstr(sum(x[0, i] for i in V_prime if (0, i) in E) == k,
-                    name="depot_departures")
+    mconstrs['depot_departures'] = model.addConstr(x[from_depot].sum() == k, name="depot_departures")
 
     # (5) Vehicles return to depot k times
-    model.addConstr(sum(x[i, 0] for i in V_prime if (i, 0) in E) == k,
-                    name="depot_returns")
+    mconstrs['depot_returns'] = model.addConstr(x[to_depot].sum() == k, name="depot_returns")
 
     # (6) Package capacity constraint
-    for i, j in E:
-        model.addConstr(y[i, j] <= Q * x[i, j],
-                        name=f"capacity_arc_{i}_{j}")
+    mconstrs['capacity_arc'] = model.addConstr(y <= Q * x, name="capacity_arc")
 
     # (7) Flow conservation for packages
-    for i in V_prime:
-        model.addConstr(
-            sum(y[i, j] for j in V if (i, j) in E) - 
-            sum(y[j, i] for j in V if (j, i) in E) == N_i[i],
-            name=f"package_flow_{i}"
-        )
+    mconstrs['package_flow'] = model.addConstr(A_flow @ y == N_i, name="package_flow")
 
     # (8) Travel time flow conservation
-    for i in V_prime:
-        model.addConstr(
-            sum(z[i, j] for j in V if (i, j) in E) - 
-            sum(z[j, i] for j in V if (j, i) in E) == 
-            sum((T_ij[i, j] + S_i[i]) * x[i, j] for j in V if (i, j) in E),
-            name=f"time_flow_{i}"
-        )
+    mconstrs['time_flow'] = model.addConstr(
+        A_flow @ z - (A_out @ sp.diags(T_ij + S_tail)) @ x == 0,
+        name="time_flow"
+    )
 
     # (9) Total travel time upper bound
-    for i in V:
-        for j in V_prime:
-            if (i, j) in E:
-                model.addConstr(z[i, j] <= Tmax * x[i, j],
-                                name=f"time_upper_{i}_{j}")
+    mconstrs['time_upper'] = model.addConstr(z[to_customer] <= Tmax * x[to_customer], name="time_upper")
 
     # (10) Lower bound on travel time if arc is used
-    for i in V_prime:
-        for j in V:
-            if (i, j) in E:
-                model.addConstr(z[i, j] >= (T_ij[i, j] + S_i[i]) * x[i, j],
-                                name=f"time_lower_{i}_{j}")
+    mconstrs['time_lower'] = model.addConstr(
+        z[from_customer] >= sp.diags((T_ij + S_tail)[from_customer]) @ x[from_customer],
+        name="time_lower"
+    )
 
     # (11) End-of-route time constraint
-    for i in V_prime:
-        if (i, 0) in E:
-            model.addConstr(z[i, 0] <= Tmax * x[i, 0],
-                            name=f"time_back_{i}_0")
+    mconstrs['time_back'] = model.addConstr(z[to_depot] <= Tmax * x[to_depot], name="time_back")
 
     # (12) Initial travel time from depot
-    for i in V_prime:
-        if (0, i) in E:
-            model.addConstr(z[0, i] == T_ij[0, i] * x[0, i],
-                            name=f"time_start_0_{i}")
+    mconstrs['time_start'] = model.addConstr(
+        z[from_depot] == sp.diags(T_ij[from_depot]) @ x[from_depot],
+        name="time_start"
+    )
 
     # (13) Distance flow conservation
-    for i in V_prime:
-        model.addConstr(
-            sum(z_prime[i, j] for j in V if (i, j) in E) -
-            sum(z_prime[j, i] for j in V if (j, i) in E) ==
-            sum(D_ij[i, j] * x[i, j] for j in V if (i, j) in E),
-            name=f"distance_flow_{i}"
-        )
+    mconstrs['distance_flow'] = model.addConstr(
+        A_flow @ z_prime - (A_out @ sp.diags(D_ij)) @ x == 0,
+        name="distance_flow"
+    )
 
     # (14) Max distance upper bound
-    for i in V:
-        for j in V_prime:
-            if (i, j) in E:
-                model.addConstr(z_prime[i, j] <= D_max * x[i, j],
-                                name=f"dist_upper_{i}_{j}")
+    mconstrs['dist_upper'] = model.addConstr(z_prime[to_customer] <= D_max * x[to_customer], name="dist_upper")
 
     # (15) Lower bound if arc is used
-    for i in V_prime:
-        for j in V:
-            if (i, j) in E:
-                model.addConstr(z_prime[i, j] >= D_ij[i, j] * x[i, j],
-                                name=f"dist_lower_{i}_{j}")
+    mconstrs['dist_lower'] = model.addConstr(
+        z_prime[from_customer] >= sp.diags(D_ij[from_customer]) @ x[from_customer],
+        name="dist_lower"
+    )
 
     # (16) Final distance back to depot
-    for i in V_prime:
-        if (i, 0) in E:
-            model.addConstr(z_prime[i, 0] <= D_max * x[i, 0],
-                            name=f"dist_back_{i}_0")
+    mconstrs['dist_back'] = model.addConstr(z_prime[to_depot] <= D_max * x[to_depot], name="dist_back")
 
     # (17) Initial distance from depot
-    for i in V_prime:
-        if (0, i) in E:
-            model.addConstr(z_prime[0, i] == D_ij[0, i] * x[0, i],
-                            name=f"dist_start_0_{i}")
+    mconstrs['dist_start'] = model.addConstr(
+        z_prime[from_depot] == sp.diags(D_ij[from_depot]) @ x[from_depot],
+        name="dist_start"
+    )
+
+    # Group the rows per family with the same keys as add_constraints
+    keys = {
+        'incoming_arc': V_prime,
+        'outgoing_arc': V_prime,
+        'depot_departures': [0],
+        'depot_returns': [0],
+        'capacity_arc': E,
+        'package_flow': V_prime,
+        'time_flow': V_prime,
+        'time_upper': [E[e] for e in to_customer],
+        'time_lower': [E[e] for e in from_customer],
+        'time_back': [E[e] for e in to_depot],
+        'time_start': [E[e] for e in from_depot],
+        'distance_flow': V_prime,
+        'dist_upper': [E[e] for e in to_customer],
+        'dist_lower': [E[e] for e in from_customer],
+        'dist_back': [E[e] for e in to_depot],
+        'dist_start': [E[e] for e in from_depot],
+    }
+    return {
+        family: dict(zip(keys[family], np.atleast_1d(mconstrs[family].tolist())))
+        for family in CONSTRAINT_FAMILIES
+    }
+
+
+def arc_coefficients(data, strengthen=False):
+    """
+    Returns the coefficients M of the per-arc big-M families, z <= M * x
+    and z >= M * x, as {family: {arc: M}}. By default these are Q, T_bar and
+    D_bar (upper) and the arc's own time/distance (lower).
+
+    With strengthen every arc gets the tightest value that still holds for
+    all feasible routes: the load picked up after j, the time and distance
+    still needed to serve j and get back to the depot, and the earliest
+    arrival time and shortest distance at i.
+    """
+    arcs = data["arcs"]
+    vertices = data["vertices"]
+    Q = data["other"]["Q"]
+    Tmax = data["other"]["T_bar"]
+    D_max = data["other"]["D_bar"]
+    S_i = {v: (vertices[v]['S_i'] if v != 0 else 0) for v in vertices}
+
+    coefficients = {family: {} for family in BIG_M_FAMILIES}
+    if strengthen:
+        bounds = route_bounds(data)
+        inf = float('inf')
+
+    for (i, j), arc in arcs.items():
+        if not strengthen:
+            coefficients['capacity_arc'][i, j] = Q
+            if j != 0:
+                coefficients['time_upper'][i, j] = Tmax
+                coefficients['dist_upper'][i, j] = D_max
+            else:
+                coefficients['time_back'][i, j] = Tmax
+                coefficients['dist_back'][i, j] = D_max
+            if i != 0:
+                coefficients['time_lower'][i, j] = arc['time'] + S_i[i]
+                coefficients['dist_lower'][i, j] = arc['distance']
+            continue
+
+        # An arc that cannot be part of a feasible route gets M = 0
+        if j != 0:
+            coefficients['capacity_arc'][i, j] = max(Q - vertices[j]['N_i'], 0)
+            coefficients['time_upper'][i, j] = max(Tmax - S_i[j] - bounds['time_back'].get(j, inf), 0)
+            coefficients['dist_upper'][i, j] = max(D_max - bounds['dist_back'].get(j, inf), 0)
+        else:
+            coefficients['capacity_arc'][i, j] = Q
+            coefficients['time_back'][i, j] = Tmax
+            coefficients['dist_back'][i, j] = D_max
+        if i != 0:
+            coefficients['time_lower'][i, j] = bounds['time_to'].get(i, 0) + S_i[i] + arc['time']
+            coefficients['dist_lower'][i, j] = bounds['dist_to'].get(i, 0) + arc['distance']
+
+    return coefficients
+
+
+def fleet_lower_bound(data):
+    """
+    Returns a lower bound on k from the total load, and from the total time
+    and distance: every customer is entered by one arc and served once, and
+    each of the k routes ends with an arc back to the depot.
+    """
+    arcs = data["arcs"]
+    vertices = data["vertices"]
+    other = data["other"]
+    V_prime = list(data["vertices_prime"].keys())
+    if not V_prime:
+        return 0
+    graph = get_graph_index(data)
+
+    lower_bound = math.ceil(sum(vertices[v]['N_i'] for v in V_prime) / other['Q'] - 1e-9)
+
+    for resource, limit, service in (('time', other['T_bar'], True), ('distance', other['D_bar'], False)):
+        entering = [min((arcs[a][resource] for a in graph.in_arcs(j)), default=0) for j in V_prime]
+        total = sum(entering) + (sum(vertices[v]['S_i'] for v in V_prime) if service else 0)
+        back = min((arcs[a][resource] for a in graph.in_arcs(0)), default=0)
+        if limit > back:
+            lower_bound = max(lower_bound, math.ceil(total / (limit - back) - 1e-9))
+
+    return max(lower_bound, 1)
+
+
+def apply_bounds(model, data, variables):
+    """
+    Bounds the flow variables by Q, T_bar and D_bar and k by the fleet lower
+    bound and the number of customers.
+    """
+    for name, limit in (('y', 'Q'), ('z', 'T_bar'), ('z_prime', 'D_bar')):
+        family = list(variables[name].values())
+        model.setAttr('UB', family, [data["other"][limit]] * len(family))
+    variables['k'].LB = fleet_lower_bound(data)
+    variables['k'].UB = len(data["vertices_prime"])
+
+
+def add_strengthening(model, data, variables, symmetry=False):
+    """
+    Adds the valid inequalities of the strengthened formulation and returns
+    them grouped per family:
+
+    - capacity_lower: y_ij >= N_i * x_ij, the load already picked up at i.
+    - two_cycle: x_ij + x_ji <= 1 for every pair of customers.
+    - with symmetry (only valid when distances and times are symmetric),
+      first_* families that carry the first customer of every route along
+      it as label f and require f <= i when i returns to the depot, so only
+      the direction with first customer <= last customer is feasible.
+    """
+    vertices = data["vertices"]
+    arcs = data["arcs"]
+    V_prime = list(data["vertices_prime"].keys())
+    x = variables["x"]
+    y = variables["y"]
+
+    constrs = {'capacity_lower': {}, 'two_cycle': {}}
+
+    for i, j in arcs:
+        if i != 0:
+            constrs['capacity_lower'][i, j] = model.addConstr(
+                y[i, j] >= vertices[i]['N_i'] * x[i, j],
+                name=f"capacity_lower_{i}_{j}"
+            )
+        if i != 0 and j != 0 and i < j and (j, i) in arcs:
+            constrs['two_cycle'][i, j] = model.addConstr(
+                x[i, j] + x[j, i] <= 1,
+                name=f"two_cycle_{i}_{j}"
+            )
+
+    if not symmetry:
+        return constrs
+
+    # Route labels: f_j >= j if j is the first customer and f_j >= f_i along
+    # every used arc (i, j), so f_i >= first customer at the last customer i
+    M = max(V_prime)
+    f = variables['first'] = {
+        i: model.addVar(lb=0, ub=M, name=f"first_{i}") for i in V_prime
+    }
+    constrs.update({'first_start': {}, 'first_carry': {}, 'first_end': {}})
+    for i, j in arcs:
+        if i == 0:
+            constrs['first_start'][i, j] = model.addConstr(
+                f[j] >= j * x[i, j],
+                name=f"first_start_0_{j}"
+            )
+        elif j != 0:
+            constrs['first_carry'][i, j] = model.addConstr(
+                f[j] >= f[i] - M * (1 - x[i, j]),
+                name=f"first_carry_{i}_{j}"
+            )
+        else:
+            constrs['first_end'][i, j] = model.addConstr(
+                f[i] <= i + M * (1 - x[i, j]),
+                name=f"first_end_{i}_0"
+            )
+
+    return constrs
+
+
+def apply_coefficients(model, data, variables, constrs, families, strengthen=False):
+    """
+    Sets the coefficients on x of the given big-M families from
+    arc_coefficients.
+    """
+    x = variables["x"]
+    coefficients = arc_coefficients(data, strengthen)
+    for family in families:
+        for arc, constr in constrs[family].items():
+            model.chgCoeff(constr, x[arc], -coefficients[family][arc])
+
+
+def update_parameter(model, data, variables, constrs, parameter, strengthen=False):
+    """
+    Re-applies the coefficients on x that depend on parameter ('Q', 'T_bar',
+    'D_bar' or 'S_i') from the current values in data, so the model built by
+    add_constraints or add_matrix_constraints can be re-solved without
+    rebuilding it. In the strengthened formulation every big-M family and
+    the variable bounds depend on all parameters, so all are re-applied.
+    """
+    if parameter not in PARAMETER_FAMILIES:
+        raise ValueError(f"Unknown parameter: {parameter}")
+
+    if parameter == 'S_i':
+        x = variables["x"]
+        arcs = data["arcs"]
+        vertices = data["vertices"]
+        graph = get_graph_index(data)
+
+        # (8) Travel time flow conservation
+        for i, constr in constrs['time_flow'].items():
+            for a in graph.out_arcs(i):
+                model.chgCoeff(constr, x[a], -(arcs[a]['time'] + vertices[i]['S_i']))
+
+    if strengthen:
+        apply_coefficients(model, data, variables, constrs, BIG_M_FAMILIES, strengthen)
+        apply_bounds(model, data, variables)
+    else:
+        families = [family for family in PARAMETER_FAMILIES[parameter] if family in BIG_M_FAMILIES]
+        apply_coefficients(model, data, variables, constrs, families)
@@ -0,0 +1,316 @@
+"""
+Decomposition File
+
+Cluster-first, route-second mode for large datasheets. The customers are
+split into clusters (sweep on coordinates or k-medoids on the distance
+matrix), every cluster is solved as its own reduced MILPModel in a worker
+process, and a repair pass re-solves the routes along the cluster borders.
+"""
+
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from graph_index import dense_matrices
+from main import MILPModel
+from routes import evaluate_routes, decode_routes
+
+
+def subset_data(data, customers):
+    """
+    Returns a data dictionary with only the depot, the given customers and
+    the arcs between them.
+    """
+    keep = {0, *customers}
+    return {
+        'vertices': {v: dict(data['vertices'][v]) for v in data['vertices'] if v in keep},
+        'vertices_prime': {v: dict(data['vertices_prime'][v]) for v in customers},
+        'arcs': {(i, j): dict(arc) for (i, j), arc in data['arcs'].items()
+                 if i in keep and j in keep},
+        'other': dict(data['other']),
+    }
+
+
+def has_coordinates(data):
+    return all('x' in values and 'y' in values for values in data['vertices'].values())
+
+
+def sweep_clusters(data, n_clusters):
+    """
+    Sorts the customers by their angle around the depot and cuts the sweep
+    into n_clusters sectors with about the same number of packages.
+    """
+    vertices = data['vertices']
+    depot = vertices[0]
+    customers = sorted(
+        data['vertices_prime'],
+        key=lambda v: math.atan2(vertices[v]['y'] - depot['y'], vertices[v]['x'] - depot['x'])
+    )
+    total = sum(vertices[v]['N_i'] for v in customers)
+    clusters = [[] for _ in range(n_clusters)]
+    load = 0
+    for v in customers:
+        clusters[min(int(load * n_clusters / total), n_clusters - 1) if total else 0].append(v)
+        load += vertices[v]['N_i']
+    return [cluster for cluster in clusters if cluster]
+
+
+def kmedoids_clusters(data, n_clusters, seed=0, max_iterations=100):
+    """
+    k-medoids on the symmetrised customer distance matrix: customers are
+    assigned to their nearest medoid and every medoid moves to the member
+    with the smallest total distance to its cluster, until nothing changes.
+    Medoids are seeded k-medoids++ style.
+    """
+    order, D, _ = dense_matrices(data)
+    customers = np.array(order[1:])
+    distance = (D + D.T)[1:, 1:] / 2
+    np.fill_diagonal(distance, 0)
+    # Pairs without arcs in either direction count as far apart
+    distance = np.where(np.isfinite(distance), distance, distance[np.isfinite(distance)].max() * 10)
+    n_clusters = min(n_clusters, len(customers))
+
+    rng = np.random.default_rng(seed)
+    medoids = [int(rng.integers(len(customers)))]
+    while len(medoids) < n_clusters:
+        nearest = distance[:, medoids].min(axis=1) ** 2
+        if nearest.sum() == 0:
+            break
+        medoids.append(int(rng.choice(len(customers), p=nearest / nearest.sum())))
+    medoids = np.array(medoids)
+
+    for _ in range(max_iterations):
+        assignment = np.argmin(distance[:, medoids], axis=1)
+        new_medoids = medoids.copy()
+        for c in range(len(medoids)):
+            members = np.flatnonzero(assignment == c)
+            if len(members):
+                within = distance[np.ix_(members, members)].sum(axis=1)
+                new_medoids[c] = members[np.argmin(within)]
+        if np.array_equal(new_medoids, medoids):
+            break
+        medoids = new_medoids
+
+    assignment = np.argmin(distance[:, medoids], axis=1)
+    clusters = [customers[assignment == c].tolist() for c in range(len(medoids))]
+    return [cluster for cluster in clusters if cluster]
+
+
+def solve_subproblem(data, params=None, routes=None):
+    """
+    Solves the reduced MILPModel of a data subset, starting from the given
+    routes or else from the heuristic. Returns (status, routes): 1 with the
+    routes of the best solution found (optimal or not), 2 with None if the
+    subset is infeasible and 0 with None if the solve found no solution.
+    """
+    model = MILPModel(params=params)
+    model.data_setup(data)
+    model.setup_contraints()
+    if routes is not None:
+        model.set_mip_start(routes)
+    model.optimize_model(heuristic_start=routes is None)
+
+    if model.status == 2:
+        return 2, None
+    if model.model.SolCount == 0:
+        return 0, None
+    arcs_used = [a for a, var in model.variables['x'].items() if var.X > 0.5]
+    routes, cycles = decode_routes(arcs_used)
+    return (1, routes) if not cycles else (0, None)
+
+
+class Decomposition():
+    """
+    Cluster-first decomposition of one instance.
+
+    method is 'sweep' (needs 'x'/'y' on every vertex) or 'kmedoids'; by
+    default sweep is used when coordinates are available. Without n_clusters
+    the customers are split into clusters of about cluster_size. Every
+    cluster is solved in one of workers processes with the Gurobi params
+    (e.g. {'TimeLimit': 60, 'Threads': 1}). The repair pass then re-solves,
+    for pairs of neighbouring clusters, the routes that serve customers with
+    one of their neighbours nearest customers in the other cluster.
+    """
+    def __init__(self, data, n_clusters=None, method=None, workers=None, params=None,
+                 cluster_size=15, neighbours=5, repair_rounds=1, seed=0):
+        if method not in (None, 'sweep', 'kmedoids'):
+            raise ValueError(f"Unknown clustering method: {method}")
+        if method == 'sweep' and not has_coordinates(data):
+            raise ValueError("Sweep clustering needs 'x' and 'y' on every vertex")
+        self.data = data
+        self.method = method or ('sweep' if has_coordinates(data) else 'kmedoids')
+        self.n_clusters = n_clusters or max(1, math.ceil(len(data['vertices_prime']) / cluster_size))
+        self.workers = workers or os.cpu_count() or 1
+        self.params = params
+        self.neighbours = neighbours
+        self.repair_rounds = repair_rounds
+        self.seed = seed
+        self.status = 0
+
+
+    def cluster(self):
+        if self.method == 'sweep':
+            return sweep_clusters(self.data, self.n_clusters)
+        return kmedoids_clusters(self.data, self.n_clusters, self.seed)
+
+
+    def solve_parallel(self, tasks):
+        """
+        Solves the (customers, routes) tasks in the process pool and returns
+        their (status, routes) in task order.
+        """
+        subsets = [subset_data(self.data, customers) for customers, _ in tasks]
+        starts = [None if routes is None else dict(enumerate(routes, start=1)) for _, routes in tasks]
+        if self.workers <= 1 or len(tasks) <= 1:
+            return [solve_subproblem(s, self.params, r) for s, r in zip(subsets, starts)]
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(tasks))) as pool:
+            return list(pool.map(solve_subproblem, subsets, [self.params] * len(tasks), starts))
+
+
+    def border_pairs(self, cluster_of, skip=()):
+        """
+        Returns disjoint pairs of neighbouring clusters that are not in skip,
+        most shared border customers first, with the customers on their
+        common border.
+        """
+        order, D, _ = dense_matrices(self.data)
+        distance = (D + D.T)[1:, 1:]
+        np.fill_diagonal(distance, 0)
+        nearest = np.argsort(distance, axis=1)[:, 1:self.neighbours + 1]
+
+        border = {}
+        for p, v in enumerate(order[1:]):
+            for q in nearest[p]:
+                w = order[q + 1]
+                if cluster_of[v] != cluster_of[w]:
+                    pair = tuple(sorted((cluster_of[v], cluster_of[w])))
+                    border.setdefault(pair, set()).update((v, w))
+
+        pairs, used = [], set()
+        for pair, customers in sorted(border.items(), key=lambda item: -len(item[1])):
+            if pair not in skip and used.isdisjoint(pair):
+                pairs.append((pair, customers))
+                used.update(pair)
+        return pairs
+
+
+    def route_clusters(self, routes, cluster_of):
+        """
+        Returns the cluster membership of the customers after a repair: all
+        customers of a route belong to the cluster that holds most of them,
+        so every route is in exactly one cluster.
+        """
+        membership = {}
+        for route in routes:
+            counts = {}
+            for v in route[1:-1]:
+                counts[cluster_of[v]] = counts.get(cluster_of[v], 0) + 1
+            cluster = min(counts, key=lambda c: (-counts[c], c))
+            membership.update((v, cluster) for v in route[1:-1])
+        return membership
+
+
+    def repair(self, routes, pairs):
+        """
+        One boundary repair round. The routes through the border customers of
+        each pair of clusters are re-solved together, starting from their
+        current routes, and only replaced if that lowers the distance. A route
+        is given to at most one pair per round.
+        """
+        tasks, taken = [], set()
+        for _, border in pairs:
+            involved = [r for r, route in enumerate(routes)
+                        if r not in taken and border.intersection(route[1:-1])]
+            taken.update(involved)
+            customers = [v for r in involved for v in routes[r][1:-1]]
+            tasks.append((customers, [routes[r] for r in involved]))
+
+        removed, added = set(), []
+        for (customers, involved), (_, new_routes) in zip(tasks, self.solve_parallel(tasks)):
+            if new_routes is None:
+                continue
+            old = evaluate_routes(self.data, dict(enumerate(involved))).obj
+            new = evaluate_routes(self.data, dict(enumerate(new_routes))).obj
+            if new < old - 1e-6:
+                removed.update(id(route) for route in involved)
+                added.extend(new_routes)
+
+        return [route for route in routes if id(route) not in removed] + added
+
+
+    def check_coverage(self, routes):
+        """
+        Raises a RuntimeError unless the routes visit every customer exactly
+        once.
+        """
+        visited = sorted(v for route in routes for v in route[1:-1])
+        if visited != sorted(self.data['vertices_prime']):
+            raise RuntimeError("The decomposition routes do not visit every customer exactly once")
+
+
+    def solve(self):
+        """
+        Clusters, solves the clusters in parallel and repairs the borders.
+        Returns (obj, k, VMT, VTT, routes) like analyze_results, or None if
+        some cluster has no solution. status is 2 if a cluster is proven
+        infeasible and 0 if a cluster found no solution within its limits.
+        """
+        clusters = self.cluster()
+        print(f"####   Decomposition into {len(clusters)} clusters ({self.method}): "
+              f"{[len(cluster) for cluster in clusters]}")
+
+        results = self.solve_parallel([(cluster, None) for cluster in clusters])
+        if any(status == 2 for status, _ in results):
+            print("Model is infeasible")
+            self.status = 2
+            return None
+        if any(routes is None for _, routes in results):
+            print("No solution found for some cluster")
+            self.status = 0
+            return None
+
+        routes = [route for _, result in results for route in result]
+        cluster_of = {v: c for c, cluster in enumerate(clusters) for v in cluster}
+        repaired = set()
+        for _ in range(self.repair_rounds):
+            # Repaired routes can span two clusters, so the membership follows
+            # the current routes. Every round repairs other cluster pairs than
+            # the rounds before
+            cluster_of = self.route_clusters(routes, cluster_of)
+            pairs = self.border_pairs(cluster_of, repaired)
+            if not pairs:
+                break
+            repaired.update(pair for pair, _ in pairs)
+            before = evaluate_routes(self.data, dict(enumerate(routes))).obj
+            routes = self.repair(routes, pairs)
+            after = evaluate_routes(self.data, dict(enumerate(routes))).obj
+            print(f"####   Boundary repair of {len(pairs)} cluster pairs: {before} -> {after}")
+
+        self.check_coverage(routes)
+        self.status = 1
+        return evaluate_routes(self.data, dict(enumerate(routes, start=1)))
+
+
+def solve_decomposition(data, **kwargs):
+    """
+    Runs the decomposition on a data dictionary and returns (obj, k, VMT,
+    VTT, routes), or None if some cluster is infeasible.
+    """
+    return Decomposition(data, **kwargs).solve()
+
+
+if __name__ == "__main__":
+    from instance_cache import load_instance
+
+    result = solve_decomposition(load_instance('datasheet.xlsx'),
+                                 params={'OutputFlag': 0, 'TimeLimit': 60, 'Threads': 1})
+    if result is not None:
+        obj, k, VMT, VTT, routes = result
+        print(f"####   The model finished with objective value: {obj}")
+        print(f"####   The amount of vehicles used: {k}")
+        print(f"####   VMT: {VMT}")
+        print(f"####   VTT: {VTT}")
+        for key, value in routes.items():
+            print(f"####   Route {key}: {value}")
@@ -0,0 +1,137 @@
+"""
+Graph Index File
+
+Holds a compact index of the arc set that is built once from data['arcs'],
+so the constraints and the route decoding can look up the arcs around a
+vertex without scanning the full arc list.
+"""
+
+import numpy as np
+import scipy.sparse as sp
+
+
+class GraphIndex():
+    """
+    CSR-style adjacency index over the arcs.
+
+    Arcs are numbered in the order of data['arcs']. For every vertex the ids
+    of its outgoing arcs are stored in out_idx[out_ptr[p]:out_ptr[p + 1]] and
+    its incoming arcs in in_idx[in_ptr[p]:in_ptr[p + 1]], where p is the
+    position of the vertex in self.vertices. arc_id is the hashed arc set.
+    """
+    def __init__(self, vertices, arcs):
+        self.source = arcs
+        self.vertices = list(vertices)
+        self.arcs = list(arcs)
+        self.position = {v: p for p, v in enumerate(self.vertices)}
+        self.arc_id = {arc: e for e, arc in enumerate(self.arcs)}
+
+        n_vertices = len(self.vertices)
+        self.tail = np.array([self.position[i] for (i, j) in self.arcs], dtype=np.int64)
+        self.head = np.array([self.position[j] for (i, j) in self.arcs], dtype=np.int64)
+
+        # Sort the arc ids by tail (head) and count them per vertex
+        self.out_idx = np.argsort(self.tail, kind='stable')
+        self.in_idx = np.argsort(self.head, kind='stable')
+        self.out_ptr = np.zeros(n_vertices + 1, dtype=np.int64)
+        self.in_ptr = np.zeros(n_vertices + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.tail, minlength=n_vertices), out=self.out_ptr[1:])
+        np.cumsum(np.bincount(self.head, minlength=n_vertices), out=self.in_ptr[1:])
+
+        # Plain Python lists per vertex for the hot loops in the constraints
+        self._out = [
+            [self.arcs[e] for e in self.out_idx[self.out_ptr[p]:self.out_ptr[p + 1]]]
+            for p in range(n_vertices)
+        ]
+        self._in = [
+            [self.arcs[e] for e in self.in_idx[self.in_ptr[p]:self.in_ptr[p + 1]]]
+            for p in range(n_vertices)
+        ]
+
+
+    def __contains__(self, arc):
+        return arc in self.arc_id
+
+
+    def __len__(self):
+        return len(self.arcs)
+
+
+    def out_arcs(self, v):
+        """
+        Returns the arcs (v, j) leaving vertex v.
+        """
+        return self._out[self.position[v]]
+
+
+    def in_arcs(self, v):
+        """
+        Returns the arcs (i, v) entering vertex v.
+        """
+        return self._in[self.position[v]]
+
+
+    def successors(self, v):
+        """
+        Returns the vertices j with an arc (v, j).
+        """
+        return [j for (_, j) in self._out[self.position[v]]]
+
+
+    def predecessors(self, v):
+        """
+        Returns the vertices i with an arc (i, v).
+        """
+        return [i for (i, _) in self._in[self.position[v]]]
+
+
+    def incidence(self, rows):
+        """
+        Returns the sparse out- and in-incidence matrices (len(rows) x arcs)
+        restricted to the given vertices: A_out[r, e] = 1 if arc e leaves
+        rows[r] and A_in[r, e] = 1 if arc e enters rows[r].
+        """
+        shape = (len(rows), len(self.arcs))
+        matrices = []
+        for ptr, idx in ((self.out_ptr, self.out_idx), (self.in_ptr, self.in_idx)):
+            positions = [self.position[v] for v in rows]
+            counts = [ptr[p + 1] - ptr[p] for p in positions]
+            cols = np.concatenate(
+                [idx[ptr[p]:ptr[p + 1]] for p in positions] or [np.zeros(0, dtype=np.int64)]
+            )
+            row_ids = np.repeat(np.arange(len(rows)), counts)
+            matrices.append(sp.csr_matrix((np.ones(len(cols)), (row_ids, cols)), shape=shape))
+        return matrices[0], matrices[1]
+
+
+def get_graph_index(data):
+    """
+    Returns the graph index stored in data['graph'], (re)building it when it
+    is missing or was built for a different (or since changed) arc dictionary.
+    """
+    graph = data.get('graph')
+    if (graph is None or graph.source is not data['arcs']
+            or len(graph) != len(data['arcs'])):
+        graph = GraphIndex(data['vertices'], data['arcs'])
+        data['graph'] = graph
+    return graph
+
+
+def dense_matrices(data):
+    """
+    Returns (order, D, T): the vertices with the depot first and the dense
+    distance and time matrices over that order, with inf for missing arcs.
+    """
+    order = [0] + [v for v in data['vertices'] if v != 0]
+    position = {v: p for p, v in enumerate(order)}
+    arcs = data['arcs']
+
+    n_arcs = len(arcs)
+    tail = np.fromiter((position[i] for (i, j) in arcs), dtype=np.int64, count=n_arcs)
+    head = np.fromiter((position[j] for (i, j) in arcs), dtype=np.int64, count=n_arcs)
+
+    D = np.full((len(order), len(order)), np.inf)
+    T = np.full((len(order), len(order)), np.inf)
+    D[tail, head] = np.fromiter((a['distance'] for a in arcs.values()), dtype=float, count=n_arcs)
+    T[tail, head] = np.fromiter((a['time'] for a in arcs.values()), dtype=float, count=n_arcs)
+    return order, D, T
@@ -0,0 +1,198 @@
+"""
+Heuristics File
+
+Construction heuristic for the routing problem: Clarke-Wright savings
+followed by a cheapest-insertion repair. The routes can be used on their own
+as a fast approximate answer or as a MIP start for MILPModel.
+"""
+
+from routes import evaluate_routes, route_distance, route_feasible, route_load, route_time
+
+
+class _Route():
+    """
+    A route under construction: the customer sequence (without the depot)
+    and its load, time and distance.
+    """
+    def __init__(self, customers, load, time, distance):
+        self.customers = customers
+        self.load = load
+        self.time = time
+        self.distance = distance
+
+
+def _singleton(data, i):
+    """
+    Returns the route 0 -> i -> 0, or None if it is not feasible.
+    """
+    arcs = data['arcs']
+    other = data['other']
+    if (0, i) not in arcs or (i, 0) not in arcs:
+        return None
+    route = _Route(
+        [i],
+        data['vertices'][i]['N_i'],
+        arcs[0, i]['time'] + data['vertices'][i]['S_i'] + arcs[i, 0]['time'],
+        arcs[0, i]['distance'] + arcs[i, 0]['distance'],
+    )
+    if route.load > other['Q'] or route.time > other['T_bar'] or route.distance > other['D_bar']:
+        return None
+    return route
+
+
+def clarke_wright(data):
+    """
+    Clarke-Wright savings on the directed arcs. Starts from one route per
+    customer and merges the route ending in i with the route starting in j
+    in order of decreasing saving D_i0 + D_0j - D_ij, as long as the merged
+    route respects Q, T_bar and D_bar.
+
+    Returns (routes, unassigned) where routes is a list of _Route and
+    unassigned holds the customers without a feasible single-customer route.
+    """
+    arcs = data['arcs']
+    other = data['other']
+
+    route_of = {}
+    unassigned = []
+    for i in data['vertices_prime']:
+        route = _singleton(data, i)
+        if route is None:
+            unassigned.append(i)
+        else:
+            route_of[i] = route
+
+    savings = sorted(
+        (
+            (arcs[i, 0]['distance'] + arcs[0, j]['distance'] - arcs[i, j]['distance'], i, j)
+            for (i, j) in arcs
+            if i in route_of and j in route_of
+        ),
+        reverse=True,
+    )
+
+    for saving, i, j in savings:
+        if saving <= 0:
+            break
+        first, second = route_of[i], route_of[j]
+
+        # i must end one route and j must start another one
+        if first is second or first.customers[-1] != i or second.customers[0] != j:
+            continue
+
+        load = first.load + second.load
+        time = first.time + second.time - arcs[i, 0]['time'] - arcs[0, j]['time'] + arcs[i, j]['time']
+        distance = (first.distance + second.distance
+                    - arcs[i, 0]['distance'] - arcs[0, j]['distance'] + arcs[i, j]['distance'])
+        if load > other['Q'] or time > other['T_bar'] or distance > other['D_bar']:
+            continue
+
+        merged = _Route(first.customers + second.customers, load, time, distance)
+        for customer in merged.customers:
+            route_of[customer] = merged
+
+    routes = list({id(route): route for route in route_of.values()}.values())
+    return routes, unassigned
+
+
+def cheapest_insertion(data, routes, customers):
+    """
+    Inserts each customer at the position with the smallest extra distance
+    over all routes that stay feasible, opening a new route when no position
+    fits. Returns the customers that could not be inserted at all.
+    """
+    arcs = data['arcs']
+    other = data['other']
+    vertices = data['vertices']
+    failed = []
+
+    for c in customers:
+        N_c = vertices[c]['N_i']
+        S_c = vertices[c]['S_i']
+        best = None
+        for route in routes:
+            if route.load + N_c > other['Q']:
+                continue
+            sequence = [0] + route.customers + [0]
+            for p in range(len(sequence) - 1):
+                prev, nxt = sequence[p], sequence[p + 1]
+                if (prev, c) not in arcs or (c, nxt) not in arcs:
+                    continue
+                extra_distance = (arcs[prev, c]['distance'] + arcs[c, nxt]['distance']
+                                  - arcs[prev, nxt]['distance'])
+                extra_time = arcs[prev, c]['time'] + S_c + arcs[c, nxt]['time'] - arcs[prev, nxt]['time']
+                if (route.time + extra_time > other['T_bar']
+                        or route.distance + extra_distance > other['D_bar']):
+                    continue
+                if best is None or extra_distance < best[0]:
+                    best = (extra_distance, extra_time, route, p)
+
+        if best is None:
+            route = _singleton(data, c)
+            if route is None:
+                failed.append(c)
+            else:
+                routes.append(route)
+            continue
+
+        extra_distance, extra_time, route, p = best
+        route.customers.insert(p, c)
+        route.load += N_c
+        route.time += extra_time
+        route.distance += extra_distance
+
+    return failed
+
+
+def construct_routes(data):
+    """
+    Runs Clarke-Wright savings and repairs the customers it could not place
+    with cheapest insertion. Returns the routes in the analyze_results format,
+    or None if some customer cannot be served.
+    """
+    routes, unassigned = clarke_wright(data)
+    if cheapest_insertion(data, routes, unassigned):
+        return None
+    return {
+        route_id: [0] + route.customers + [0]
+        for route_id, route in enumerate(routes, start=1)
+    }
+
+
+def repair_routes(data, routes, customers=()):
+    """
+    Turns the routes of a previous solution into a feasible route set for the
+    changed data. Customers no longer in the data and the given customers
+    are taken out, the routes that are still infeasible lose customers from
+    their end until they fit, and everything taken out (that still exists)
+    is put back with cheapest insertion. Returns the routes in the
+    analyze_results format, or None if some customer cannot be served.
+    """
+    customers = set(customers)
+    repaired, reinsert = [], [c for c in customers if c in data['vertices_prime']]
+    for route in routes.values():
+        kept = [v for v in route[1:-1] if v in data['vertices_prime'] and v not in customers]
+        while kept and not route_feasible(data, [0] + kept + [0]):
+            reinsert.append(kept.pop())
+        if kept:
+            route = [0] + kept + [0]
+            repaired.append(_Route(kept, route_load(data, route), route_time(data, route),
+                                   route_distance(data, route)))
+
+    if cheapest_insertion(data, repaired, reinsert):
+        return None
+    return {
+        route_id: [0] + route.customers + [0]
+        for route_id, route in enumerate(repaired, start=1)
+    }
+
+
+def solve_heuristic(data):
+    """
+    Returns (obj, k, VMT, VTT, routes) of the heuristic solution, like
+    analyze_results, or None if the heuristic found no feasible route set.
+    """
+    routes = construct_routes(data)
+    if routes is None:
+        return None
+    return evaluate_routes(data, routes)
@@ -0,0 +1,294 @@
+"""
+Instance Cache File
+
+Compiles a datasheet workbook into NumPy arrays that are stored on disk next
+to the workbook, keyed by the SHA-256 of the workbook's bytes and the
+COMPILE_VERSION of the format. Later loads read the binary arrays instead
+of parsing the Excel file again, until the workbook or the format changes.
+
+A workbook without the NL_arcs sheet is compiled from the vertex coordinates
+instead: Euclidean distances from x and y (in miles) or great-circle
+distances from lat and lon, with travel times from the speed in the Other
+sheet or a Speed sheet of distance bands (see travel_times). Such a workbook
+grows linearly with the number of vertices instead of quadratically.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import zipfile
+from xml.etree import ElementTree
+
+import numpy as np
+import pandas as pd
+
+
+CACHE_DIR = ".instance_cache"
+# Increase whenever compile_workbook changes what it stores, so older caches
+# are compiled again instead of reused
+COMPILE_VERSION = 2
+VERTEX_ARRAYS = ('vertex', 'N_i', 'S_i')
+COORDINATE_ARRAYS = ('x', 'y')
+ARC_ARRAYS = ('from', 'to', 'distance', 'time')
+
+EARTH_RADIUS = 3958.8       # miles
+DEFAULT_SPEED = 30          # mph, the T_ij = 2 D_ij of datasheet.xlsx
+
+
+def file_hash(file_path):
+    """
+    Returns the SHA-256 hex digest of the file contents.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def sheet_names(file_path):
+    """
+    Returns the sheet names of the workbook from its workbook.xml, without
+    parsing the sheets.
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        root = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    return [sheet.get('name') for sheet in root.iter() if sheet.tag.endswith('}sheet')]
+
+
+def _compact(values):
+    """
+    Converts a column to a numeric array, using int64 when every value is
+    integral. Non-numeric entries (the '-' placeholders of the depot) become 0.
+    """
+    return _integral(pd.to_numeric(values, errors='coerce').fillna(0).to_numpy(dtype=float))
+
+
+def _integral(values):
+    """
+    Returns the float array as int64 when every value is integral.
+    """
+    if np.all(values == np.round(values)):
+        return values.astype(np.int64)
+    return values
+
+
+def euclidean_matrix(x, y):
+    """
+    Returns the matrix of Euclidean distances between the points (x, y).
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    return np.hypot(x[:, None] - x[None, :], y[:, None] - y[None, :])
+
+
+def haversine_matrix(lat, lon):
+    """
+    Returns the matrix of great-circle distances in miles between the points
+    given in degrees.
+    """
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    a = (np.sin((lat[:, None] - lat[None, :]) / 2) ** 2
+         + np.cos(lat[:, None]) * np.cos(lat[None, :]) * np.sin((lon[:, None] - lon[None, :]) / 2) ** 2)
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def travel_times(distance, speed_profile=None):
+    """
+    Returns the travel times in minutes for the distances in miles. The
+    speed profile is a list of (distance, mph) bands: an arc drives at the
+    speed of the first band whose distance it does not exceed, and at the
+    speed of the last band beyond that. A single number is one speed for
+    every arc.
+    """
+    if speed_profile is None:
+        speed_profile = DEFAULT_SPEED
+    if np.isscalar(speed_profile):
+        return distance * 60 / speed_profile
+    limits, speeds = (np.array(column, dtype=float) for column in zip(*sorted(speed_profile)))
+    band = np.minimum(np.searchsorted(limits, distance), len(speeds) - 1)
+    return distance * 60 / speeds[band]
+
+
+def nearest_mask(distance, depot, k_nearest):
+    """
+    Returns the mask of the arcs among the k_nearest outgoing or incoming
+    customer arcs of every customer, plus every arc from and to the depot
+    (the rule of preprocessing.nearest_neighbour_arcs).
+    """
+    n = len(distance)
+    customer = np.ones(n, dtype=bool)
+    customer[depot] = False
+    masked = np.where(np.eye(n, dtype=bool) | ~customer[None, :] | ~customer[:, None], np.inf, distance)
+    keep = np.zeros((n, n), dtype=bool)
+    if k_nearest > 0 and n > 2:
+        k = min(k_nearest, n - 2)
+        rows = np.arange(n)[:, None]
+        keep[rows, np.argpartition(masked, k - 1, axis=1)[:, :k]] = True
+        keep[np.argpartition(masked, k - 1, axis=0)[:k, :], rows.T] = True
+        keep &= np.isfinite(masked)
+    keep[depot, :] = True
+    keep[:, depot] = True
+    return keep
+
+
+def coordinate_arcs(vertex, df_vertices, speed_profile=None, k_nearest=None):
+    """
+    Returns the arc arrays of the complete directed graph (or its k nearest
+    neighbour arcs) on the vertex coordinates. Distances and times are
+    rounded to whole miles and minutes, at least 1, as the model uses integer
+    flow variables.
+    """
+    if 'lat' in df_vertices and 'lon' in df_vertices:
+        distance = haversine_matrix(df_vertices['lat'], df_vertices['lon'])
+    else:
+        distance = euclidean_matrix(df_vertices['x'], df_vertices['y'])
+    distance = np.maximum(1, np.round(distance))
+    time = np.maximum(1, np.round(travel_times(distance, speed_profile)))
+
+    mask = ~np.eye(len(vertex), dtype=bool)
+    if k_nearest is not None:
+        mask &= nearest_mask(distance, np.flatnonzero(vertex == 0), k_nearest)
+    tail, head = np.nonzero(mask)
+    return {
+        'from': vertex[tail],
+        'to': vertex[head],
+        'distance': _integral(distance[tail, head]),
+        'time': _integral(time[tail, head]),
+    }
+
+
+def compile_workbook(file_path, k_nearest=None):
+    """
+    Parses the workbook once and returns (arrays, other) where arrays maps
+    the names in VERTEX_ARRAYS and ARC_ARRAYS (and COORDINATE_ARRAYS if the
+    vertices have coordinates) to NumPy arrays and other holds the scalar
+    parameters Q, D_bar and T_bar. Without an NL_arcs sheet the arcs are
+    computed from the coordinates, restricted to the k_nearest neighbours of
+    every customer if given.
+    """
+    workbook = pd.ExcelFile(file_path, engine='openpyxl')
+    names = [name for name in ('NL_vertices', 'NL_arcs', 'Other', 'Speed') if name in workbook.sheet_names]
+    sheets = pd.read_excel(workbook, sheet_name=names)
+    df_vertices = sheets['NL_vertices']
+    df_other = sheets['Other']
+
+    arrays = {
+        'vertex': _compact(df_vertices['Vertex']),
+        'N_i': _compact(df_vertices['N_i']),
+        'S_i': _compact(df_vertices['S_i']),
+    }
+    for name, column in zip(COORDINATE_ARRAYS, ('lon', 'lat') if 'lat' in df_vertices else ('x', 'y')):
+        if column in df_vertices:
+            arrays[name] = pd.to_numeric(df_vertices[column]).to_numpy(dtype=float)
+
+    if 'NL_arcs' in sheets:
+        df_arcs = sheets['NL_arcs']
+        arrays.update({
+            'from': _compact(df_arcs['From']),
+            'to': _compact(df_arcs['To']),
+            'distance': _compact(df_arcs['D_ij']),
+            'time': _compact(df_arcs['T_ij']),
+        })
+    else:
+        if 'Speed' in sheets:
+            speed_profile = list(zip(sheets['Speed']['Distance'], sheets['Speed']['Speed']))
+        elif 'Speed' in df_other:
+            speed_profile = float(df_other['Speed'].iloc[0])
+        else:
+            speed_profile = None
+        arrays.update(coordinate_arcs(arrays['vertex'], df_vertices, speed_profile, k_nearest))
+
+    other = {
+        name: _compact(df_other[name].iloc[:1])[0].item()
+        for name in ('Q', 'D_bar', 'T_bar')
+    }
+    return arrays, other
+
+
+def write_compiled(cache_path, arrays, other):
+    """
+    Writes the compiled arrays to cache_path. The files are written to a
+    temporary directory first so a half-written cache is never picked up.
+    """
+    tmp_path = f"{cache_path}.tmp{os.getpid()}"
+    os.makedirs(tmp_path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+    with open(os.path.join(tmp_path, 'other.json'), 'w') as f:
+        json.dump(other, f)
+
+    try:
+        os.rename(tmp_path, cache_path)
+    except OSError:
+        # Another process compiled the same workbook first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def read_compiled(cache_path):
+    """
+    Reads the compiled arrays in cache_path. They are read whole, as
+    build_data turns every entry into Python objects anyway.
+    """
+    arrays = {
+        name: np.load(os.path.join(cache_path, f"{name}.npy"))
+        for name in VERTEX_ARRAYS + COORDINATE_ARRAYS + ARC_ARRAYS
+        if os.path.exists(os.path.join(cache_path, f"{name}.npy"))
+    }
+    with open(os.path.join(cache_path, 'other.json')) as f:
+        other = json.load(f)
+    return arrays, other
+
+
+def build_data(arrays, other):
+    """
+    Turns the compiled arrays into the data dictionary used by MILPModel.
+    """
+    vertex = arrays['vertex'].tolist()
+    N_i = arrays['N_i'].tolist()
+    S_i = arrays['S_i'].tolist()
+
+    data = {
+        'vertices': {v: {'N_i': n, 'S_i': s} for v, n, s in zip(vertex, N_i, S_i)},
+        'vertices_prime': {},
+        'arcs': {},
+        'other': dict(other),
+    }
+    if all(name in arrays for name in COORDINATE_ARRAYS):
+        for v, x, y in zip(vertex, arrays['x'].tolist(), arrays['y'].tolist()):
+            data['vertices'][v].update(x=x, y=y)
+    data['vertices_prime'] = {
+        v: dict(values) for v, values in data['vertices'].items() if v != 0
+    }
+    data['arcs'] = {
+        (i, j): {'distance': d, 'time': t}
+        for i, j, d, t in zip(arrays['from'].tolist(), arrays['to'].tolist(),
+                              arrays['distance'].tolist(), arrays['time'].tolist())
+    }
+    return data
+
+
+def load_instance(file_path, cache_dir=None, k_nearest=None):
+    """
+    Returns the data dictionary for the workbook, compiling it into the cache
+    on the first load. Set cache_dir to False to always parse the workbook.
+    k_nearest only applies to workbooks compiled from coordinates (see
+    compile_workbook), so only their cache is keyed by it.
+    """
+    if cache_dir is False:
+        return build_data(*compile_workbook(file_path, k_nearest))
+
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(file_path)), CACHE_DIR)
+    key = f"{file_hash(file_path)}-v{COMPILE_VERSION}"
+    if k_nearest is not None and 'NL_arcs' not in sheet_names(file_path):
+        key += f"-k{k_nearest}"
+    cache_path = os.path.join(cache_dir, key)
+
+    if not os.path.isdir(cache_path):
+        os.makedirs(cache_dir, exist_ok=True)
+        write_compiled(cache_path, *compile_workbook(file_path, k_nearest))
+
+    return build_data(*read_compiled(cache_path))
@@ -0,0 +1,130 @@
+"""
+Instance Generator File
+
+Generates synthetic instances in the datasheet schema (NL_vertices, NL_arcs
+and Other sheets) so build and solve times can be measured at any size. The
+values follow datasheet.xlsx: distances in miles on a complete directed
+graph, travel times at 30 mph (T_ij = 2 D_ij) and service times of about
+two minutes per package.
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from instance_cache import build_data
+
+
+LAYOUTS = ('random', 'clustered', 'mixed')
+
+
+def customer_locations(rng, n_customers, layout, side, n_clusters, spread):
+    """
+    Returns (n_customers, 2) coordinates in the square [-side/2, side/2]^2
+    around the depot at the origin. 'random' is uniform, 'clustered' draws
+    the customers around n_clusters uniform centres and 'mixed' does half of
+    each.
+    """
+    half = side / 2
+    if layout == 'random':
+        return rng.uniform(-half, half, size=(n_customers, 2))
+    if layout == 'clustered':
+        centres = rng.uniform(-half, half, size=(n_clusters, 2))
+        points = centres[rng.integers(n_clusters, size=n_customers)]
+        points = points + rng.normal(0, spread, size=(n_customers, 2))
+        return np.clip(points, -half, half)
+    if layout == 'mixed':
+        n_clustered = n_customers // 2
+        return rng.permutation(np.vstack([
+            customer_locations(rng, n_clustered, 'clustered', side, n_clusters, spread),
+            customer_locations(rng, n_customers - n_clustered, 'random', side, n_clusters, spread),
+        ]))
+    raise ValueError(f"Unknown layout: {layout}")
+
+
+def generate_sheets(n_customers, layout='random', seed=0, side=120, n_clusters=None, spread=8,
+                    max_packages=40, Q=100, D_bar=290, T_bar=480):
+    """
+    Returns the NL_vertices, NL_arcs and Other data frames of a generated
+    instance with the depot as vertex 0 in the middle of the area.
+    """
+    rng = np.random.default_rng(seed)
+    n_clusters = n_clusters or max(2, n_customers // 10)
+    points = np.vstack([[0, 0], customer_locations(rng, n_customers, layout, side, n_clusters, spread)])
+
+    # Package counts are skewed like the datasheet: many small customers, few large ones
+    N_i = np.clip(np.round(rng.lognormal(2, 0.7, size=n_customers)), 1, max_packages).astype(int)
+    S_i = np.round(2 * N_i + rng.uniform(0, 3, size=n_customers)).astype(int)
+
+    vertices = pd.DataFrame({
+        'Vertex': np.arange(n_customers + 1),
+        'Stad': ['Depot'] + [f"Customer {v}" for v in range(1, n_customers + 1)],
+        'N_i': np.concatenate([[0], N_i]),
+        'S_i': np.concatenate([[0], S_i]),
+        'x': np.round(points[:, 0], 3),
+        'y': np.round(points[:, 1], 3),
+    })
+
+    tail, head = np.nonzero(~np.eye(n_customers + 1, dtype=bool))
+    distance = np.maximum(1, np.round(np.linalg.norm(points[tail] - points[head], axis=1))).astype(int)
+    arcs = pd.DataFrame({
+        'Arc': np.arange(1, len(tail) + 1),
+        'From': tail,
+        'To': head,
+        'D_ij': distance,
+        'T_ij': 2 * distance,
+    })
+
+    other = pd.DataFrame({'Vehicle': [1], 'Q': [Q], 'D_bar': [D_bar], 'T_bar': [T_bar]})
+    return vertices, arcs, other
+
+
+def generate_data(n_customers, layout='random', seed=0, **kwargs):
+    """
+    Returns the data dictionary of a generated instance without writing a
+    workbook, in the format built by load_instance.
+    """
+    vertices, arcs, other = generate_sheets(n_customers, layout, seed, **kwargs)
+    arrays = {
+        'vertex': vertices['Vertex'].to_numpy(),
+        'N_i': vertices['N_i'].to_numpy(),
+        'S_i': vertices['S_i'].to_numpy(),
+        'from': arcs['From'].to_numpy(),
+        'to': arcs['To'].to_numpy(),
+        'distance': arcs['D_ij'].to_numpy(),
+        'time': arcs['T_ij'].to_numpy(),
+        'x': vertices['x'].to_numpy(),
+        'y': vertices['y'].to_numpy(),
+    }
+    return build_data(arrays, {name: int(other[name].iloc[0]) for name in ('Q', 'D_bar', 'T_bar')})
+
+
+def write_instance(file_path, n_customers, layout='random', seed=0, coordinates_only=False, **kwargs):
+    """
+    Writes a generated instance to an Excel workbook that model_setup can read.
+    With coordinates_only the NL_arcs sheet is left out and the arcs are
+    computed from the coordinates when the workbook is loaded, with the same
+    distances and times (see instance_cache.py).
+    """
+    vertices, arcs, other = generate_sheets(n_customers, layout, seed, **kwargs)
+    with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
+        vertices.to_excel(writer, sheet_name='NL_vertices', index=False)
+        if not coordinates_only:
+            arcs.to_excel(writer, sheet_name='NL_arcs', index=False)
+        other.to_excel(writer, sheet_name='Other', index=False)
+    return file_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic datasheet workbook")
+    parser.add_argument("file_path")
+    parser.add_argument("--customers", type=int, default=25)
+    parser.add_argument("--layout", choices=LAYOUTS, default='random')
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--coordinates-only", action="store_true",
+                        help="leave out the NL_arcs sheet")
+    args = parser.parse_args()
+
+    write_instance(args.file_path, args.customers, args.layout, args.seed, args.coordinates_only)
+    print(f"Instance with {args.customers} customers written to {args.file_path}")
@@ -7,59 +7,140 @@ of the article.
 """
 
 from gurobipy import Model,GRB, quicksum
-from constraints import add_constraints
-import pandas as pd
+from constraints import (add_constraints, add_matrix_constraints, update_parameter,
+                         add_strengthening, apply_coefficients, apply_bounds, BIG_M_FAMILIES)
+from graph_index import get_graph_index
+from instance_cache import load_instance
+from heuristics import construct_routes
+from routes import SolveResult, decode_routes, route_summary
+from preprocessing import prune_arcs, is_symmetric
+from telemetry import timed_phase
+from screening import screen, explain, compute_iis, IISCache
+from solve_cache import solve_key
+from solver_profiles import load_profile
+import numpy as np
 
 
 class MILPModel():
     """ 
     The model class for the taxi scheduling problem. 
+
+    build_mode selects how the model is built: 'loop' adds every variable and
+    constraint one at a time, 'matrix' adds each family as one MVar/matrix
+    expression over the arc index. params holds Gurobi parameters (e.g.
+    {'Threads': 4}) that are set on the model. strengthen switches to the
+    strengthened formulation (tight big-M coefficients, variable bounds, a
+    fleet lower bound and cycle/symmetry-breaking cuts). telemetry takes a
+    Telemetry object (see telemetry.py) that times the phases and records
+    the incumbent/bound timeline of every solve. With a SolveCache (see
+    solve_cache.py) data_setup first looks the instance up and, on a hit,
+    leaves the Gurobi model unbuilt until a parameter change or a cache miss
+    needs it (see build_deferred); optimize_model stores every optimal or
+    infeasible answer. Instances that fail the screening
+    checks (see screening.py) are reported infeasible without a solve; with
+    diagnose an IIS is computed (and cached) for the other infeasible ones.
+    With profile the tuned parameters of the formulation (solve_mode) and
+    the instance's size class (see solver_profiles.py) are used for every
+    parameter not set in params.
     """
-    def __init__(self):
+    def __init__(self, build_mode="loop", params=None, strengthen=False, telemetry=None,
+                 solve_cache=None, diagnose=False, profile=True):
+        if build_mode not in ("loop", "matrix"):
+            raise ValueError(f"Unknown build mode: {build_mode}")
         self.model = Model()
+        self.params = dict(params or {})
+        for name, value in self.params.items():
+            self.model.setParam(name, value)
+        self.build_mode = build_mode
+        self.strengthen = strengthen
+        self.warm_start = None
+        self.preprocess_report = None
+        self.callbacks = []
+        self.telemetry = telemetry
+        if telemetry is not None:
+            self.callbacks.append(telemetry.callback)
+        self.solve_cache = solve_cache
+        self.cached_result = None
+        self.deferred = False
+        self.diagnose = diagnose
+        self.profile = profile
+        self.profile_params = {}
+        self.screening = []
+        self.iis = None
+
+
+    @timed_phase
+    def model_setup(self, file_path, prune=False, k_nearest=None):
+        """
+        This function reads the datasheet and sets up the parameters. The
+        workbook is only parsed the first time, later calls load the compiled
+        instance from the cache (see instance_cache.py).
+
+        With prune the arcs that no feasible route can use are removed before
+        the variables are created, and k_nearest additionally keeps only the
+        k nearest neighbours of every customer (see preprocessing.py). For a
+        workbook with coordinates instead of arcs, the other arcs are not
+        even generated (see instance_cache.py).
+        """
+        # Load the data dictionary (vertices, vertices_prime, arcs, other)
+        # from the compiled instance cache
+        self.data_setup(load_instance(file_path, k_nearest=k_nearest), prune, k_nearest)
 
 
-    def model_setup(self, file_path):
+    def data_setup(self, data, prune=False, k_nearest=None):
         """
-        This function reads the datasheet from excel and sets up the parameters
+        Sets up the model for an already loaded data dictionary, in the
+        format built by model_setup.
         """
-        df_vertices = pd.read_excel(file_path, sheet_name = 'NL_vertices', engine='openpyxl')
-        df_arcs = pd.read_excel(file_path, sheet_name = 'NL_arcs')
-        df_other = pd.read_excel(file_path, sheet_name = 'Other')
+        self.data = data
 
-        # Set up the data dictionary
-        self.data = {
-            'vertices': [],
-            'vertices_prime': [],
-            'arcs': [],
-            'other': {},
-        }
+        # The size class is that of the instance as loaded, as in tuning.py
+        if self.profile:
+            self.profile_params = self.apply_profile()
 
-        # Fill the vertex values
-        self.data['vertices'] = {
-            row['Vertex']: {'N_i': row['N_i'], 'S_i': row['S_i']}
-            for _, row in df_vertices.iterrows()
-        }
+        # Reduce the arc set before building the model
+        if prune or k_nearest is not None:
+            self.preprocess_report = prune_arcs(self.data, k_nearest)
+            report = self.preprocess_report
+            print(f"Preprocessing removed {report['arcs_before'] - report['arcs_after']} of "
+                  f"{report['arcs_before']} arcs ({report['infeasible_arcs']} infeasible, "
+                  f"{report['sparsified_arcs']} sparsified): {report['variables_removed']} "
+                  f"variables and {report['constraints_removed']} constraints")
 
-        # Fill vertex_prime (excluding the depot)
-        self.data['vertices_prime'] = {
-            row['Vertex']: {'N_i': row['N_i'], 'S_i': row['S_i']}
-            for _, row in df_vertices.iterrows()
-            if row['Vertex'] != 0
-        }
+        # Build the adjacency index over the arcs once
+        get_graph_index(self.data)
 
-        # Fill the arc values
-        self.data['arcs'] = {
-            (row['From'], row['To']): {'distance': row['D_ij'], 'time': row['T_ij']}
-            for _, row in df_arcs.iterrows()
-        }
+        # Symmetric distances and times allow the undirected formulation
+        # (see undirected.py) and the symmetry-breaking cuts
+        self.data['symmetric'] = is_symmetric(self.data)
+
+        # With a cached answer the model is only built once it is needed
+        if self.solve_cache is not None:
+            key = self.solve_cache.key(self.data, self.solve_mode(), self.solve_params())
+            self.deferred = self.solve_cache.contains(key)
+            if self.deferred:
+                return
+
+        self.add_variables()
 
-        # Fill other parameters
-        self.data['other'] = {
-            'Q': df_other.loc[0, 'Q'],
-            'D_bar': df_other.loc[0, 'D_bar'],
-            'T_bar': df_other.loc[0, 'T_bar']
-        }
+
+    def build_deferred(self):
+        """
+        Builds the model that data_setup left out for a cached answer.
+        """
+        if self.deferred:
+            self.deferred = False
+            self.add_variables()
+            self.setup_contraints()
+
+
+    def add_variables(self):
+        """
+        Creates the decision variables and sets the objective.
+        """
+        if self.build_mode == "matrix":
+            self.add_matrix_variables()
+            return
 
         # Set up the decision variables
         self.variables = {
@@ -114,138 +195,364 @@ class MILPModel():
         )
 
 
+    def add_matrix_variables(self):
+        """
+        Creates every variable family as one MVar over the arc index and sets
+        the objective as a single matrix product.
+        """
+        arcs = list(self.data['arcs'])
+        n_arcs = len(arcs)
+        distance = np.array([self.data['arcs'][a]['distance'] for a in arcs], dtype=float)
+
+        self.mvars = {
+            'x': self.model.addMVar(n_arcs, vtype=GRB.BINARY,
+                                    name=[f"x_{i}_{j}" for (i, j) in arcs]),
+            'y': self.model.addMVar(n_arcs, vtype=GRB.INTEGER, lb=0,
+                                    name=[f"y_{i}_{j}" for (i, j) in arcs]),
+            'z': self.model.addMVar(n_arcs, vtype=GRB.INTEGER, lb=0,
+                                    name=[f"z_{i}_{j}" for (i, j) in arcs]),
+            'z_prime': self.model.addMVar(n_arcs, vtype=GRB.INTEGER, lb=0,
+                                          name=[f"zprime_{i}_{j}" for (i, j) in arcs]),
+            'k': self.model.addVar(vtype=GRB.INTEGER, lb=0, name="k"),
+        }
+
+        # Keep the per-arc dictionaries so the rest of the class works unchanged
+        self.variables = {
+            name: dict(zip(arcs, mvar.tolist()))
+            for name, mvar in self.mvars.items() if name != 'k'
+        }
+        self.variables['k'] = self.mvars['k']
+
+        self.model.update()
+
+        # Objective: Minimize total distance traveled
+        self.model.setObjective(distance @ self.mvars['x'], GRB.MINIMIZE)
+
+
+    @timed_phase
     def setup_contraints(self):
         """
         Add the constraints to the model
         """
-        add_constraints(self.model, self.data, self.variables)
+        if self.deferred:
+            return
+
+        if self.build_mode == "matrix":
+            self.constraints = add_matrix_constraints(self.model, self.data, self.mvars)
+        else:
+            self.constraints = add_constraints(self.model, self.data, self.variables)
+
+        if self.strengthen:
+            self.constraints.update(add_strengthening(
+                self.model, self.data, self.variables, symmetry=self.data['symmetric']
+            ))
+            apply_coefficients(self.model, self.data, self.variables, self.constraints,
+                               BIG_M_FAMILIES, strengthen=True)
+            apply_bounds(self.model, self.data, self.variables)
+
+
+    def set_parameter(self, parameter, value):
+        """
+        Changes 'Q', 'T_bar', 'D_bar' or 'S_i' on the already built model
+        through coefficient changes, so it can be re-solved without a rebuild.
+        S_i takes either one value for every vertex or a {vertex: S_i} dict.
+        """
+        self.build_deferred()
+        if parameter == 'S_i' and not isinstance(value, dict):
+            value = {v: value for v in self.data['vertices']}
+
+        # Pruned arcs are only infeasible for the parameters they were pruned
+        # for, or tighter ones
+        if self.preprocess_report is not None:
+            limit = self.preprocess_report['limits'][parameter]
+            if (any(s < limit[v] for v, s in value.items() if v != 0) if parameter == 'S_i'
+                    else value > limit):
+                raise ValueError(f"Cannot relax {parameter} beyond the values the arc set was "
+                                 "pruned for, build the model with the loosest values instead")
+
+        if parameter == 'S_i':
+            changes = [s - self.data['vertices'][v]['S_i'] for v, s in value.items() if v != 0]
+            for v, s in value.items():
+                self.data['vertices'][v]['S_i'] = s
+                if v in self.data['vertices_prime']:
+                    self.data['vertices_prime'][v]['S_i'] = s
+            relaxed = any(change < 0 for change in changes)
+            tightened = any(change > 0 for change in changes)
+        else:
+            old_value = self.data['other'][parameter]
+            self.data['other'][parameter] = value
+            relaxed = value > old_value
+            tightened = value < old_value
+
+        self.update_model(parameter)
 
+        # Remember in which direction the model moved since the last solve
+        if self.warm_start is not None:
+            self.warm_start['relaxed'] |= relaxed
+            self.warm_start['tightened'] |= tightened
 
-    def optimize_model(self):
+
+    def update_model(self, parameter):
         """
-        Optimize the model
+        Brings the built model in line with a parameter changed in self.data.
         """
-        self.model.optimize()
+        update_parameter(self.model, self.data, self.variables, self.constraints, parameter,
+                         strengthen=self.strengthen)
+
 
-        if self.model.Status == GRB.OPTIMAL:
+    def apply_profile(self):
+        """
+        Sets the tuned parameters of the formulation and the instance's size
+        class that are not in self.params, and returns them.
+        """
+        tuned = {name: value for name, value in load_profile(self.data, self.solve_mode()).items()
+                 if name not in self.params}
+        for name, value in tuned.items():
+            self.model.setParam(name, value)
+        if tuned:
+            print(f"Using the tuned parameters {tuned}")
+        return tuned
+
+
+    def apply_warm_start(self, lower_bound=None):
+        """
+        Warm-starts a re-solve from the previous optimal solution. If the
+        model was only tightened since then, the previous objective is a lower
+        bound, so the solve can stop as soon as an incumbent reaches it. A
+        lower_bound known from elsewhere (e.g. the optimum of a relaxation)
+        is used the same way.
+        """
+        stop = -GRB.INFINITY
+        if self.warm_start is not None:
+            self.model.setAttr('Start', self.warm_start['vars'], self.warm_start['values'])
+            if self.warm_start['tightened'] and not self.warm_start['relaxed']:
+                stop = self.warm_start['obj']
+        if lower_bound is not None:
+            stop = max(stop, lower_bound)
+
+        self.model.Params.BestObjStop = stop
+        return stop > -GRB.INFINITY
+
+
+    def set_mip_start(self, routes):
+        """
+        Sets the Start attributes of x, y, z, z_prime and k from a route set in
+        the analyze_results format. Along a route y carries the packages
+        collected so far, z the arrival time and z_prime the distance driven.
+        """
+        arcs = self.data['arcs']
+        vertices = self.data['vertices']
+        start = {name: dict.fromkeys(self.data['arcs'], 0) for name in ('x', 'y', 'z', 'z_prime')}
+
+        for route in routes.values():
+            # The symmetry-breaking cuts only allow first customer <= last customer
+            if 'first' in self.variables:
+                if route[1] > route[-2]:
+                    route = route[::-1]
+                for v in route[1:-1]:
+                    self.variables['first'][v].Start = route[1]
+
+            load, time, distance = 0, 0, 0
+            for i, j in zip(route[:-1], route[1:]):
+                if i != 0:
+                    load += vertices[i]['N_i']
+                    time += vertices[i]['S_i']
+                time += arcs[i, j]['time']
+                distance += arcs[i, j]['distance']
+                start['x'][i, j] = 1
+                start['y'][i, j] = load
+                start['z'][i, j] = time
+                start['z_prime'][i, j] = distance
+
+        for name, values in start.items():
+            if name not in self.variables:
+                continue
+            self.model.setAttr('Start', list(self.variables[name].values()),
+                               [values[arc] for arc in self.variables[name]])
+        self.variables['k'].Start = len(routes)
+
+
+    def apply_heuristic_start(self):
+        """
+        Runs the savings/insertion heuristic (see heuristics.py) and uses its
+        routes as MIP start. Returns the routes, or None if it found none.
+        """
+        routes = construct_routes(self.data)
+        if routes is not None:
+            self.set_mip_start(routes)
+        return routes
+
+
+    def callback(self, model, where):
+        """
+        Gurobi callback that hands every event to the functions registered
+        in self.callbacks.
+        """
+        for callback in self.callbacks:
+            callback(model, where)
+
+
+    @timed_phase
+    def optimize_model(self, heuristic_start=False, start_routes=None, lower_bound=None):
+        """
+        Optimize the model. With heuristic_start the solve starts from the
+        heuristic routes unless there is a previous solution to warm-start from.
+        start_routes (in the analyze_results format) replace the warm start as
+        MIP start, and a proven lower_bound ends the solve as soon as an
+        incumbent reaches it.
+        """
+        self.cached_result = None
+        self.iis = None
+
+        # Customers that cannot be served by any route make the solve pointless
+        self.screening = screen(self.data)
+        if self.screening:
+            print(explain(self.screening))
+            self.status = 2
+            return
+
+        if self.solve_cache is not None:
+            cache_key = self.solve_cache.key(self.data, self.solve_mode(), self.solve_params())
+            cached = self.solve_cache.get(cache_key, self.data)
+            if cached is not None:
+                self.status, self.cached_result = cached
+                print("Result loaded from the solve cache")
+                return
+        self.build_deferred()
+
+        bound_reached = self.apply_warm_start(lower_bound)
+        if start_routes is not None:
+            self.set_mip_start(start_routes)
+        elif heuristic_start and self.warm_start is None:
+            self.apply_heuristic_start()
+
+        if self.callbacks:
+            self.model.optimize(self.callback)
+        else:
+            self.model.optimize()
+        self.status = 0
+
+        if self.model.Status == GRB.USER_OBJ_LIMIT and bound_reached:
+            print("Incumbent reaches a proven lower bound of this model")
+
+        if self.model.Status == GRB.OPTIMAL or (self.model.Status == GRB.USER_OBJ_LIMIT and bound_reached):
             print("Optimization was successful!")
             self.model.write("solution.sol")
             print("Solution written to solution.sol")
             self.status = 1         # Optimal
+
+            # Keep the solution to warm-start the next re-solve
+            variables = self.model.getVars()
+            self.warm_start = {
+                'vars': variables,
+                'values': self.model.getAttr('X', variables),
+                'obj': self.model.ObjVal,
+                'relaxed': False,
+                'tightened': False,
+            }
+            if self.solve_cache is not None:
+                self.solve_cache.put(cache_key, self.status, self.extract_results())
         elif self.model.Status == GRB.INFEASIBLE:
             print("Model is infeasible")
-            # self.model.computeIIS()  # Compute the Irreducible Inconsistent Subsystem
-            # self.model.write("infeasible_model.ilp")  # Write the IIS to a file for debugging
-            # print("IIS written to infeasible_model.ilp")
             self.status = 2         # Infeasible
+            if self.diagnose:
+                self.diagnose_infeasibility()
+            if self.solve_cache is not None:
+                self.solve_cache.put(cache_key, self.status)
         elif self.model.Status == GRB.UNBOUNDED:
             print("Model is unbounded.")
         else:
             print(f"Optimization ended with status {self.model.Status}")
 
     
-    def analyze_results(self):
+    def diagnose_infeasibility(self):
         """
-        Method to print the results of the optimized model.
-        """   
-        # Compute the Vehicle Miles Traveled (VMT)
-        VMT = 0
-        for (i, j) in self.data['arcs']:
-            VMT += self.variables['z_prime'][i, j]
-
-        # Compute Vehicle Hours Traveled (VTT)
-        VTT = 0
-        for (i, j), var in self.variables['x'].items():
-            if var.X > 0.5:
-                T_ij = self.data['arcs'][(i, j)]['time']
-                S_i = self.data['vertices'][i]['S_i'] if i != 0 else 0
-                VTT += T_ij + S_i
-
-        # Compute Vehicle Miles Traveled (VMT)
-        VMT = 0
-        for (i, j), var in self.variables['x'].items():
-            if var.X > 0.5:
-                D_ij = self.data['arcs'][(i, j)]['distance']
-                VMT += D_ij
-
-        # Find the routes per vehicle
-        # Step 1: extract active arcs
-        arcs_used = {(i, j) for (i, j), var in self.variables['x'].items() if var.X > 0.5}
-
-        # Step 2: find starting nodes from depot
-        starts = [j for (i, j) in arcs_used if i == 0]
-
-        routes = {}
-        route_id = 1
-
-        for start in starts:
-            route = [0, start]
-            current = start
-            while current != 0:
-                next_node = next((j for (i, j) in arcs_used if i == current), 0)
-                if next_node == 0:
-                    route.append(0)
-                    break
-                route.append(next_node)
-                current = next_node
-            routes[route_id] = route
-            route_id += 1
-
-        # Step 1: extract active arcs
-        arcs_used = {(i, j) for (i, j), var in self.variables['x'].items() if var.X > 0.5}
-
-        # Step 2: find starting nodes from depot
-        starts = [j for (i, j) in arcs_used if i == 0]
-
-        routes = {}
-        route_id = 1
-
-        for start in starts:
-            route = [0, start]
-            total_time = self.data['arcs'][(0, start)]['time']
-            total_distance = self.data['arcs'][(0, start)]['distance']
-            
-            # Add service time at first customer node
-            total_time += self.data['vertices'][start]['S_i']
-
-            current = start
-            while current != 0:
-                next_node = next((j for (i, j) in arcs_used if i == current), 0)
-                if next_node == 0:
-                    route.append(0)
-                    total_time += self.data['arcs'][(current, 0)]['time']
-                    total_distance += self.data['arcs'][(current, 0)]['distance']
-                    break
-                route.append(next_node)
-
-                # Add arc time/distance
-                total_time += self.data['arcs'][(current, next_node)]['time']
-                total_distance += self.data['arcs'][(current, next_node)]['distance']
-
-                # Add service time at next node
-                total_time += self.data['vertices'][next_node]['S_i']
-                print(f"for node: {next_node} service time is: {self.data['vertices'][next_node]['S_i']}")
-
-                current = next_node
-
-            routes[route_id] = route
-            print(f"Route {route_id}: {route}")
-            print(f"  Total distance: {total_distance:.2f} miles, Total time: {total_time:.2f} minutes")
-            route_id += 1
+        Computes the Irreducible Inconsistent Subsystem of the infeasible
+        model, or loads it from the IIS cache, and prints which constraint
+        families it involves.
+        """
+        iis_cache = IISCache()
+        key = solve_key(self.data, self.solve_mode(), self.solve_params())
+        self.iis = iis_cache.get(key)
+        if self.iis is None:
+            self.iis = compute_iis(self.model)
+            iis_cache.put(key, self.iis)
+            self.model.write("infeasible_model.ilp")  # Write the IIS to a file for debugging
+            print("IIS written to infeasible_model.ilp")
+        print(f"IIS: {len(self.iis['constraints'])} constraints ({self.iis['families']}), "
+              f"{len(self.iis['bounds'])} bounds")
+        return self.iis
+
+
+    def solve_mode(self):
+        """
+        Name of the formulation, part of the solve cache key.
+        """
+        return type(self).__name__ + ('+strengthened' if self.strengthen else '')
 
 
+    def solve_params(self):
+        """
+        The Gurobi parameters of the solve, part of the solve cache key: the
+        tuned profile below self.params.
+        """
+        return {**self.profile_params, **self.params}
+
+
+    def extract_results(self, attr='X', obj_attr='ObjVal', data=None):
+        """
+        Reads the solution with one getAttr call and decodes the routes.
+        Returns a SolveResult (see routes.py). attr and obj_attr select
+        another solution (e.g. 'ScenNX' and 'ScenNObjVal' of a scenario),
+        evaluated on data instead of self.data.
+        """
+        data = self.data if data is None else data
+        arcs = list(self.variables['x'])
+        values = np.array(self.model.getAttr(attr, list(self.variables['x'].values()) + [self.variables['k']]))
+        used = values[:-1] > 0.5
+        k = int(round(values[-1]))
+
+        # Compute Vehicle Miles Traveled (VMT) and Vehicle Hours Traveled (VTT)
+        vertices = data['vertices']
+        distance = np.array([data['arcs'][a]['distance'] for a in arcs])
+        time = np.array([data['arcs'][(i, j)]['time'] + (vertices[i]['S_i'] if i != 0 else 0)
+                         for (i, j) in arcs])
+        VMT = distance[used].sum().item()
+        VTT = time[used].sum().item()
+
+        # Find the routes per vehicle by following the successor of every vertex
+        routes, cycles = decode_routes([arcs[p] for p in np.flatnonzero(used)])
+        if cycles:
+            print(f"Warning: the solution contains subtours {cycles}")
+        routes = {route_id: route for route_id, route in enumerate(routes, start=1)}
+        route_stats = {route_id: route_summary(data, route) for route_id, route in routes.items()}
+
+        return SolveResult(getattr(self.model, obj_attr), k, VMT, VTT, routes, route_stats)
+
+
+    @timed_phase
+    def analyze_results(self):
+        """
+        Prints the results of the optimized (or cached) solve. Returns a
+        SolveResult (see routes.py), which unpacks as (obj, k, VMT, VTT, routes).
+        """
+        result = self.cached_result if self.cached_result is not None else self.extract_results()
 
         # Print the results
-        print(f"####   The model finished with objective value: {self.model.ObjVal}")
-        print(f"####   The amount of vehicles used: {int(self.variables['k'].X)}")
-        print(f"####   VMT: {VMT}")
-        print(f"####   VTT: {VTT}")
+        print(f"####   The model finished with objective value: {result.obj}")
+        print(f"####   The amount of vehicles used: {result.k}")
+        print(f"####   VMT: {result.VMT}")
+        print(f"####   VTT: {result.VTT}")
 
         # Print the routes
-        for key, value in routes.items():
+        for key, value in result.routes.items():
+            stats = result.route_stats[key]
             print(f"####   Route {key}: {value}")
+            print(f"       Total distance: {stats['distance']:.2f} miles, Total time: {stats['time']:.2f} "
+                  f"minutes, slack: {stats['load_slack']} packages, {stats['time_slack']:.2f} minutes, "
+                  f"{stats['distance_slack']:.2f} miles")
 
-        return  self.model.ObjVal, int(self.variables['k'].X), VMT, VTT, routes
+        return result
 
 if __name__ == "__main__":
     file_path = 'datasheet_kopie.xlsx'
@@ -9,6 +9,8 @@ import pandas as pd
 import os 
 import numpy as np
 
+from result_store import read_columns
+
 
 def bar_charts():
     """""
@@ -21,7 +23,8 @@ def bar_charts():
         # Set up the filepath to find the csv
         filepath = f"sensitivity_results/{param}_sens.csv"
         try:
-            result_df = pd.read_csv(filepath)
+            # Only the plotted columns are read from the result store
+            result_df = pd.DataFrame(read_columns(filepath, [param, 'VMT', 'VTT', 'k']), dtype=float)
         except:
             print(f"Parameter {param} does not have a csv")
             continue
@@ -63,14 +66,12 @@ def contour_plots():
             # Set up the filepath to find the csv
             filepath = f"sensitivity_results/cv_{param1}_{param2}_sens.csv"
             try:
-                result_df = pd.read_csv(filepath)
+                # Only the plotted columns are read from the result store
+                df = pd.DataFrame(read_columns(filepath, [param1, param2, 'VMT', 'VTT', 'k']), dtype=float)
             except:
                 print(f"Parameter combination {param1, param2} does not have a csv")
                 continue
 
-            # Load CSV
-            df = pd.read_csv(filepath)
-
             # Drop rows with missing outputs
             df = df.dropna(subset=['VMT', 'VTT', 'k'])
 
@@ -0,0 +1,169 @@
+"""
+Preprocessing File
+
+Removes arcs that can never be part of a feasible route before the model is
+built, and optionally sparsifies the graph to the nearest neighbours of
+every customer.
+"""
+
+import heapq
+
+from graph_index import get_graph_index
+
+
+def model_size(data):
+    """
+    Returns (variables, constraints) of the flow model for the arc set: four
+    variables and five per-arc constraints per arc, five flow/degree
+    constraints per customer, plus k and the two depot constraints.
+    """
+    n_arcs = len(data['arcs'])
+    n_customers = len(data['vertices_prime'])
+    return 4 * n_arcs + 1, 5 * n_arcs + 5 * n_customers + 2
+
+
+def shortest_paths(data, weight, reverse=False):
+    """
+    Dijkstra from the depot over the arcs. weight(i, j) is the cost of arc
+    (i, j); with reverse=True the paths run from every vertex to the depot.
+    Returns {vertex: cost} for the reachable vertices.
+    """
+    graph = get_graph_index(data)
+    cost = {0: 0}
+    heap = [(0, 0)]
+    while heap:
+        c, v = heapq.heappop(heap)
+        if c > cost[v]:
+            continue
+        neighbours = graph.in_arcs(v) if reverse else graph.out_arcs(v)
+        for (i, j) in neighbours:
+            w = j if not reverse else i
+            new_cost = c + weight(i, j)
+            if new_cost < cost.get(w, float('inf')):
+                cost[w] = new_cost
+                heapq.heappush(heap, (new_cost, w))
+    return cost
+
+
+def infeasible_arcs(data):
+    """
+    Returns the arcs that no feasible route can use: the two customers
+    exceed Q together, or the fastest (shortest) route through the arc
+    exceeds T_bar (D_bar). The route bounds use the shortest paths from the
+    depot to the tail and from the head back to the depot.
+    """
+    arcs = data['arcs']
+    vertices = data['vertices']
+    other = data['other']
+    S = {v: (vertices[v]['S_i'] if v != 0 else 0) for v in vertices}
+    N = {v: (vertices[v]['N_i'] if v != 0 else 0) for v in vertices}
+
+    # Arrival times at i and return times after leaving j, serving on the way
+    bounds = route_bounds(data)
+    time_to, time_back = bounds['time_to'], bounds['time_back']
+    dist_to, dist_back = bounds['dist_to'], bounds['dist_back']
+
+    inf = float('inf')
+    removed = []
+    for (i, j), arc in arcs.items():
+        if N[i] + N[j] > other['Q']:
+            removed.append((i, j))
+        elif (time_to.get(i, inf) + S[i] + arc['time'] + S[j] + time_back.get(j, inf)
+              > other['T_bar']):
+            removed.append((i, j))
+        elif dist_to.get(i, inf) + arc['distance'] + dist_back.get(j, inf) > other['D_bar']:
+            removed.append((i, j))
+    return removed
+
+
+def nearest_neighbour_arcs(data, k_nearest):
+    """
+    Returns the customer-to-customer arcs that are not among the k_nearest
+    shortest outgoing or incoming arcs of their tail or head. Arcs from and
+    to the depot are always kept.
+    """
+    graph = get_graph_index(data)
+    arcs = data['arcs']
+    keep = set()
+    for v in data['vertices_prime']:
+        for neighbours in (graph.out_arcs(v), graph.in_arcs(v)):
+            customer_arcs = [a for a in neighbours if 0 not in a]
+            customer_arcs.sort(key=lambda a: arcs[a]['distance'])
+            keep.update(customer_arcs[:k_nearest])
+    return [a for a in arcs if 0 not in a and a not in keep]
+
+
+def prune_arcs(data, k_nearest=None):
+    """
+    Removes the provably infeasible arcs from data['arcs'] (repeated until
+    no more arcs drop out, as removing arcs lengthens the shortest paths)
+    and, with k_nearest, the arcs outside every customer's k nearest
+    neighbours. The latter is a heuristic reduction that may cut off the
+    optimum. Returns a report of what was removed.
+    """
+    variables_before, constraints_before = model_size(data)
+    arcs_before = len(data['arcs'])
+
+    n_infeasible = 0
+    while True:
+        removed = infeasible_arcs(data)
+        if not removed:
+            break
+        n_infeasible += len(removed)
+        removed = set(removed)
+        data['arcs'] = {a: values for a, values in data['arcs'].items() if a not in removed}
+
+    n_sparsified = 0
+    if k_nearest is not None:
+        removed = set(nearest_neighbour_arcs(data, k_nearest))
+        n_sparsified = len(removed)
+        data['arcs'] = {a: values for a, values in data['arcs'].items() if a not in removed}
+
+    get_graph_index(data)
+    variables_after, constraints_after = model_size(data)
+
+    return {
+        'arcs_before': arcs_before,
+        'arcs_after': len(data['arcs']),
+        'infeasible_arcs': n_infeasible,
+        'sparsified_arcs': n_sparsified,
+        'variables_removed': variables_before - variables_after,
+        'constraints_removed': constraints_before - constraints_after,
+        'limits': {
+            'Q': data['other']['Q'],
+            'T_bar': data['other']['T_bar'],
+            'D_bar': data['other']['D_bar'],
+            'S_i': {v: values['S_i'] for v, values in data['vertices_prime'].items()},
+        },
+    }
+
+
+def is_symmetric(data):
+    """
+    Checks whether every arc has a reverse arc with the same distance and time.
+    """
+    arcs = data['arcs']
+    return all(
+        (j, i) in arcs
+        and arcs[j, i]['distance'] == values['distance']
+        and arcs[j, i]['time'] == values['time']
+        for (i, j), values in arcs.items()
+    )
+
+
+def route_bounds(data):
+    """
+    Returns the shortest-path bounds used to tighten the formulation: for
+    every vertex the earliest arrival time and shortest distance from the
+    depot, and the shortest time and distance from leaving it (after its
+    service) back to the depot.
+    """
+    arcs = data['arcs']
+    vertices = data['vertices']
+    S = {v: (vertices[v]['S_i'] if v != 0 else 0) for v in vertices}
+    return {
+        'time_to': shortest_paths(data, lambda i, j: S[i] + arcs[i, j]['time']),
+        'time_back': shortest_paths(data, lambda i, j: arcs[i, j]['time'] + S[j], reverse=True),
+        'dist_to': shortest_paths(data, lambda i, j: arcs[i, j]['distance']),
+        'dist_back': shortest_paths(data, lambda i, j: arcs[i, j]['distance'], reverse=True),
+    }
@@ -0,0 +1,201 @@
+"""
+Replanning File
+
+Incremental re-optimization of a built model while the demand changes during
+the day. Customers can be added, removed or resized on the live model: only
+the variables and constraints of the affected arcs and customers are added
+or removed, the previous routes are repaired into a feasible MIP start (see
+heuristics.repair_routes) and the re-solve runs under a time budget.
+"""
+
+import time
+
+from gurobipy import GRB, Column
+
+from main import MILPModel
+from constraints import add_arc_constraints, add_customer_constraints
+from graph_index import get_graph_index
+from heuristics import repair_routes
+from routes import route_feasible
+
+
+class LiveModel(MILPModel):
+    """
+    MILPModel (loop build mode) that supports add_customer, remove_customer
+    and change_customer between solves. replan re-solves with at most
+    time_limit seconds and keeps the best routes found, optimal or not.
+    """
+    def __init__(self, params=None, telemetry=None, time_limit=1.0):
+        super().__init__(params=params, telemetry=telemetry)
+        self.time_limit = time_limit
+        self.routes = None
+        self.displaced = set()      # Customers to (re)insert into the routes
+        self.resized = set()        # Customers with changed N_i or S_i
+        self.last_edit_time = 0.0
+
+
+    def arc_columns(self, arc, new_vertex):
+        """
+        Returns the Columns of x, y, z and z_prime of the arc in the flow
+        constraints that already exist, i.e. those of the depot and of the
+        endpoint that is not new_vertex.
+        """
+        i, j = arc
+        constrs = self.constraints
+        distance = self.data['arcs'][arc]['distance']
+        columns = {name: Column() for name in ('x', 'y', 'z', 'z_prime')}
+
+        if i == 0:
+            columns['x'].addTerms(1, constrs['depot_departures'][0])
+        elif i != new_vertex:
+            time = self.data['arcs'][arc]['time'] + self.data['vertices'][i]['S_i']
+            columns['x'].addTerms([1, -time, -distance],
+                                  [constrs['outgoing_arc'][i], constrs['time_flow'][i],
+                                   constrs['distance_flow'][i]])
+            columns['y'].addTerms(1, constrs['package_flow'][i])
+            columns['z'].addTerms(1, constrs['time_flow'][i])
+            columns['z_prime'].addTerms(1, constrs['distance_flow'][i])
+
+        if j == 0:
+            columns['x'].addTerms(1, constrs['depot_returns'][0])
+        elif j != new_vertex:
+            columns['x'].addTerms(1, constrs['incoming_arc'][j])
+            columns['y'].addTerms(-1, constrs['package_flow'][j])
+            columns['z'].addTerms(-1, constrs['time_flow'][j])
+            columns['z_prime'].addTerms(-1, constrs['distance_flow'][j])
+        return columns
+
+
+    def add_customer(self, v, N_i, S_i, arcs, **coordinates):
+        """
+        Adds customer v with N_i packages and service time S_i. arcs holds
+        {(i, j): {'distance': ..., 'time': ...}} for the arcs from and to v
+        that can be used. The coordinates (x, y) are stored if given.
+        """
+        if v in self.data['vertices']:
+            raise ValueError(f"Vertex {v} already exists")
+        start = time.perf_counter()
+
+        self.data['vertices'][v] = {'N_i': N_i, 'S_i': S_i, **coordinates}
+        self.data['vertices_prime'][v] = dict(self.data['vertices'][v])
+        self.data['arcs'].update({arc: dict(values) for arc, values in arcs.items()})
+        get_graph_index(self.data)
+
+        for (i, j) in arcs:
+            columns = self.arc_columns((i, j), v)
+            self.variables['x'][i, j] = self.model.addVar(
+                vtype=GRB.BINARY, obj=self.data['arcs'][i, j]['distance'], column=columns['x'],
+                name=f"x_{i}_{j}")
+            self.variables['y'][i, j] = self.model.addVar(
+                vtype=GRB.INTEGER, lb=0, column=columns['y'], name=f"y_{i}_{j}")
+            self.variables['z'][i, j] = self.model.addVar(
+                vtype=GRB.INTEGER, lb=0, column=columns['z'], name=f"z_{i}_{j}")
+            self.variables['z_prime'][i, j] = self.model.addVar(
+                vtype=GRB.INTEGER, lb=0, column=columns['z_prime'], name=f"zprime_{i}_{j}")
+
+        add_customer_constraints(self.model, self.data, self.variables, self.constraints, v)
+        add_arc_constraints(self.model, self.data, self.variables, self.constraints, list(arcs))
+        self.displaced.add(v)
+        self.structure_changed(start)
+
+
+    def remove_customer(self, v):
+        """
+        Removes customer v with its arcs, variables and constraints.
+        """
+        if v not in self.data['vertices_prime']:
+            raise ValueError(f"Unknown customer: {v}")
+        start = time.perf_counter()
+
+        graph = get_graph_index(self.data)
+        arcs = graph.out_arcs(v) + graph.in_arcs(v)
+        removed = [self.variables[name].pop(arc) for name in ('x', 'y', 'z', 'z_prime') for arc in arcs]
+        for family in self.constraints.values():
+            for key in [v] + arcs:
+                if key in family:
+                    removed.append(family.pop(key))
+        self.model.remove(removed)
+
+        for arc in arcs:
+            del self.data['arcs'][arc]
+        del self.data['vertices'][v]
+        del self.data['vertices_prime'][v]
+        get_graph_index(self.data)
+        self.displaced.discard(v)
+        self.structure_changed(start)
+
+
+    def change_customer(self, v, N_i=None, S_i=None):
+        """
+        Changes the packages N_i and/or the service time S_i of customer v
+        through its right-hand side and coefficients.
+        """
+        if v not in self.data['vertices_prime']:
+            raise ValueError(f"Unknown customer: {v}")
+        start = time.perf_counter()
+
+        if N_i is not None:
+            # (7) Flow conservation for packages
+            self.constraints['package_flow'][v].RHS = N_i
+        if S_i is not None:
+            # (8) Travel time flow conservation and (10) lower bound on travel time
+            x = self.variables['x']
+            for arc in get_graph_index(self.data).out_arcs(v):
+                coefficient = -(self.data['arcs'][arc]['time'] + S_i)
+                self.model.chgCoeff(self.constraints['time_flow'][v], x[arc], coefficient)
+                self.model.chgCoeff(self.constraints['time_lower'][arc], x[arc], coefficient)
+
+        for values in (self.data['vertices'][v], self.data['vertices_prime'][v]):
+            values.update({name: value for name, value in (('N_i', N_i), ('S_i', S_i))
+                           if value is not None})
+        self.resized.add(v)
+        self.structure_changed(start)
+
+
+    def structure_changed(self, start):
+        """
+        Drops the solution of the previous model, which does not fit the new
+        one; replan starts from the repaired routes instead.
+        """
+        self.warm_start = None
+        self.last_edit_time += time.perf_counter() - start
+
+
+    def start_routes(self):
+        """
+        Returns the previous routes repaired for the current data. The added
+        customers, and the resized customers whose route no longer fits, are
+        (re)inserted.
+        """
+        if self.routes is None:
+            return None
+        displaced = set(self.displaced)
+        for route in self.routes.values():
+            kept = [v for v in route if v == 0 or v in self.data['vertices']]
+            if not route_feasible(self.data, kept):
+                displaced.update(self.resized.intersection(kept))
+        return repair_routes(self.data, self.routes, displaced)
+
+
+    def replan(self, time_limit=None):
+        """
+        Re-solves from the repaired routes with at most time_limit seconds
+        (self.time_limit by default). Returns the SolveResult of the best
+        routes found, or None if there is none.
+        """
+        start = time.perf_counter()
+        start_routes = self.start_routes()
+        self.model.Params.TimeLimit = self.time_limit if time_limit is None else time_limit
+        self.optimize_model(heuristic_start=True, start_routes=start_routes)
+
+        print(f"Replanned after {self.last_edit_time:.3f} s of model edits and "
+              f"{time.perf_counter() - start:.3f} s of repairing and solving")
+        self.last_edit_time = 0.0
+        if self.status == 2 or self.model.SolCount == 0:
+            return None
+
+        result = self.cached_result if self.cached_result is not None else self.extract_results()
+        self.routes = result.routes
+        self.displaced = set()
+        self.resized = set()
+        return result
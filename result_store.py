@@ -0,0 +1,178 @@
+"""
+Result Store File
+
+Append-only csv store for sweep results. Every finished grid point is
+written and flushed to disk right away, with its routes (as JSON) and solver
+status and the source of the answer (e.g. 'solved', 'cached' or, for the
+adaptive grids, 'inferred'), so an interrupted sweep keeps what it solved and
+a rerun resumes with the missing points. Parallel workers write to their own part files,
+which are merged into the store when the sweep ends (or, after a crash,
+when the store is opened again).
+"""
+
+import csv
+import glob
+import json
+import math
+import os
+
+
+RESULT_COLUMNS = ['obj_val', 'VMT', 'VTT', 'k', 'routes', 'status', 'source']
+STATUS = {0: 'unsolved', 1: 'optimal', 2: 'infeasible'}
+COMPLETE = ('optimal', 'infeasible')
+# Sources whose answer was not computed for the point itself
+APPROXIMATE = ('approximate',)
+
+
+def _value(text):
+    """
+    Parses a csv field into an int, float or None (empty fields).
+    """
+    if text == '':
+        return None
+    try:
+        number = float(text)
+    except ValueError:
+        return text
+    return int(number) if number.is_integer() else number
+
+
+def _key(point):
+    return tuple(float(value) for value in point)
+
+
+def read_columns(filepath, columns):
+    """
+    Streams the store and returns {column: [values]} for the given columns
+    only, keeping the last row of every grid point. The other columns (e.g.
+    the routes) are never kept in memory.
+    """
+    with open(filepath, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        n_parameters = header.index('obj_val')
+        positions = [header.index(column) for column in columns]
+        last = {}
+        for row in reader:
+            last[_key(_value(v) for v in row[:n_parameters])] = [_value(row[p]) for p in positions]
+    values = list(last.values())
+    return {column: [row[c] for row in values] for c, column in enumerate(columns)}
+
+
+class ResultStore():
+    """
+    The store of one sweep at filepath, with the parameter columns followed
+    by RESULT_COLUMNS. A file from before the store existed (without some of
+    the RESULT_COLUMNS) is migrated; any other header raises a ValueError.
+    """
+    def __init__(self, filepath, parameters):
+        self.filepath = filepath
+        self.columns = [*parameters, *RESULT_COLUMNS]
+        self.n_parameters = len(parameters)
+
+        header = None
+        if os.path.exists(filepath):
+            with open(filepath, newline='') as f:
+                header = next(csv.reader(f), None)
+        if header is None:
+            with open(filepath, 'w', newline='') as f:
+                csv.writer(f).writerow(self.columns)
+        elif header != self.columns:
+            self.migrate(header)
+
+        for part in sorted(glob.glob(f"{glob.escape(filepath)}.part*")):
+            self.merge(part)
+
+
+    def migrate(self, header):
+        """
+        Rewrites a store written with an older header in the current columns,
+        keeping its rows. A missing status is 'optimal' for the rows with an
+        objective and 'infeasible' for the others, other missing columns stay
+        empty.
+        """
+        parameters = self.columns[:self.n_parameters]
+        if header[:self.n_parameters] != parameters or not set(header) <= set(self.columns):
+            raise ValueError(f"{self.filepath} has the columns {header}, expected {self.columns}; "
+                             "move it aside to start a new store")
+
+        with open(self.filepath, newline='') as f:
+            reader = csv.reader(f)
+            next(reader)
+            rows = [dict(zip(header, row)) for row in reader if row]
+        for row in rows:
+            if 'status' not in header:
+                row['status'] = STATUS[1] if row.get('obj_val', '') != '' else STATUS[2]
+
+        tmp_path = f"{self.filepath}.tmp{os.getpid()}"
+        with open(tmp_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(self.columns)
+            writer.writerows([row.get(column, '') for column in self.columns] for row in rows)
+        os.replace(tmp_path, self.filepath)
+        print(f"Migrated the {len(rows)} rows of {self.filepath} to the columns {self.columns}")
+
+
+    def rows(self):
+        """
+        Returns the last row of every grid point with a final answer, parsed,
+        keyed like completed.
+        """
+        rows = {}
+        status = self.columns.index('status')
+        source = self.columns.index('source')
+        with open(self.filepath, newline='') as f:
+            reader = csv.reader(f)
+            next(reader)
+            for row in reader:
+                if row[status] in COMPLETE and row[source] not in APPROXIMATE:
+                    rows[_key(_value(v) for v in row[:self.n_parameters])] = [_value(v) for v in row]
+        return rows
+
+
+    def completed(self):
+        """
+        Returns the keys of the grid points with a final answer.
+        """
+        return set(self.rows())
+
+
+    def missing(self, points):
+        done = self.completed()
+        return [point for point in points if _key(point) not in done]
+
+
+    def append(self, row):
+        """
+        Appends a result row [*point, obj_val, VMT, VTT, k, routes, status,
+        source] and flushes it to disk.
+        """
+        row = ['' if value is None or (isinstance(value, float) and math.isnan(value)) else value
+               for value in row]
+        with open(self.filepath, 'a', newline='') as f:
+            csv.writer(f).writerow(row)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+    def merge(self, part):
+        """
+        Appends the rows of a worker's part file and removes it.
+        """
+        with open(part, newline='') as f:
+            rows = [row for row in csv.reader(f) if row and row != self.columns]
+        with open(self.filepath, 'a', newline='') as f:
+            csv.writer(f).writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+        os.remove(part)
+
+
+def result_fields(status, result, source='solved'):
+    """
+    Returns the RESULT_COLUMNS values of a solve.
+    """
+    if status != 1:
+        return [None, None, None, None, '', STATUS.get(status, 'unsolved'), source]
+    obj_val, k, VMT, VTT, routes = result
+    return [obj_val, VMT, VTT, k, json.dumps(routes), STATUS[status], source]
@@ -0,0 +1,184 @@
+"""
+Routes File
+
+Helpers to evaluate route sets in the same format as MILPModel.analyze_results:
+a dict {route_id: [0, customer, ..., customer, 0]}.
+"""
+
+
+def route_load(data, route):
+    """
+    Returns the number of packages collected on the route.
+    """
+    return sum(data['vertices'][v]['N_i'] for v in route if v != 0)
+
+
+def route_time(data, route):
+    """
+    Returns the travel time of the route including the service times.
+    """
+    arcs = data['arcs']
+    vertices = data['vertices']
+    return sum(
+        arcs[i, j]['time'] + (vertices[i]['S_i'] if i != 0 else 0)
+        for i, j in zip(route[:-1], route[1:])
+    )
+
+
+def route_distance(data, route):
+    """
+    Returns the distance travelled on the route.
+    """
+    arcs = data['arcs']
+    return sum(arcs[i, j]['distance'] for i, j in zip(route[:-1], route[1:]))
+
+
+def route_feasible(data, route):
+    """
+    Checks that every arc of the route exists and that the route respects
+    Q, T_bar and D_bar.
+    """
+    if any((i, j) not in data['arcs'] for i, j in zip(route[:-1], route[1:])):
+        return False
+    other = data['other']
+    return (route_load(data, route) <= other['Q']
+            and route_time(data, route) <= other['T_bar']
+            and route_distance(data, route) <= other['D_bar'])
+
+
+def route_summary(data, route):
+    """
+    Returns the load, time and distance of a route and how much room is left
+    under Q, T_bar and D_bar (the slack).
+    """
+    other = data['other']
+    load = route_load(data, route)
+    time = route_time(data, route)
+    distance = route_distance(data, route)
+    return {
+        'load': load,
+        'time': time,
+        'distance': distance,
+        'load_slack': other['Q'] - load,
+        'time_slack': other['T_bar'] - time,
+        'distance_slack': other['D_bar'] - distance,
+    }
+
+
+class SolveResult():
+    """
+    The result of a solve: objective, number of vehicles, VMT, VTT, the
+    routes {route_id: [0, ..., 0]} and a route_summary per route. It unpacks
+    and indexes like the (obj, k, VMT, VTT, routes) tuple returned before, so
+    obj, k, VMT, VTT, routes = result keeps working.
+    """
+    def __init__(self, obj, k, VMT, VTT, routes, route_stats):
+        self.obj = obj
+        self.k = k
+        self.VMT = VMT
+        self.VTT = VTT
+        self.routes = routes
+        self.route_stats = route_stats
+
+
+    def as_tuple(self):
+        return self.obj, self.k, self.VMT, self.VTT, self.routes
+
+
+    def __iter__(self):
+        return iter(self.as_tuple())
+
+
+    def __getitem__(self, index):
+        return self.as_tuple()[index]
+
+
+    def __len__(self):
+        return 5
+
+
+    def __repr__(self):
+        return f"SolveResult(obj={self.obj}, k={self.k}, VMT={self.VMT}, VTT={self.VTT})"
+
+
+def evaluate_routes(data, routes, obj=None, k=None):
+    """
+    Returns the SolveResult of a route set. The objective defaults to the
+    VMT and k to the number of routes.
+    """
+    route_stats = {route_id: route_summary(data, route) for route_id, route in routes.items()}
+    VMT = sum(stats['distance'] for stats in route_stats.values())
+    VTT = sum(stats['time'] for stats in route_stats.values())
+    return SolveResult(VMT if obj is None else obj, len(routes) if k is None else k,
+                       VMT, VTT, routes, route_stats)
+
+
+def decode_routes(arcs_used):
+    """
+    Splits a set of used arcs in which every customer has one incoming and
+    one outgoing arc into routes [0, ..., 0] starting at the depot and
+    cycles [i, ..., i] that do not visit the depot (subtours).
+    """
+    successor = {}
+    departures = []
+    for i, j in arcs_used:
+        if i == 0:
+            departures.append(j)
+        else:
+            successor[i] = j
+
+    routes = []
+    for start in departures:
+        route = [0, start]
+        current = start
+        while current != 0 and current in successor:
+            current = successor.pop(current)
+            route.append(current)
+        routes.append(route)
+
+    cycles = []
+    while successor:
+        start, current = successor.popitem()
+        cycle = [start, current]
+        while current != start and current in successor:
+            current = successor.pop(current)
+            cycle.append(current)
+        cycles.append(cycle)
+
+    return routes, cycles
+
+
+def decode_edges(edges_used):
+    """
+    Undirected version of decode_routes: splits {edge: multiplicity} in which
+    every customer has degree 2 (a depot edge used twice is the route
+    0 -> j -> 0) into directed routes [0, ..., 0] and cycles [i, ..., i].
+    Each route is directed so that its first customer is at most its last.
+    """
+    neighbours = {}
+    for (i, j), multiplicity in edges_used.items():
+        for _ in range(multiplicity):
+            neighbours.setdefault(i, []).append(j)
+            neighbours.setdefault(j, []).append(i)
+
+    def walk(start, current):
+        path = [start, current]
+        neighbours[start].remove(current)
+        neighbours[current].remove(start)
+        while current != start and neighbours.get(current):
+            following = neighbours[current].pop()
+            neighbours[following].remove(current)
+            path.append(following)
+            current = following
+        return path
+
+    routes = []
+    while neighbours.get(0):
+        route = walk(0, neighbours[0][-1])
+        routes.append(route if route[1] <= route[-2] else route[::-1])
+
+    cycles = []
+    for start in list(neighbours):
+        if neighbours[start]:
+            cycles.append(walk(start, neighbours[start][-1]))
+    return routes, cycles
@@ -0,0 +1,216 @@
+"""
+Scenarios File
+
+Solves a whole sweep as one Gurobi multi-scenario model instead of one model
+per grid point. Gurobi scenarios can only change objective coefficients,
+right-hand sides and variable bounds, so the parameter effects are
+reformulated first:
+
+- Q, T_bar and D_bar: the big-M coefficients on x use the loosest value of
+  the sweep and every scenario bounds y, z and z_prime by its own value
+  (ScenNUB). As x is binary, y <= Q_max * x and y <= Q is y <= Q * x.
+- S_i: every customer has exactly one outgoing arc, so the service time in
+  the time flow constraints (8) is a constant and moves to their right-hand
+  side (ScenNRHS). The lower bounds (10) keep the smallest S_i of the sweep,
+  which is valid for every scenario.
+- k is bounded below by the fleet lower bound of every scenario (ScenNLB).
+
+One tree search then answers all scenarios, sharing its work between them.
+"""
+
+from gurobipy import GRB
+
+from main import MILPModel
+from constraints import PARAMETER_FAMILIES, add_constraints, apply_bounds, fleet_lower_bound
+from graph_index import get_graph_index
+from instance_cache import load_instance
+from result_store import ResultStore, result_fields
+from screening import screen, explain
+from solve_cache import override_data
+from solver_profiles import load_profile
+from sweep_planner import RELAXING
+from telemetry import Telemetry, timed_phase
+
+
+def loosest_point(parameters, points):
+    """
+    Returns the values of the parameters that relax the model the most over
+    the points.
+    """
+    return {
+        parameter: (max if RELAXING[parameter] > 0 else min)(point[p] for point in points)
+        for p, parameter in enumerate(parameters)
+    }
+
+
+class ScenarioModel(MILPModel):
+    """
+    MILPModel with one scenario per grid point. parameters are the swept
+    parameters ('Q', 'T_bar', 'D_bar' or 'S_i', with one S_i value for every
+    customer) and points their values per scenario.
+    """
+    def __init__(self, parameters, points, params=None, telemetry=None):
+        for parameter in parameters:
+            if parameter not in PARAMETER_FAMILIES:
+                raise ValueError(f"Unknown parameter: {parameter}")
+        super().__init__(params=params, telemetry=telemetry)
+        self.parameters = list(parameters)
+        self.points = [tuple(point) for point in points]
+
+
+    @timed_phase
+    def setup_contraints(self):
+        """
+        Builds the constraints for the loosest values of the sweep,
+        reformulates them and sets the values of every scenario.
+        """
+        self.base_data = self.data
+        self.scenario_data = [override_data(self.data, dict(zip(self.parameters, point)))
+                              for point in self.points]
+        self.data = override_data(self.data, loosest_point(self.parameters, self.points))
+        self.constraints = add_constraints(self.model, self.data, self.variables)
+
+        # (8) Travel time flow conservation with the service time on the right-hand side
+        x = self.variables['x']
+        arcs = self.data['arcs']
+        graph = get_graph_index(self.data)
+        for i, constr in self.constraints['time_flow'].items():
+            for a in graph.out_arcs(i):
+                self.model.chgCoeff(constr, x[a], -arcs[a]['time'])
+            constr.RHS = self.data['vertices'][i]['S_i']
+
+        apply_bounds(self.model, self.data, self.variables)
+        self.apply_scenarios()
+
+
+    def apply_scenarios(self):
+        """
+        Sets the bounds and right-hand sides of every scenario.
+        """
+        flow_constrs = list(self.constraints['time_flow'].items())
+        bounded = [(list(self.variables[name].values()), limit)
+                   for name, limit in (('y', 'Q'), ('z', 'T_bar'), ('z_prime', 'D_bar'))]
+
+        self.model.NumScenarios = len(self.points)
+        for s, data in enumerate(self.scenario_data):
+            self.model.Params.ScenarioNumber = s
+            for family, limit in bounded:
+                self.model.setAttr('ScenNUB', family, [data['other'][limit]] * len(family))
+            self.model.setAttr('ScenNRHS', [constr for _, constr in flow_constrs],
+                               [data['vertices'][i]['S_i'] for i, _ in flow_constrs])
+            self.variables['k'].ScenNLB = fleet_lower_bound(data)
+        self.model.update()
+
+
+    def set_parameter(self, parameter, value):
+        """
+        The parameter values of every scenario are fixed when the model is
+        built; build a new ScenarioModel for other points.
+        """
+        raise TypeError(f"Cannot set {parameter} on a ScenarioModel: the scenario values are fixed "
+                        "when it is built, build a new one for other points")
+
+
+    def solve_mode(self):
+        return type(self).__name__
+
+
+    @timed_phase
+    def optimize_model(self):
+        """
+        Solves all scenarios at once. status is 1 if every scenario is solved
+        to optimality or proven infeasible; scenario_results has the answers.
+        """
+        if self.callbacks:
+            self.model.optimize(self.callback)
+        else:
+            self.model.optimize()
+        self.status = 1 if self.model.Status in (GRB.OPTIMAL, GRB.INFEASIBLE) else 0
+        if not self.status:
+            print(f"Optimization ended with status {self.model.Status}")
+
+
+    def scenario_results(self):
+        """
+        Returns (status, result) per scenario in the order of the points:
+        (1, SolveResult) if optimal, (2, None) if infeasible and (0, None) if
+        the solve stopped before the scenario was answered.
+        """
+        answers = []
+        for s, data in enumerate(self.scenario_data):
+            if self.model.Status == GRB.INFEASIBLE:
+                answers.append((2, None))
+                continue
+            self.model.Params.ScenarioNumber = s
+            if self.model.ScenNObjBound >= GRB.INFINITY:
+                answers.append((2, None))
+            elif self.model.Status != GRB.OPTIMAL or self.model.ScenNObjVal >= GRB.INFINITY:
+                answers.append((0, None))
+            else:
+                result = self.extract_results('ScenNX', 'ScenNObjVal', data)
+                # The objective is the distance, without the tolerances in ScenNObjVal
+                result.obj = float(result.VMT)
+                answers.append((1, result))
+        return answers
+
+
+def solve_scenarios(filepath, parameters, points, threads=None, telemetry=False, solve_cache=None,
+                    store_path=None):
+    """
+    Solves the grid points of a sweep as the scenarios of one model and
+    returns their result rows in the order of the points, like
+    solve_grid_points in sensitivity_analysis.py. Points in the solve cache
+    or failing screening are answered without becoming a scenario.
+    """
+    params = {'Threads': threads} if threads else None
+    base_data = load_instance(filepath)
+    # The answers are cached under the key of solving the point with MILPModel
+    key_params = {**load_profile(base_data), **(params or {})}
+    store = ResultStore(store_path, parameters) if store_path is not None else None
+
+    answers = {}
+    pending = []
+    for point in points:
+        point = tuple(point)
+        point_data = override_data(base_data, dict(zip(parameters, point)))
+        cached = None
+        if solve_cache is not None:
+            cached = solve_cache.get(solve_cache.key(point_data, 'MILPModel', key_params), point_data)
+        findings = screen(point_data) if cached is None else []
+        if cached is not None:
+            answers[point] = (*cached, 'cached')
+        elif findings:
+            answers[point] = (2, None, 'screened')
+            print(f"{tuple(parameters)} = {point}: {explain(findings)}")
+        else:
+            pending.append(point)
+
+    batch = None
+    if pending:
+        model = ScenarioModel(parameters, pending, params, Telemetry() if telemetry else None)
+        model.data_setup(base_data)
+        model.setup_contraints()
+        model.optimize_model()
+        if telemetry:
+            batch = model.telemetry.flush(model.model, scenarios=len(pending))
+        for point, data, (status, result) in zip(pending, model.scenario_data, model.scenario_results()):
+            answers[point] = (status, result, 'scenario')
+            if solve_cache is not None:
+                solve_cache.put(solve_cache.key(data, 'MILPModel', key_params), status, result)
+
+    rows = []
+    for point in points:
+        point = tuple(point)
+        status, result, source = answers[point]
+        if status == 1:
+            print(f"!!!!!!!    For {tuple(parameters)} = {point}: k= {result.k}, VMT= {result.VMT}, "
+                  f"VTT= {result.VTT}")
+        row = [*point, *result_fields(status, result, source)]
+        if store is not None:
+            store.append(row)
+        if telemetry:
+            # The record of the shared solve goes with the first scenario
+            row.append({'point': dict(zip(parameters, point)), 'source': source, 'status': status,
+                        'batch': batch if source == 'scenario' and point == pending[0] else None})
+        rows.append(row)
+    return rows
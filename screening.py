@@ -0,0 +1,114 @@
+"""
+Screening File
+
+Cheap feasibility checks that run before the model is built or solved, and
+IIS diagnostics for the instances that pass them but are still infeasible.
+Every customer needs a route of its own at the very least, so a customer
+with more packages than Q, or whose fastest (shortest) round trip from the
+depot exceeds T_bar (D_bar), makes the instance infeasible.
+"""
+
+import json
+import os
+import re
+from collections import Counter
+
+from preprocessing import route_bounds
+
+
+IIS_CACHE_DIR = ".iis_cache"
+
+
+def screen(data):
+    """
+    Returns the screening findings, empty if the instance passes: one dict
+    per customer and parameter with the value the customer requires and the
+    current limit. The round trips use the shortest paths from and to the
+    depot, with the service time of the customer.
+    """
+    vertices = data['vertices']
+    other = data['other']
+    inf = float('inf')
+
+    findings = []
+    for i, values in data['vertices_prime'].items():
+        if values['N_i'] > other['Q']:
+            findings.append({'customer': i, 'parameter': 'Q', 'required': values['N_i'],
+                             'limit': other['Q']})
+
+    bounds = route_bounds(data)
+    for i in data['vertices_prime']:
+        time = bounds['time_to'].get(i, inf) + vertices[i]['S_i'] + bounds['time_back'].get(i, inf)
+        if time > other['T_bar']:
+            findings.append({'customer': i, 'parameter': 'T_bar', 'required': time,
+                             'limit': other['T_bar']})
+        distance = bounds['dist_to'].get(i, inf) + bounds['dist_back'].get(i, inf)
+        if distance > other['D_bar']:
+            findings.append({'customer': i, 'parameter': 'D_bar', 'required': distance,
+                             'limit': other['D_bar']})
+    return findings
+
+
+def binding_parameters(findings):
+    """
+    Returns {parameter: smallest value that passes screening} for the
+    parameters that make the instance infeasible.
+    """
+    required = {}
+    for finding in findings:
+        parameter = finding['parameter']
+        required[parameter] = max(required.get(parameter, finding['required']), finding['required'])
+    return required
+
+
+def explain(findings):
+    """
+    Returns a one-line explanation of the screening findings.
+    """
+    parts = []
+    for parameter, value in binding_parameters(findings).items():
+        customers = sorted(f['customer'] for f in findings if f['parameter'] == parameter)
+        parts.append(f"{parameter} must be at least {value} (customers {customers})")
+    return "Infeasible by screening: " + "; ".join(parts)
+
+
+def compute_iis(model):
+    """
+    Computes an IIS of the infeasible Gurobi model. Returns the names of the
+    constraints and variable bounds in it, and the number of members per
+    constraint family (the name without its index).
+    """
+    model.computeIIS()
+    constraints = [c.ConstrName for c in model.getConstrs() if c.IISConstr]
+    bounds = [v.VarName + (' >= LB' if v.IISLB else ' <= UB')
+              for v in model.getVars() if v.IISLB or v.IISUB]
+    families = Counter(re.split(r'[\[_]\d', name)[0] for name in constraints)
+    return {'constraints': constraints, 'bounds': bounds, 'families': dict(families)}
+
+
+class IISCache():
+    """
+    IIS results on disk, keyed like the solve cache (see solve_cache.py).
+    """
+    def __init__(self, cache_dir=IIS_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+
+    def get(self, key):
+        try:
+            with open(self.path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+    def put(self, key, iis):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self.path(key)}.tmp{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            json.dump(iis, f)
+        os.replace(tmp_path, self.path(key))
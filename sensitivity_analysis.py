@@ -5,16 +5,144 @@ This file performs a sensitivity analysis
 """
 
 from main import MILPModel
+from screening import screen, explain, binding_parameters
+from result_store import ResultStore, result_fields, RESULT_COLUMNS
+from instance_cache import load_instance
+from solve_cache import SolveCache, override_data
+from solver_profiles import load_profile
+from scenarios import solve_scenarios
+from sweep_planner import SweepPlanner
+from telemetry import Telemetry
 from gurobipy import GRB
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
 import pandas as pd
 import numpy as np
 
+
+def solve_grid_points(filepath, parameters, points, threads=None, telemetry=False, solve_cache=None,
+                      plan=False, store_path=None):
+    """
+    Builds the model once and solves it for every point, where a point holds
+    one value per parameter. Returns one result row per point, in the order
+    of points: the parameter values followed by obj_val, VMT, VTT, k, routes,
+    status and source. With telemetry every row ends with the telemetry
+    record of its solve. With store_path every row is appended to that result store
+    (see result_store.py) as soon as the point is done.
+
+    With a SolveCache the points are looked up first and the model is only
+    built once a point is not in the cache. Points that fail screening (see
+    screening.py) are infeasible without a solve. With plan the points are solved
+    loosest first and answered from the points before them where possible
+    (see sweep_planner.py).
+    """
+    params = {'Threads': threads} if threads else None
+    model = None
+    base_data = load_instance(filepath)
+    # The key of MILPModel, with the tuned parameters it picks up for the instance
+    key_params = {**load_profile(base_data), **(params or {})}
+    planner = SweepPlanner(parameters, points) if plan else None
+    store = ResultStore(store_path, parameters) if store_path is not None else None
+
+    rows = {}
+    for point in (planner.order() if plan else [tuple(point) for point in points]):
+        overrides = dict(zip(parameters, point))
+        point_data = override_data(base_data, overrides)
+        source, record = 'solved', None
+
+        cached = None
+        if solve_cache is not None:
+            key = solve_cache.key(point_data, 'MILPModel', key_params)
+            cached = solve_cache.get(key, point_data)
+        # Screening explains hopeless points without building the model
+        findings = screen(point_data) if cached is None else []
+        action, start_routes, lower_bound = 'solve', None, None
+        if cached is None and not findings and plan:
+            action, start_routes, lower_bound = planner.plan(point, point_data)
+
+        if cached is not None:
+            status, result = cached
+            source = 'cached'
+            print(f"Result for {tuple(parameters)} = {tuple(point)} loaded from the solve cache")
+        elif findings:
+            status, result = 2, None
+            source = 'screened'
+            print(f"{tuple(parameters)} = {tuple(point)}: {explain(findings)}")
+        elif action == 'infeasible':
+            status, result = 2, None
+            source = 'planned'
+            print(f"{tuple(parameters)} = {tuple(point)} is tighter than an infeasible point")
+        elif action == 'optimal':
+            status, result = 1, start_routes
+            source = 'planned'
+            print(f"{tuple(parameters)} = {tuple(point)} is solved by the optimum of a looser point")
+        else:
+            if model is None:
+                model = MILPModel(params=params, telemetry=Telemetry() if telemetry else None,
+                                  solve_cache=solve_cache)                     # Initialise and set up model
+                model.model_setup(filepath)
+                model.setup_contraints()
+            for parameter, value in overrides.items():
+                model.set_parameter(parameter, value)                           # Override the value
+            model.optimize_model(start_routes=start_routes, lower_bound=lower_bound)   # Optimize (warm-started)
+            status = model.status
+            result = model.analyze_results() if status == 1 else None
+            if telemetry:
+                record = model.telemetry.flush(model.model, point=overrides)
+
+        if source in ('planned', 'screened') and solve_cache is not None:
+            solve_cache.put(key, status, result)
+        if plan:
+            planner.record(point, status, result)
+
+        if status == 1:
+            obj_val, k, VMT, VTT, routes = result
+            print(f"!!!!!!!    For {tuple(parameters)} = {tuple(point)}: k= {k}, VMT= {VMT}, VTT= {VTT}")
+        else:
+            print("Model Infeasible!")
+        row = [*point, *result_fields(status, result, source)]
+        if store is not None:
+            store.append(row)
+
+        if telemetry:
+            row.append(record or {'point': overrides, 'source': source, 'status': status,
+                                  'screening': binding_parameters(findings)})
+        rows[tuple(point)] = row
+
+        print('')
+        print('#######################################################################################')
+        print('')
+
+    return [rows[tuple(point)] for point in points]
+
+
 class SensitivityAnalysis():
     """
     Class that performs the sensitivity analysis.
+
+    With workers > 1 the grid points are spread over a process pool. Every
+    solve then gets threads_per_solve Gurobi threads (by default the cores
+    divided over the workers) so the workers do not oversubscribe the cores.
+    With telemetry the phase times and incumbent/bound timeline of every
+    grid point are written next to the results csv (see telemetry.py).
+    With cache the results are kept in the solve cache (see solve_cache.py),
+    so re-running an unchanged grid does not solve again. With plan the
+    points are answered from the monotonicity in Q, T_bar, D_bar and S_i
+    where possible (see sweep_planner.py); with workers > 1 this works
+    within the chunk of every worker. With scenarios the points are solved
+    as the scenarios of one Gurobi model instead (see scenarios.py); the
+    workers are not used then, give the solve threads_per_solve instead.
     """
-    def __init__(self):
+    def __init__(self, workers=1, threads_per_solve=None, telemetry=False, cache=True, plan=True,
+                 scenarios=False):
         self.filepath = "datasheet.xlsx"
+        self.workers = workers
+        self.threads_per_solve = threads_per_solve
+        self.telemetry = telemetry
+        self.solve_cache = SolveCache() if cache else None
+        self.plan = plan
+        self.scenarios = scenarios
         self.ranges = {
             'Q': [80, 90, 100, 110, 120],
             'T_bar': [360, 420, 480, 540, 600],
@@ -23,52 +151,85 @@ class SensitivityAnalysis():
         }
 
 
-    def optimize_models(self, parameter_choice: str):
+    def solve_points(self, parameters, points, store_path=None):
         """
-        Optimizes the model for each parameter specified in the range.
-        Saves the result to a csv file
+        Solves all grid points and returns their result rows in grid order.
+        Each worker takes a contiguous chunk of the grid, so it builds one
+        model and warm-starts the points of its chunk from each other. With
+        store_path the rows are streamed into that result store; workers
+        write to part files that are merged into it at the end.
         """
-        # Set file path
-        filepath = f"sensitivity_results/{parameter_choice}_sens.csv"
+        if self.scenarios:
+            return solve_scenarios(self.filepath, parameters, points, self.threads_per_solve,
+                                   self.telemetry, self.solve_cache, store_path)
+
+        workers = min(self.workers, len(points))
+        if workers <= 1:
+            return solve_grid_points(self.filepath, parameters, points, self.threads_per_solve,
+                                     self.telemetry, self.solve_cache, self.plan, store_path)
 
-        # Set up data frame
-        columns = [parameter_choice, 'obj_val', 'VMT', 'VTT', 'k', 'routes']
-        result_df = pd.DataFrame(columns=columns)
-        
-        # Loop to optimize the model for all the values in the range
-        for value in self.ranges[parameter_choice]:
+        threads = self.threads_per_solve or max(1, (os.cpu_count() or 1) // workers)
+        chunk_size = -(-len(points) // workers)
+        chunks = [points[start:start + chunk_size] for start in range(0, len(points), chunk_size)]
 
-            self.model = MILPModel()                                            # Initialise and set up model
-            self.model.model_setup(self.filepath)
-            if parameter_choice == 'S_i':
-                for vertex in self.model.data['vertices'].values():
-                    vertex['S_i'] = value
-            else: 
-                self.model.data['other'][parameter_choice] = value              # Override the value
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(
+                solve_grid_points,
+                [self.filepath] * len(chunks),
+                [parameters] * len(chunks),
+                chunks,
+                [threads] * len(chunks),
+                [self.telemetry] * len(chunks),
+                [self.solve_cache] * len(chunks),
+                [self.plan] * len(chunks),
+                [None if store_path is None else f"{store_path}.part{n}" for n in range(len(chunks))],
+            )
+            rows = [row for rows in results for row in rows]
 
-            self.model.setup_contraints()
-            self.model.optimize_model()             # Optimize
+        if store_path is not None:
+            ResultStore(store_path, parameters)     # Merges the part files
+        return rows
 
-            if self.model.status == 1:
-                obj_val, k, VMT, VTT, routes = self.model.analyze_results()
-                print(f"!!!!!!!    For {parameter_choice} = {value}: k= {k}, VMT= {VMT}, VTT= {VTT}")
-                result_df.loc[len(result_df)] = [value, obj_val, VMT, VTT, k, '']
-            else:
-                print("Model Infeasible!")
-                result_df.loc[len(result_df)] = [value, pd.NA, pd.NA, pd.NA, pd.NA, pd.NA]
 
-            print('')
-            print('#######################################################################################')
-            print('')
+    def split_telemetry(self, filepath, rows):
+        """
+        Writes the telemetry records at the end of the rows to a JSONL file
+        next to the results csv and returns the rows without them.
+        """
+        if not self.telemetry:
+            return rows
+        self.write_telemetry(filepath, [row[-1] for row in rows])
+        return [row[:-1] for row in rows]
 
-        # Export the dataframe to a csv to store results
-        result_df.to_csv(filepath, index=False)
+
+    def write_telemetry(self, filepath, records):
+        with open(filepath.replace('.csv', '_telemetry.jsonl'), 'a') as f:
+            for record in records:
+                f.write(json.dumps(record, default=str) + '\n')
+
+
+    def optimize_models(self, parameter_choice: str):
+        """
+        Optimizes the model for each parameter specified in the range.
+        Every result is appended to the csv as soon as it is solved, and a
+        rerun only solves the values that are not in the csv yet.
+        """
+        # Set file path
+        filepath = f"sensitivity_results/{parameter_choice}_sens.csv"
+
+        # Optimize the model for all the values in the range that are not stored yet
+        store = ResultStore(filepath, [parameter_choice])
+        points = store.missing([(value,) for value in self.ranges[parameter_choice]])
+        print(f"{len(self.ranges[parameter_choice]) - len(points)} points already in {filepath}")
+        if points:
+            self.split_telemetry(filepath, self.solve_points([parameter_choice], points, filepath))
 
 
     def cross_vary_models(self, parameter1, parameter2):
         """
         Allows for a choice of two parameters to cross vary.
-        You cannot choose S_i in this method.
+        You cannot choose S_i in this method. Like optimize_models the
+        results are streamed into the csv and a rerun resumes the sweep.
         """
         # First order the two variables s.t. there are no ambiguous csv files
         param1, param2 = sorted([parameter1, parameter2])
@@ -76,40 +237,122 @@ class SensitivityAnalysis():
         # Set file path
         filepath = f"sensitivity_results/cv_{param1}_{param2}_sens.csv"
 
-        # Set up data frame
-        columns = [param1, param2, 'obj_val', 'VMT', 'VTT', 'k', 'routes']
-        result_df = pd.DataFrame(columns=columns)
+        if param1 == 'S_i' or param2 == 'S_i':
+            raise ValueError("You cannot choose S_i")
+
+        # Optimize the model for all the combinations of values that are not stored yet
+        store = ResultStore(filepath, [param1, param2])
+        grid = [(value1, value2) for value1 in self.ranges[param1] for value2 in self.ranges[param2]]
+        points = store.missing(grid)
+        print(f"{len(grid) - len(points)} points already in {filepath}")
+        if points:
+            self.split_telemetry(filepath, self.solve_points([param1, param2], points, filepath))
+
+
+    def adaptive_cross_vary(self, parameter1, parameter2, depth=2, max_solves=None):
+        """
+        Cross varies two parameters on a grid that is 2^depth times finer
+        than self.ranges, but only solves where the results change. Starting
+        from the coarse grid, every cell whose corners differ in feasibility,
+        k or objective is split in four until it cannot be split further or
+        max_solves points have been solved.
+
+        The other cells are filled in: as the model only gets looser with
+        Q, T_bar and D_bar, a cell whose corners agree has the answer of its
+        tightest corner everywhere inside. Cells left unsplit because of the
+        budget get the answer of their nearest corner. The points are solved
+        through the result store of cross_vary_models (see result_store.py),
+        so they are streamed to the csv and a rerun resumes from the stored
+        answers; the filled-in points follow with source 'inferred' or
+        'approximate'. The store then holds the full fine grid, so
+        contour_plots renders it as before.
+        """
+        param1, param2 = sorted([parameter1, parameter2])
+        if 'S_i' in (param1, param2):
+            raise ValueError("You cannot choose S_i")
+        filepath = f"sensitivity_results/cv_{param1}_{param2}_sens.csv"
+
+        def refine(values):
+            fine = [np.linspace(a, b, 2**depth + 1) for a, b in zip(values[:-1], values[1:])]
+            fine = np.unique(np.concatenate(fine)) if fine else np.array(values)
+            if all(float(v).is_integer() for v in values):
+                fine = np.unique(np.round(fine).astype(int))
+            return fine.tolist()
+
+        axes = [refine(sorted(self.ranges[param1])), refine(sorted(self.ranges[param2]))]
+        coarse = [[axis.index(v) for v in sorted(self.ranges[p])] for axis, p in zip(axes, (param1, param2))]
+
+        store = ResultStore(filepath, [param1, param2])
+        stored = store.rows()
+        results = {}        # (i, j) -> result row with its source
+        records = []
 
-        # Loop to optimize the model for all the values in the range
-        for value1 in self.ranges[param1]:
-            for value2 in self.ranges[param2]:
+        def solve(indices):
+            indices = [ij for ij in dict.fromkeys(indices) if ij not in results]
+            # Points answered by an earlier run are not solved again
+            for i, j in indices:
+                row = stored.get((float(axes[0][i]), float(axes[1][j])))
+                if row is not None and row[-1] not in ('inferred', 'approximate'):
+                    results[i, j] = row
+            indices = [ij for ij in indices if ij not in results]
+            if max_solves is not None:
+                indices = indices[:max(0, max_solves - len(records))]
+            points = [(axes[0][i], axes[1][j]) for i, j in indices]
+            rows = self.solve_points([param1, param2], points, filepath) if points else []
+            for ij, row in zip(indices, rows):
+                records.append(row[-1] if self.telemetry else None)
+                results[ij] = row[:-1] if self.telemetry else row
 
-                self.model = MILPModel()                                        # Initialise and set up model
-                self.model.model_setup(self.filepath)
-                if param1 == 'S_i' or param2 == 'S_i':
-                    raise ValueError("You cannot choose S_i")
-                
-                self.model.data['other'][param1] = value1              # Override the value for param1
-                self.model.data['other'][param2] = value2              # Override the value for param2
+        def signature(row):
+            return (pd.isna(row[2]), None if pd.isna(row[2]) else (row[2], row[5]))
 
-                self.model.setup_contraints()
-                self.model.optimize_model()             # Optimize
+        def corners(cell):
+            i0, i1, j0, j1 = cell
+            return [(i0, j0), (i0, j1), (i1, j0), (i1, j1)]
 
-                if self.model.status == 1:
-                    obj_val, k, VMT, VTT, routes = self.model.analyze_results()
-                    print(f"!!!!!!!    For {param1, param2} = {value1, value2}: k= {k}, VMT= {VMT}, VTT= {VTT}")
-                    result_df.loc[len(result_df)] = [value1, value2, obj_val, VMT, VTT, k, '']
-                else:
-                    print("Model Infeasible!")
-                    result_df.loc[len(result_df)] = [value1, value2, pd.NA, pd.NA, pd.NA, pd.NA, pd.NA]
+        cells = [(i0, i1, j0, j1) for i0, i1 in zip(coarse[0][:-1], coarse[0][1:])
+                 for j0, j1 in zip(coarse[1][:-1], coarse[1][1:])]
+        solve([(i, j) for i in coarse[0] for j in coarse[1]])
 
-                print('')
-                print('#######################################################################################')
-                print('')
+        uniform, unresolved = [], []
+        while cells:
+            children = []
+            for cell in cells:
+                i0, i1, j0, j1 = cell
+                if any(c not in results for c in corners(cell)):
+                    unresolved.append(cell)
+                elif len({signature(results[c]) for c in corners(cell)}) == 1:
+                    uniform.append(cell)
+                elif i1 - i0 > 1 or j1 - j0 > 1:
+                    i_split = [i0, (i0 + i1) // 2, i1] if i1 - i0 > 1 else [i0, i1]
+                    j_split = [j0, (j0 + j1) // 2, j1] if j1 - j0 > 1 else [j0, j1]
+                    children += [(a, b, c, d) for a, b in zip(i_split[:-1], i_split[1:])
+                                 for c, d in zip(j_split[:-1], j_split[1:])]
+            solve([c for cell in children for c in corners(cell)])
+            cells = children
 
-        # Export the dataframe to a csv to store results
-        result_df.to_csv(filepath, index=False)
+        for cells, source in ((uniform, 'inferred'), (unresolved, 'approximate')):
+            for cell in cells:
+                i0, i1, j0, j1 = cell
+                known = [c for c in corners(cell) if c in results]
+                for i in range(i0, i1 + 1):
+                    for j in range(j0, j1 + 1):
+                        if (i, j) in results or not known:
+                            continue
+                        # The tightest corner of an inferred cell, the nearest known one otherwise
+                        if source == 'inferred':
+                            ci, cj = i0, j0
+                        else:
+                            ci, cj = min(known, key=lambda c: abs(c[0] - i) + abs(c[1] - j))
+                        results[i, j] = [axes[0][i], axes[1][j], *results[ci, cj][2:8], source]
+                        store.append(results[i, j])
 
+        if self.telemetry:
+            self.write_telemetry(filepath, records)
+        columns = [param1, param2, *RESULT_COLUMNS]
+        result_df = pd.DataFrame([row for _, row in sorted(results.items())], columns=columns)
+        print(f"Adaptive grid: solved {len(records)} of {len(result_df)} points")
+        return result_df
 
 
 if __name__ == '__main__':
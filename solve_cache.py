@@ -0,0 +1,162 @@
+"""
+Solve Cache File
+
+Persistent cache of solve results. An entry is keyed by the SHA-256 of the
+instance data (with the overridden parameters already applied), the solver
+mode and the Gurobi settings that can change the answer, and holds the
+objective, k, VMT, VTT, routes and status. Entries are JSON files in the
+cache directory; the least recently used ones are removed once the
+directory grows beyond max_bytes.
+"""
+
+import copy
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from routes import SolveResult, route_summary
+
+
+CACHE_DIR = ".solve_cache"
+# Parameters that only change how the solve runs, not its answer
+IGNORED_PARAMS = ('Threads', 'OutputFlag', 'LogFile', 'LogToConsole')
+
+
+def data_hash(data):
+    """
+    Returns the SHA-256 of the vertices, arcs and parameters of the data.
+    """
+    digest = hashlib.sha256()
+    vertices = sorted(data['vertices'].items())
+    digest.update(json.dumps([[v, values['N_i'], values['S_i']] for v, values in vertices]).encode())
+    digest.update(json.dumps(sorted(data['other'].items())).encode())
+
+    arcs = data['arcs']
+    digest.update(np.array([(i, j) for (i, j) in arcs], dtype=np.int64).tobytes())
+    digest.update(np.array([(a['distance'], a['time']) for a in arcs.values()], dtype=float).tobytes())
+    return digest.hexdigest()
+
+
+def solve_key(data, mode='MILPModel', params=None):
+    """
+    Returns the cache key of solving the data with the formulation mode and
+    the Gurobi params.
+    """
+    settings = {name: value for name, value in (params or {}).items() if name not in IGNORED_PARAMS}
+    digest = hashlib.sha256(data_hash(data).encode())
+    digest.update(json.dumps([mode, sorted(settings.items())], default=str).encode())
+    return digest.hexdigest()
+
+
+def override_data(data, overrides):
+    """
+    Returns a copy of the data with the parameter values applied the way
+    MILPModel.set_parameter applies them, without building a model.
+    """
+    data = {
+        'vertices': copy.deepcopy(data['vertices']),
+        'vertices_prime': copy.deepcopy(data['vertices_prime']),
+        'arcs': data['arcs'],
+        'other': dict(data['other']),
+    }
+    for parameter, value in overrides.items():
+        if parameter == 'S_i':
+            if not isinstance(value, dict):
+                value = {v: value for v in data['vertices']}
+            for v, s in value.items():
+                data['vertices'][v]['S_i'] = s
+                if v in data['vertices_prime']:
+                    data['vertices_prime'][v]['S_i'] = s
+        else:
+            data['other'][parameter] = value
+    return data
+
+
+class SolveCache():
+    """
+    Content-addressed solve results on disk with LRU eviction. Only final
+    answers are stored: status 1 (optimal) with its result, or status 2
+    (infeasible).
+    """
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=100 * 2**20):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+
+    def key(self, data, mode='MILPModel', params=None):
+        return solve_key(data, mode, params)
+
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+
+    def contains(self, key):
+        """
+        Returns whether the key is cached, without counting a hit or miss.
+        """
+        return os.path.exists(self.path(key))
+
+
+    def get(self, key, data=None):
+        """
+        Returns (status, result) for the key, or None if it is not cached.
+        result is a SolveResult (route_stats filled in when data is given)
+        or None for an infeasible instance.
+        """
+        try:
+            with open(self.path(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        os.utime(self.path(key))        # Mark as recently used
+
+        if entry['status'] != 1:
+            return entry['status'], None
+        routes = {int(route_id): route for route_id, route in entry['routes'].items()}
+        route_stats = ({route_id: route_summary(data, route) for route_id, route in routes.items()}
+                       if data is not None else {})
+        return 1, SolveResult(entry['obj'], entry['k'], entry['VMT'], entry['VTT'], routes, route_stats)
+
+
+    def put(self, key, status, result=None):
+        """
+        Stores a final answer and evicts the least recently used entries
+        beyond max_bytes.
+        """
+        if status not in (1, 2):
+            return
+        entry = {'status': status}
+        if status == 1:
+            obj, k, VMT, VTT, routes = result
+            entry.update(obj=obj, k=k, VMT=VMT, VTT=VTT, routes=routes)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self.path(key)}.tmp{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f, default=int)
+        os.replace(tmp_path, self.path(key))
+        self.evict()
+
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.json'):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+            total -= size
@@ -0,0 +1,63 @@
+"""
+Solver Profiles File
+
+Tuned Gurobi parameter sets per formulation (the solve_mode of the model,
+e.g. 'MILPModel') and instance size class, as written by tuning.py.
+MILPModel.data_setup looks up the profile of its formulation and of the
+class of its instance as loaded (before any pruning, like tuning.py), and
+optimize_model applies it below the parameters that were set explicitly.
+"""
+
+import json
+import os
+
+
+PROFILE_PATH = "solver_profiles.json"
+# Upper bounds on the number of customers of every size class
+CUSTOMER_CLASSES = ((10, 'xs'), (25, 's'), (60, 'm'), (150, 'l'), (float('inf'), 'xl'))
+
+
+def size_class(data):
+    """
+    Returns the size class of the instance: the customer class and whether
+    the arc set is dense (at least half of the complete graph) or sparse,
+    e.g. 's-dense'.
+    """
+    n_customers = len(data['vertices_prime'])
+    n_vertices = len(data['vertices'])
+    customers = next(name for limit, name in CUSTOMER_CLASSES if n_customers <= limit)
+    density = len(data['arcs']) / max(1, n_vertices * (n_vertices - 1))
+    return f"{customers}-{'dense' if density >= 0.5 else 'sparse'}"
+
+
+def read_profiles(path=PROFILE_PATH):
+    """
+    Returns the stored profiles {mode: {size class: profile}}, empty if
+    there are none.
+    """
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_profiles(profiles, mode='MILPModel', path=PROFILE_PATH):
+    """
+    Merges the profiles {size class: profile} of the mode into the stored
+    ones.
+    """
+    stored = read_profiles(path)
+    stored.setdefault(mode, {}).update(profiles)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(stored, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def load_profile(data, mode='MILPModel', path=PROFILE_PATH):
+    """
+    Returns the tuned parameters of the mode for the size class of the
+    instance, or an empty dict.
+    """
+    return dict(read_profiles(path).get(mode, {}).get(size_class(data), {}).get('params', {}))
@@ -0,0 +1,112 @@
+"""
+Sweep Planner File
+
+Uses the monotonicity of the model in its parameters to answer grid points
+of a sensitivity sweep without solving them. Raising Q, T_bar or D_bar (or
+lowering S_i) only relaxes the model, so
+
+- a point is infeasible if a looser point is infeasible;
+- the optimum of a looser point is a lower bound, and if its routes are
+  feasible at a tighter point they are optimal there too;
+- the routes of any solved point that are feasible at a point make a MIP
+  start for it.
+
+The implications hold along every axis of a grid at the same time.
+"""
+
+from routes import evaluate_routes, route_feasible
+
+
+# +1 if a higher value relaxes the model, -1 if it tightens it
+RELAXING = {'Q': 1, 'T_bar': 1, 'D_bar': 1, 'S_i': -1}
+
+
+class SweepPlanner():
+    """
+    Orders the grid points loosest first and keeps the answers found so far.
+    A point p is looser than (or as loose as) q if it is on every parameter.
+    """
+    def __init__(self, parameters, points):
+        for parameter in parameters:
+            if parameter not in RELAXING:
+                raise ValueError(f"Unknown parameter: {parameter}")
+        self.parameters = list(parameters)
+        self.points = [tuple(point) for point in points]
+        self.infeasible = []
+        self.solved = []        # (point, result)
+
+
+    def looser(self, p, q):
+        """
+        Checks whether the model at p is a relaxation of the model at q.
+        """
+        return all(RELAXING[parameter] * (a - b) >= 0
+                   for parameter, a, b in zip(self.parameters, p, q))
+
+
+    def order(self):
+        """
+        Returns the points loosest first: a point comes after every point
+        that is looser on all parameters.
+        """
+        ranks = []
+        for position, parameter in enumerate(self.parameters):
+            values = sorted({point[position] for point in self.points},
+                            reverse=RELAXING[parameter] < 0)
+            ranks.append({value: rank for rank, value in enumerate(values)})
+        return sorted(self.points,
+                      key=lambda point: -sum(rank[value] for rank, value in zip(ranks, point)))
+
+
+    def record(self, point, status, result=None):
+        if status == 1:
+            self.solved.append((tuple(point), result))
+        elif status == 2:
+            self.infeasible.append(tuple(point))
+
+
+    def known_infeasible(self, point):
+        return any(self.looser(q, point) for q in self.infeasible)
+
+
+    def lower_bound(self, point):
+        """
+        Returns the largest optimum of a looser point, or None.
+        """
+        bounds = [result.obj for q, result in self.solved if self.looser(q, point)]
+        return max(bounds) if bounds else None
+
+
+    def feasible_results(self, point, data):
+        """
+        Returns the solved results whose routes are feasible in data (the
+        instance at point), best first.
+        """
+        feasible = [
+            (q, result) for q, result in self.solved
+            if all(route_feasible(data, route) for route in result.routes.values())
+        ]
+        return sorted(feasible, key=lambda item: item[1].obj)
+
+
+    def plan(self, point, data):
+        """
+        Returns how to handle point, with data the instance at point:
+        ('infeasible', None, None) if it is known infeasible,
+        ('optimal', result, None) if a looser optimum is feasible here, or
+        ('solve', routes, lower_bound) with the best known feasible routes
+        as MIP start (or None) and the lower bound (or None).
+        """
+        if self.known_infeasible(point):
+            return 'infeasible', None, None
+
+        feasible = self.feasible_results(point, data)
+        lower_bound = self.lower_bound(point)
+        for q, result in feasible:
+            # A looser optimum that is feasible here, or any feasible route
+            # set that reaches the lower bound, is optimal
+            if self.looser(q, point) or (lower_bound is not None and result.obj <= lower_bound + 1e-6):
+                return 'optimal', evaluate_routes(data, result.routes, obj=result.obj), None
+
+        routes = feasible[0][1].routes if feasible else None
+        return 'solve', routes, lower_bound
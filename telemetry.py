@@ -0,0 +1,160 @@
+"""
+Telemetry File
+
+Optional instrumentation of MILPModel solves: wall-clock time per phase
+(model_setup, setup_contraints, optimize_model, analyze_results), the
+timeline of incumbents and bounds from a Gurobi callback and the model size.
+Every solve becomes one JSON record, appended to a JSONL file when a path is
+given. Models built without a Telemetry object skip all of this.
+"""
+
+import functools
+import json
+import math
+import time
+from contextlib import contextmanager
+
+from gurobipy import GRB, GurobiError
+
+
+def timed_phase(method):
+    """
+    Decorator for MILPModel methods that times the call as a phase named
+    after the method when the model has telemetry.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        telemetry = getattr(self, 'telemetry', None)
+        if telemetry is None:
+            return method(self, *args, **kwargs)
+        with telemetry.phase(method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _gap(obj, bound):
+    if obj is None or bound is None or obj == 0:
+        return None
+    return abs(obj - bound) / abs(obj)
+
+
+def _attr(model, name):
+    """
+    Returns a model attribute, or None if Gurobi has no value for it (e.g.
+    ObjVal without a solution).
+    """
+    try:
+        value = getattr(model, name)
+    except (AttributeError, GurobiError):
+        return None
+    return None if isinstance(value, float) and (math.isnan(value) or abs(value) >= GRB.INFINITY) else value
+
+
+class Telemetry():
+    """
+    Collects the phase times and the incumbent/bound timeline of the current
+    solve. flush turns them into a record, writes it to path (JSONL) if one
+    is set and starts the next record.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.phases = {}
+        self.active = set()
+        self.timeline = []
+        self.last_bound = None
+
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Adds the time spent in the block to the phase. A phase that is
+        already running (e.g. an overridden method calling its parent) is
+        only counted once.
+        """
+        if name in self.active:
+            yield
+            return
+        self.active.add(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + time.perf_counter() - start
+            self.active.discard(name)
+
+
+    def callback(self, model, where):
+        """
+        Gurobi callback that records every new incumbent and every change of
+        the best bound with the runtime and node count.
+        """
+        if where == GRB.Callback.MIPSOL:
+            event = {
+                'event': 'incumbent',
+                'time': model.cbGet(GRB.Callback.RUNTIME),
+                'obj': model.cbGet(GRB.Callback.MIPSOL_OBJ),
+                'bound': model.cbGet(GRB.Callback.MIPSOL_OBJBND),
+                'nodes': model.cbGet(GRB.Callback.MIPSOL_NODCNT),
+            }
+        elif where == GRB.Callback.MIP:
+            bound = model.cbGet(GRB.Callback.MIP_OBJBND)
+            if bound == self.last_bound:
+                return
+            self.last_bound = bound
+            event = {
+                'event': 'bound',
+                'time': model.cbGet(GRB.Callback.RUNTIME),
+                'obj': model.cbGet(GRB.Callback.MIP_OBJBST),
+                'bound': bound,
+                'nodes': model.cbGet(GRB.Callback.MIP_NODCNT),
+            }
+        else:
+            return
+
+        for key in ('obj', 'bound'):
+            if abs(event[key]) >= GRB.INFINITY:
+                event[key] = None
+        event['gap'] = _gap(event['obj'], event['bound'])
+        self.timeline.append(event)
+
+
+    @staticmethod
+    def model_stats(model):
+        model.update()
+        return {
+            'vars': model.NumVars,
+            'binary_vars': model.NumBinVars,
+            'integer_vars': model.NumIntVars,
+            'constrs': model.NumConstrs,
+            'nonzeros': model.NumNZs,
+        }
+
+
+    def flush(self, model, **tags):
+        """
+        Returns the record of the solve of the Gurobi model since the last
+        flush, tagged with the keyword arguments, and appends it to the JSONL
+        file.
+        """
+        has_solution = (_attr(model, 'SolCount') or 0) > 0
+        record = {
+            'timestamp': time.time(),
+            **tags,
+            'phases': dict(self.phases),
+            'model': self.model_stats(model),
+            'status': _attr(model, 'Status'),
+            'runtime': _attr(model, 'Runtime'),
+            'obj': _attr(model, 'ObjVal') if has_solution else None,
+            'bound': _attr(model, 'ObjBound'),
+            'gap': _attr(model, 'MIPGap') if has_solution else None,
+            'nodes': _attr(model, 'NodeCount'),
+            'timeline': self.timeline,
+        }
+        if self.path is not None:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record, default=str) + '\n')
+
+        self.phases = {}
+        self.timeline = []
+        self.last_bound = None
+        return record
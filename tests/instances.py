@@ -0,0 +1,46 @@
+"""
+Small hand-made instances in the data dictionary format of MILPModel.
+"""
+
+
+def make_data(vertices, arcs, Q=100, T_bar=480, D_bar=1000):
+    """
+    Returns the data dictionary for {vertex: (N_i, S_i)} and
+    {(i, j): (distance, time)}.
+    """
+    data = {
+        'vertices': {v: {'N_i': n, 'S_i': s} for v, (n, s) in vertices.items()},
+        'arcs': {arc: {'distance': d, 'time': t} for arc, (d, t) in arcs.items()},
+        'other': {'Q': Q, 'T_bar': T_bar, 'D_bar': D_bar},
+    }
+    data['vertices_prime'] = {v: dict(values) for v, values in data['vertices'].items() if v != 0}
+    return data
+
+
+def line_instance(n_customers=4, S_i=5, T_bar=43):
+    """
+    Customers 1 apart on a line, all 10 from the depot, with time equal to
+    distance. With the defaults the only feasible solution is the single
+    route 0 -> 1 -> ... -> 4 -> 0 (distance 23, time 23 + 4 * 5 = 43).
+    """
+    vertices = {0: (0, 0), **{v: (1, S_i) for v in range(1, n_customers + 1)}}
+    arcs = {}
+    for i in vertices:
+        for j in vertices:
+            if i != j:
+                d = 10 if 0 in (i, j) else abs(i - j)
+                arcs[i, j] = (d, d)
+    return make_data(vertices, arcs, T_bar=T_bar)
+
+
+def directed_instance():
+    """
+    Two customers that can only be served together in the direction
+    0 -> 1 -> 2 -> 0 (distance 30, time 12 + 2 * 10 = 32 = T_bar).
+    """
+    vertices = {0: (0, 0), 1: (1, 10), 2: (1, 10)}
+    arcs = {
+        (0, 1): (10, 10), (1, 2): (10, 1), (2, 0): (10, 1),
+        (0, 2): (10, 30), (2, 1): (10, 30), (1, 0): (10, 30),
+    }
+    return make_data(vertices, arcs, T_bar=32)
@@ -0,0 +1,14 @@
+from alns import ALNS
+from instances import line_instance
+
+
+def test_relocate_empties_single_customer_routes():
+    # Only the single route 0 -> 1 -> 2 -> 3 -> 4 -> 0 fits within T_bar
+    alns = ALNS(line_instance(), time_limit=1)
+    position = {v: p for p, v in enumerate(alns.order)}
+    routes = [[position[v] for v in (1, 2, 3)], [position[4]]]
+    assert alns.removal_savings(routes[1])[0] == 20
+
+    routes = alns.relocate(routes)
+    assert len(routes) == 1
+    assert alns.cost(routes) == 23
@@ -0,0 +1,29 @@
+import pytest
+
+from main import MILPModel
+from branch_and_cut import BranchAndCutModel
+from instances import line_instance, directed_instance
+
+
+def solve(model_class, data):
+    model = model_class(params={'OutputFlag': 0})
+    model.data_setup(data)
+    model.setup_contraints()
+    model.optimize_model()
+    return model.status, (model.model.ObjVal if model.status == 1 else None)
+
+
+@pytest.mark.parametrize('make_instance', [line_instance, directed_instance])
+def test_matches_flow_model_with_large_service_times(make_instance, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    expected = solve(MILPModel, make_instance())
+    assert expected[0] == 1
+    assert solve(BranchAndCutModel, make_instance()) == expected
+
+
+def test_customer_without_incoming_arcs_is_screened(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data = line_instance()
+    for i in range(5):
+        data['arcs'].pop((i, 2), None)
+    assert solve(BranchAndCutModel, data) == (2, None)
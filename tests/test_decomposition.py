@@ -0,0 +1,34 @@
+from collections import Counter
+
+import pytest
+
+from decomposition import Decomposition
+from instance_generator import generate_data
+
+
+def test_repair_rounds_visit_every_customer_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data = generate_data(24, seed=3)
+    decomposition = Decomposition(data, cluster_size=4, repair_rounds=5, workers=1, seed=3,
+                                  params={'OutputFlag': 0, 'TimeLimit': 2, 'Threads': 1})
+    obj, k, VMT, VTT, routes = decomposition.solve()
+
+    visits = Counter(v for route in routes.values() for v in route[1:-1])
+    assert decomposition.status == 1
+    assert visits == Counter(list(data['vertices_prime']))
+
+
+def test_infeasible_cluster_is_reported_infeasible(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data = generate_data(8, seed=0)
+    data['vertices'][1]['N_i'] = data['vertices_prime'][1]['N_i'] = data['other']['Q'] + 1
+    decomposition = Decomposition(data, n_clusters=2, workers=1, params={'OutputFlag': 0})
+    assert decomposition.solve() is None
+    assert decomposition.status == 2
+
+
+def test_check_coverage_raises_on_duplicate_visits():
+    data = generate_data(4, seed=0)
+    decomposition = Decomposition(data, workers=1)
+    with pytest.raises(RuntimeError):
+        decomposition.check_coverage([[0, 1, 2, 0], [0, 2, 3, 4, 0]])
@@ -0,0 +1,25 @@
+import pytest
+
+from result_store import ResultStore, read_columns
+
+
+OLD_STORE = "Q,obj_val,VMT,VTT,k,routes\n80,878.0,878,2407,6,\n90,,,,,\n"
+
+
+def test_old_store_is_migrated(tmp_path):
+    filepath = tmp_path / "Q_sens.csv"
+    filepath.write_text(OLD_STORE)
+
+    store = ResultStore(str(filepath), ['Q'])
+    assert store.completed() == {(80.0,), (90.0,)}
+    assert read_columns(str(filepath), ['Q', 'obj_val', 'status']) == {
+        'Q': [80, 90], 'obj_val': [878, None], 'status': ['optimal', 'infeasible']}
+
+
+def test_other_store_is_not_overwritten(tmp_path):
+    filepath = tmp_path / "Q_sens.csv"
+    filepath.write_text(OLD_STORE)
+
+    with pytest.raises(ValueError, match="Q_sens.csv"):
+        ResultStore(str(filepath), ['T_bar'])
+    assert filepath.read_text() == OLD_STORE
@@ -0,0 +1,30 @@
+from main import MILPModel
+from solve_cache import SolveCache
+from instances import line_instance
+
+
+def build(solve_cache):
+    model = MILPModel(params={'OutputFlag': 0}, solve_cache=solve_cache)
+    model.data_setup(line_instance())
+    model.setup_contraints()
+    return model
+
+
+def test_cache_hit_skips_the_build(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    solve_cache = SolveCache(str(tmp_path / 'cache'))
+    first = build(solve_cache)
+    first.optimize_model()
+    assert first.model.NumVars > 0
+
+    second = build(solve_cache)
+    second.model.update()
+    assert second.model.NumVars == 0
+    second.optimize_model()
+    assert second.status == 1 and second.cached_result.obj == first.model.ObjVal
+
+    # A parameter change builds the model after all
+    second.set_parameter('T_bar', 100)
+    assert second.model.NumVars == first.model.NumVars
+    second.optimize_model()
+    assert second.status == 1
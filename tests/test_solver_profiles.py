@@ -0,0 +1,25 @@
+from main import MILPModel
+from branch_and_cut import BranchAndCutModel
+from solver_profiles import write_profiles, size_class
+from instances import line_instance
+
+
+def test_profile_applies_to_its_mode_only(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data = line_instance()
+    write_profiles({size_class(data): {'params': {'MIPFocus': 2}}}, 'MILPModel')
+
+    model = MILPModel(params={'OutputFlag': 0})
+    model.data_setup(line_instance())
+    assert model.profile_params == {'MIPFocus': 2}
+    assert model.model.Params.MIPFocus == 2
+    assert model.solve_params() == {'MIPFocus': 2, 'OutputFlag': 0}
+
+    explicit = MILPModel(params={'OutputFlag': 0, 'MIPFocus': 1})
+    explicit.data_setup(line_instance())
+    assert explicit.model.Params.MIPFocus == 1
+
+    cuts = BranchAndCutModel(params={'OutputFlag': 0})
+    cuts.data_setup(line_instance())
+    assert cuts.profile_params == {}
+    assert cuts.model.Params.MIPFocus == 0
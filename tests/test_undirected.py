@@ -0,0 +1,21 @@
+import pytest
+
+from main import MILPModel
+from undirected import UndirectedModel
+from instances import line_instance
+
+
+def solve(model_class, data):
+    model = model_class(params={'OutputFlag': 0})
+    model.data_setup(data)
+    model.setup_contraints()
+    model.optimize_model()
+    return model.status, (model.model.ObjVal if model.status == 1 else None)
+
+
+@pytest.mark.parametrize('n_customers, S_i, T_bar', [(4, 5, 43), (6, 8, 70), (6, 20, 120)])
+def test_matches_flow_model_with_large_service_times(n_customers, S_i, T_bar, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    expected = solve(MILPModel, line_instance(n_customers, S_i, T_bar))
+    assert expected[0] == 1
+    assert solve(UndirectedModel, line_instance(n_customers, S_i, T_bar)) == expected
@@ -0,0 +1,196 @@
+"""
+Tuning File
+
+Tunes the Gurobi parameters of MILPModel over a set of representative
+instances and stores the winner per size class under the 'MILPModel' mode
+(see solver_profiles.py), so MILPModel picks it up automatically. Two methods:
+
+- 'search': successive halving over random parameter sets from SEARCH_SPACE
+  (and the defaults). Every round solves the remaining candidates on all
+  instances of the class with twice the time limit of the previous round and
+  keeps the faster half.
+- 'gurobi': Gurobi's own tuner on the largest instance of the class.
+
+Candidates are scored by the mean runtime with unsolved instances counted
+as twice the time limit (PAR2). Only parameters that change how the solve
+runs are tuned; MIPGap and TimeLimit change the answer and Threads depends
+on the machine, so they stay with the caller.
+"""
+
+import argparse
+import math
+import os
+import random
+import tempfile
+from collections import defaultdict
+
+from main import MILPModel
+from instance_cache import load_instance
+from solver_profiles import PROFILE_PATH, size_class, write_profiles
+
+
+SEARCH_SPACE = {
+    'MIPFocus': [0, 1, 2, 3],
+    'Cuts': [-1, 0, 1, 2, 3],
+    'Heuristics': [0.0, 0.05, 0.1, 0.2, 0.5],
+    'Presolve': [-1, 0, 1, 2],
+    'Symmetry': [-1, 0, 1, 2],
+    'VarBranch': [-1, 0, 1, 2, 3],
+}
+
+
+def run_instance(file_path, params, time_limit):
+    """
+    Builds and solves the instance with the parameters and returns the PAR2
+    runtime: the Gurobi runtime if it was solved to optimality (or proven
+    infeasible), twice the time limit otherwise.
+    """
+    model = MILPModel(params={**params, 'TimeLimit': time_limit, 'OutputFlag': 0}, profile=False)
+    model.model_setup(file_path)
+    model.setup_contraints()
+    model.optimize_model()
+    if model.status in (1, 2):
+        return model.model.Runtime
+    return 2 * time_limit
+
+
+def score(instances, params, time_limit):
+    return sum(run_instance(path, params, time_limit) for path in instances) / len(instances)
+
+
+def random_candidates(n_candidates, seed=0):
+    """
+    Returns the default parameters and n_candidates - 1 distinct random
+    parameter sets from SEARCH_SPACE.
+    """
+    rng = random.Random(seed)
+    candidates = [{}]
+    seen = {()}
+    for _ in range(100 * n_candidates):
+        if len(candidates) >= n_candidates:
+            break
+        params = {name: rng.choice(values) for name, values in SEARCH_SPACE.items()
+                  if rng.random() < 0.5}
+        key = tuple(sorted(params.items()))
+        if key not in seen:
+            seen.add(key)
+            candidates.append(params)
+    return candidates
+
+
+def successive_halving(instances, n_candidates=16, time_limit=10, seed=0):
+    """
+    Returns the best parameter set found by successive halving. The last
+    round runs with time_limit.
+    """
+    candidates = random_candidates(n_candidates, seed)
+    rounds = max(1, math.ceil(math.log2(len(candidates))))
+    for r in range(rounds):
+        limit = time_limit / 2 ** (rounds - 1 - r)
+        scores = [score(instances, params, limit) for params in candidates]
+        ranked = sorted(range(len(candidates)), key=lambda c: scores[c])
+        print(f"Round {r + 1}/{rounds} ({limit:.2f} s): best {scores[ranked[0]]:.3f} s with "
+              f"{candidates[ranked[0]]}")
+        candidates = [candidates[c] for c in ranked[:max(1, len(candidates) // 2)]]
+    return candidates[0]
+
+
+def read_prm(path):
+    """
+    Returns the parameters in a Gurobi .prm file.
+    """
+    params = {}
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 2 and not line.startswith('#'):
+                name, value = parts
+                number = float(value)
+                params[name] = int(number) if number.is_integer() else number
+    return params
+
+
+def gurobi_tune(instances, time_limit=10):
+    """
+    Runs the Gurobi tuner on the largest instance and returns its best
+    parameter set (empty if it found nothing better than the defaults).
+    """
+    path = max(instances, key=lambda p: len(load_instance(p)['arcs']))
+    model = MILPModel(params={'TimeLimit': time_limit, 'OutputFlag': 0}, profile=False)
+    model.model_setup(path)
+    model.setup_contraints()
+    model.model.Params.TuneTimeLimit = 10 * time_limit
+    model.model.Params.TuneOutput = 1
+    model.model.tune()
+    if model.model.TuneResultCount == 0:
+        return {}
+
+    model.model.getTuneResult(0)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        prm_path = os.path.join(tmp_dir, 'tuned.prm')
+        model.model.write(prm_path)
+        tuned = read_prm(prm_path)
+    return {name: value for name, value in tuned.items() if name not in ('TimeLimit', 'OutputFlag')}
+
+
+def tune(instances, method='search', n_candidates=16, time_limit=10, seed=0, path=PROFILE_PATH):
+    """
+    Tunes every size class of the instances, measures the tuned parameters
+    against the defaults and stores the profiles at path. Returns the
+    profiles {size class: {'params', 'default_time', 'tuned_time',
+    'speedup', 'instances'}}.
+    """
+    if method not in ('search', 'gurobi'):
+        raise ValueError(f"Unknown tuning method: {method}")
+    classes = defaultdict(list)
+    for instance in instances:
+        classes[size_class(load_instance(instance))].append(instance)
+
+    profiles = {}
+    for name, members in sorted(classes.items()):
+        print(f"Tuning size class {name} on {len(members)} instances")
+        if method == 'search':
+            params = successive_halving(members, n_candidates, time_limit, seed)
+        else:
+            params = gurobi_tune(members, time_limit)
+
+        default_time = score(members, {}, time_limit)
+        tuned_time = score(members, params, time_limit) if params else default_time
+        if tuned_time > default_time:
+            params, tuned_time = {}, default_time     # Never store a slowdown
+        profiles[name] = {
+            'params': params,
+            'default_time': default_time,
+            'tuned_time': tuned_time,
+            'speedup': default_time / tuned_time if tuned_time > 0 else 1.0,
+            'instances': [os.path.basename(member) for member in members],
+            'time_limit': time_limit,
+        }
+
+    write_profiles(profiles, 'MILPModel', path)
+    return profiles
+
+
+def speedup_report(profiles):
+    """
+    Returns the speedup of every profile over the Gurobi defaults as text.
+    """
+    lines = [f"{'class':<10} {'default (s)':>12} {'tuned (s)':>10} {'speedup':>8}  parameters"]
+    for name, profile in sorted(profiles.items()):
+        lines.append(f"{name:<10} {profile['default_time']:>12.3f} {profile['tuned_time']:>10.3f} "
+                     f"{profile['speedup']:>7.2f}x  {profile['params'] or 'defaults'}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tune the Gurobi parameters per instance size class")
+    parser.add_argument("instances", nargs='+')
+    parser.add_argument("--method", choices=('search', 'gurobi'), default='search')
+    parser.add_argument("--candidates", type=int, default=16)
+    parser.add_argument("--time-limit", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=PROFILE_PATH)
+    args = parser.parse_args()
+
+    profiles = tune(args.instances, args.method, args.candidates, args.time_limit, args.seed, args.output)
+    print(speedup_report(profiles))
@@ -0,0 +1,202 @@
+"""
+Undirected File
+
+Two-index undirected formulation for symmetric instances (D_ij = D_ji and
+T_ij = T_ji for every arc, see preprocessing.is_symmetric). A route then
+has the same load, time and distance in both directions, so one variable
+per edge {i, j} is enough instead of one per arc: half the binaries, and the
+mirror image of every solution is gone. An edge between customers is used
+at most once, an edge to the depot up to twice (the route 0 -> j -> 0).
+
+Like the branch-and-cut engine it is based on, the limits are enforced with
+lazy cuts: rounded cuts x(delta(S)) >= 2 r(S) and infeasible path cuts. The
+directed routes are recovered from the edge solution (routes.decode_edges).
+"""
+
+from gurobipy import GRB, quicksum
+
+from branch_and_cut import BranchAndCutModel
+from constraints import fleet_lower_bound
+from routes import SolveResult, decode_edges, route_summary
+from telemetry import timed_phase
+
+
+def edge(i, j):
+    return (i, j) if i < j else (j, i)
+
+
+class UndirectedModel(BranchAndCutModel):
+    """
+    BranchAndCutModel on the edges of a symmetric instance. data_setup
+    raises a ValueError for an asymmetric one; self.variables['x'] is keyed
+    by edge (i, j) with i < j.
+    """
+    def add_variables(self):
+        """
+        Creates the edge variables and k and sets the objective.
+        """
+        if not self.data['symmetric']:
+            raise ValueError("The undirected formulation needs symmetric distances and times")
+
+        arcs = self.data['arcs']
+        edges = sorted({edge(i, j) for (i, j) in arcs})
+        self.variables = {
+            'x': {
+                (i, j): self.model.addVar(vtype=GRB.INTEGER if i == 0 else GRB.BINARY, lb=0,
+                                          ub=2 if i == 0 else 1, name=f"x_{i}_{j}")
+                for (i, j) in edges
+            },
+            'k': self.model.addVar(vtype=GRB.INTEGER, lb=0, name="k"),
+        }
+        self.model.update()
+
+        # Objective: Minimize total distance traveled
+        self.model.setObjective(
+            quicksum(arcs[e]['distance'] * self.variables['x'][e] for e in edges),
+            GRB.MINIMIZE
+        )
+
+
+    @timed_phase
+    def setup_contraints(self):
+        """
+        Adds the degree constraints and registers the separation callback.
+        """
+        if self.deferred:
+            return
+
+        x = self.variables['x']
+        k = self.variables['k']
+        incident = {v: [] for v in self.data['vertices']}
+        for (i, j) in x:
+            incident[i].append(x[i, j])
+            incident[j].append(x[i, j])
+        self.constraints = {'degree': {}}
+
+        # Every customer is entered and left once
+        for i in self.data['vertices_prime']:
+            self.constraints['degree'][i] = self.model.addConstr(
+                quicksum(incident[i]) == 2, name=f"degree_{i}"
+            )
+
+        # Every vehicle leaves and returns to the depot
+        self.constraints['depot_degree'] = self.model.addConstr(
+            quicksum(incident[0]) == 2 * k, name="depot_degree"
+        )
+
+        k.LB = fleet_lower_bound(self.data)
+
+        self.model.Params.LazyConstraints = 1
+        if self.user_cuts:
+            self.model.Params.PreCrush = 1
+        self.callbacks.append(self.separate)
+
+
+    def rounded_cut(self, customers):
+        """
+        Returns (expression, rhs) of the rounded cut for a set of customers S:
+        at least 2 r(S) edge ends leave S (see vehicles_needed).
+        """
+        x = self.variables['x']
+        expression = quicksum(
+            value for (i, j), value in x.items() if (i in customers) != (j in customers)
+        )
+        return expression, 2 * self.vehicles_needed(customers)
+
+
+    def path_cut(self, prefix):
+        """
+        Returns the infeasible path cut for the directed prefix 0 -> v1 ->
+        ... -> vp of a route: x_0v1 + 2 x(customer edges) <= 2 (p - 1). The
+        depot edge counts once, so 0 -> v1 -> 0 stays feasible.
+        """
+        x = self.variables['x']
+        return (x[edge(*prefix[0])] + 2 * quicksum(x[edge(i, j)] for (i, j) in prefix[1:])
+                <= 2 * (len(prefix) - 1))
+
+
+    def separate(self, model, where):
+        """
+        Callback that adds the violated cuts.
+        """
+        x = self.variables['x']
+
+        if where == GRB.Callback.MIPSOL:
+            values = model.cbGetSolution(list(x.values()))
+            routes, cycles = decode_edges({e: round(value) for e, value in zip(x, values)
+                                           if value > 0.5})
+
+            for cycle in cycles:
+                expression, rhs = self.rounded_cut(set(cycle))
+                model.cbLazy(expression >= rhs)
+
+            for route in routes:
+                expression, rhs = self.rounded_cut(set(route[1:-1]))
+                if rhs > 2:
+                    model.cbLazy(expression >= rhs)
+                    continue
+                prefix = self.infeasible_prefix(route)
+                if prefix is not None:
+                    model.cbLazy(self.path_cut(prefix))
+
+        elif (where == GRB.Callback.MIPNODE and self.user_cuts
+              and model.cbGet(GRB.Callback.MIPNODE_STATUS) == GRB.OPTIMAL):
+            values = dict(zip(x, model.cbGetNodeRel(list(x.values()))))
+
+            # Connected components of the customers in the support graph
+            component = {i: i for i in self.data['vertices_prime']}
+
+            def find(i):
+                while component[i] != i:
+                    component[i] = component[component[i]]
+                    i = component[i]
+                return i
+
+            for (i, j), value in values.items():
+                if i != 0 and value > 1e-6:
+                    component[find(i)] = find(j)
+
+            groups = {}
+            for i in component:
+                groups.setdefault(find(i), set()).add(i)
+
+            for customers in groups.values():
+                crossing = sum(
+                    value for (i, j), value in values.items() if (i in customers) != (j in customers)
+                )
+                expression, rhs = self.rounded_cut(customers)
+                if crossing < rhs - 1e-4:
+                    model.cbCut(expression >= rhs)
+
+
+    def set_mip_start(self, routes):
+        """
+        Sets the Start attributes of the edges and k from a route set in the
+        analyze_results format.
+        """
+        start = dict.fromkeys(self.variables['x'], 0)
+        for route in routes.values():
+            for i, j in zip(route[:-1], route[1:]):
+                start[edge(i, j)] += 1
+        self.model.setAttr('Start', list(self.variables['x'].values()), list(start.values()))
+        self.variables['k'].Start = len(routes)
+
+
+    def extract_results(self, attr='X', obj_attr='ObjVal', data=None):
+        """
+        Reads the edge solution and recovers the directed routes. Returns a
+        SolveResult (see routes.py).
+        """
+        data = self.data if data is None else data
+        values = self.model.getAttr(attr, list(self.variables['x'].values()) + [self.variables['k']])
+        routes, cycles = decode_edges({e: round(value) for e, value in zip(self.variables['x'], values)
+                                       if value > 0.5})
+        if cycles:
+            print(f"Warning: the solution contains subtours {cycles}")
+        routes = {route_id: route for route_id, route in enumerate(routes, start=1)}
+        route_stats = {route_id: route_summary(data, route) for route_id, route in routes.items()}
+
+        VMT = sum(stats['distance'] for stats in route_stats.values())
+        VTT = sum(stats['time'] for stats in route_stats.values())
+        return SolveResult(getattr(self.model, obj_attr), int(round(values[-1])), VMT, VTT,
+                           routes, route_stats)